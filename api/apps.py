@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from .stations import DEFAULT_CSV_PATH, DEFAULT_STORE_PATH
+        from .utils import station_data
+
+        config = getattr(settings, "STATION_DATA", {})
+        station_data.configure(
+            config.get("STORE_PATH", DEFAULT_STORE_PATH),
+            config.get("CSV_PATH", DEFAULT_CSV_PATH),
+        )
+        if config.get("WATCH_INTERVAL"):
+            station_data.watch(config["WATCH_INTERVAL"])
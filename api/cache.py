@@ -0,0 +1,351 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import shapely
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from shapely.geometry import LineString
+
+from .metrics import REGISTRY, Counter
+from .stations import stations_reloaded
+
+DEFAULT_ROUTE_CACHE = {
+    "BACKEND": "api.cache.LocMemRouteCache",
+    "PRECISION": 5,
+    "TIMEOUT": 60 * 60 * 24,
+    "MAX_ENTRIES": 1000,
+    "OPTIONS": {},
+}
+
+DEFAULT_CORRIDOR_CACHE = {
+    "MAX_ENTRIES": 1000,
+}
+
+
+class BaseRouteCache:
+    """
+    Base class for route caches, stores `(LineString, route)` pairs keyed by rounded route coordinates.
+
+    Subclasses implement `_get` and `_set`, hit and miss counting is done here.
+    """
+
+    def __init__(self, precision=5, timeout=60 * 60 * 24, max_entries=1000, **options):
+        self.precision = precision
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def make_key(self, coords, profile="driving-car"):
+        """
+        Builds the cache key for a route, coordinates are rounded to `precision` decimal places
+        so requests a few meters apart share an entry.
+        """
+        points = ";".join(
+            f"{round(lng, self.precision)},{round(lat, self.precision)}"
+            for lng, lat in coords
+        )
+        return f"route:{profile}:{points}"
+
+    def get(self, key):
+        """
+        Returns the cached `(LineString, route)` pair for `key`, or None on a miss.
+        """
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    @staticmethod
+    def _dumps(value):
+        # the decoded coordinates are stored so a hit never has to decode the polyline again
+        line, route = value
+        return json.dumps({"coordinates": line.coords[:], "route": route})
+
+    @staticmethod
+    def _loads(data):
+        value = json.loads(data)
+        return LineString(value["coordinates"]), value["route"]
+
+
+class LocMemRouteCache(BaseRouteCache):
+    """
+    In-process LRU cache, entries are kept as live objects and evicted least recently used first.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        expires = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DatabaseRouteCache(BaseRouteCache):
+    """
+    Persistent cache stored in the `CachedRoute` table of the default database, shared by all workers.
+    """
+
+    def make_key(self, coords, profile="driving-car"):
+        # hashed so routes with many coordinates still fit the indexed key column
+        key = super().make_key(coords, profile)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _get(self, key):
+        from .models import CachedRoute
+
+        entry = CachedRoute.objects.filter(key=key).first()
+        if entry is None:
+            return None
+        now = timezone.now()
+        if entry.expires is not None and entry.expires <= now:
+            entry.delete()
+            return None
+        CachedRoute.objects.filter(pk=entry.pk).update(accessed=now)
+        return self._loads(entry.value)
+
+    def _set(self, key, value):
+        from .models import CachedRoute
+
+        now = timezone.now()
+        expires = (
+            None if self.timeout is None else now + timedelta(seconds=self.timeout)
+        )
+        CachedRoute.objects.update_or_create(
+            key=key,
+            defaults={"value": self._dumps(value), "expires": expires, "accessed": now},
+        )
+
+        # evict expired entries, then the least recently used ones above the size bound
+        CachedRoute.objects.filter(expires__lte=now).delete()
+        stale = CachedRoute.objects.order_by("-accessed").values_list("pk", flat=True)[
+            self.max_entries :
+        ]
+        CachedRoute.objects.filter(pk__in=list(stale)).delete()
+
+    def clear(self):
+        from .models import CachedRoute
+
+        CachedRoute.objects.all().delete()
+
+
+class DjangoRouteCache(BaseRouteCache):
+    """
+    Cache stored in one of the Django `CACHES`, selected with the "ALIAS" option.
+
+    Expiry and eviction are handled by the Django cache backend itself.
+
+    Notes:
+        - The alias may hold other entries, e.g. sessions or the `ROUTE_COALESCING` locks. Routes are stored
+          under the cache version kept in `VERSION_KEY`, `clear` moves to the next version rather than
+          clearing the alias, and the previous routes expire on their own.
+    """
+
+    VERSION_KEY = "route_cache:version"
+
+    def __init__(self, alias="default", **kwargs):
+        super().__init__(**kwargs)
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _version(self):
+        return self._cache.get_or_set(self.VERSION_KEY, 1, timeout=None)
+
+    def _get(self, key):
+        data = self._cache.get(key, version=self._version())
+        return None if data is None else self._loads(data)
+
+    def _set(self, key, value):
+        self._cache.set(
+            key, self._dumps(value), timeout=self.timeout, version=self._version()
+        )
+
+    def clear(self):
+        try:
+            self._cache.incr(self.VERSION_KEY)
+        except ValueError:
+            # no route was stored yet
+            self._cache.set(self.VERSION_KEY, 2, timeout=None)
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """
+    Returns the process-wide route cache configured by the `ROUTE_CACHE` setting.
+    """
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                config = {
+                    **DEFAULT_ROUTE_CACHE,
+                    **getattr(settings, "ROUTE_CACHE", {}),
+                }
+                options = {k.lower(): v for k, v in config["OPTIONS"].items()}
+                _route_cache = import_string(config["BACKEND"])(
+                    precision=config["PRECISION"],
+                    timeout=config["TIMEOUT"],
+                    max_entries=config["MAX_ENTRIES"],
+                    **options,
+                )
+    return _route_cache
+
+
+class CorridorCache:
+    """
+    In-process LRU cache of `corridor_stations` results, keyed by route geometry, corridor width and station geometry.
+
+    Entries hold row positions into the station table they were computed on but no prices, the `geometry_key`
+    of the table in the key keeps them valid across price-only reloads and unusable once stations move.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(route_line, max_distance, geometry_key):
+        """
+        Builds the cache key of a corridor from a hash of the decoded route coordinates.
+        """
+        digest = hashlib.blake2b(
+            shapely.get_coordinates(route_line).tobytes(), digest_size=16
+        ).hexdigest()
+        return f"corridor:{digest}:{max_distance}:{geometry_key}"
+
+    def get(self, key):
+        """
+        Returns the cached corridor for `key`, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_corridor_cache = None
+_corridor_cache_lock = threading.Lock()
+
+
+def get_corridor_cache():
+    """
+    Returns the process-wide corridor cache configured by the `CORRIDOR_CACHE` setting.
+    """
+    global _corridor_cache
+    if _corridor_cache is None:
+        with _corridor_cache_lock:
+            if _corridor_cache is None:
+                config = {
+                    **DEFAULT_CORRIDOR_CACHE,
+                    **getattr(settings, "CORRIDOR_CACHE", {}),
+                }
+                _corridor_cache = CorridorCache(max_entries=config["MAX_ENTRIES"])
+    return _corridor_cache
+
+
+@receiver(stations_reloaded)
+def _clear_corridor_cache_on_reload(geometry_changed, **kwargs):
+    # the geometry key already misses, clearing frees the stale entries right away
+    if geometry_changed and _corridor_cache is not None:
+        _corridor_cache.clear()
+
+
+REGISTRY.extend(
+    [
+        Counter(
+            "route_cache_hits_total",
+            "Routes served from the route cache.",
+            lambda: get_route_cache().hits,
+        ),
+        Counter(
+            "route_cache_misses_total",
+            "Routes requested from the routing service.",
+            lambda: get_route_cache().misses,
+        ),
+        Counter(
+            "corridor_cache_hits_total",
+            "Route corridors served from the corridor cache.",
+            lambda: get_corridor_cache().hits,
+        ),
+        Counter(
+            "corridor_cache_misses_total",
+            "Route corridors computed from the station index.",
+            lambda: get_corridor_cache().misses,
+        ),
+    ]
+)
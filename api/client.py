@@ -0,0 +1,190 @@
+import asyncio
+import os
+import random
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()
+token = os.getenv("token")
+
+DEFAULT_ORS_CLIENT = {
+    "BASE_URL": "https://api.openrouteservice.org",
+    "TIMEOUT": 30,
+    "POOL_SIZE": 10,
+    "RETRIES": 3,
+    "BACKOFF_FACTOR": 0.5,
+}
+
+# statuses retried with backoff by the session, Retry-After headers are respected
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(pool_size, retries, backoff_factor):
+    """
+    Builds a `requests` session with a keep-alive connection pool and retry/backoff on 429 and 5xx responses.
+
+    Args:
+        pool_size (int): The number of connections kept open per host.
+        retries (int): The number of retries before giving up on a request.
+        backoff_factor (float): The base of the exponential sleep between retries (in seconds).
+
+    Returns:
+        Session: A session with the pooled, retrying adapter mounted for http and https.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # directions are POST requests
+        raise_on_status=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the process-wide HTTP session for the OpenRouteService API, configured by the `ORS_CLIENT` setting.
+
+    The session is created on first use and shared across requests and threads, so connections to the
+    routing service are kept alive between calls.
+
+    Returns:
+        Session: The pooled, retrying session of `build_session`, sending the API token.
+
+    Notes:
+        - Requires a valid OpenRouteService API token stored in the `token` variable when the public API is used.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                config = {**DEFAULT_ORS_CLIENT, **getattr(settings, "ORS_CLIENT", {})}
+                session = build_session(
+                    config["POOL_SIZE"], config["RETRIES"], config["BACKOFF_FACTOR"]
+                )
+                if token:
+                    session.headers["Authorization"] = token
+                _session = session
+    return _session
+
+
+def reset_session():
+    """
+    Drops the process-wide session, the next `get_session` call builds a new one from the current settings.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def directions(coords, profile="driving-car", **params):
+    """
+    Requests a route from the OpenRouteService directions API over the shared session of `get_session`.
+
+    Args:
+        coords (list of tuples): (longitude, latitude) pairs of the route.
+        profile (str, optional): The routing profile. Defaults to "driving-car".
+        **params: Extra directions parameters, e.g. `radiuses`.
+
+    Returns:
+        dict: The directions response, in the same format as `openrouteservice.directions.directions`.
+
+    Raises:
+        requests.RequestException: If the request fails. A request that still fails after the configured
+                                   retries raises `requests.exceptions.RetryError`.
+    """
+    config = {**DEFAULT_ORS_CLIENT, **getattr(settings, "ORS_CLIENT", {})}
+    body = {"coordinates": [list(c) for c in coords], **params}
+    response = get_session().post(
+        f"{config['BASE_URL']}/v2/directions/{profile}/json",
+        json=body,
+        timeout=config["TIMEOUT"],
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+# one async client per event loop, httpx connections cannot be shared between loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Returns the `httpx.AsyncClient` of the running event loop, configured by the `ORS_CLIENT` setting.
+
+    The client keeps a pool of at most `POOL_SIZE` keep-alive connections to the routing service.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        config = {**DEFAULT_ORS_CLIENT, **getattr(settings, "ORS_CLIENT", {})}
+        client = httpx.AsyncClient(
+            base_url=config["BASE_URL"],
+            timeout=config["TIMEOUT"],
+            limits=httpx.Limits(
+                max_connections=config["POOL_SIZE"],
+                max_keepalive_connections=config["POOL_SIZE"],
+            ),
+            headers={"Authorization": token} if token else {},
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def directions_async(coords, profile="driving-car", **params):
+    """
+    Requests a route from the OpenRouteService directions API without blocking the event loop.
+
+    Args:
+        coords (list of tuples): (longitude, latitude) pairs of the route.
+        profile (str, optional): The routing profile. Defaults to "driving-car".
+        **params: Extra directions parameters, e.g. `radiuses`.
+
+    Returns:
+        dict: The directions response, in the same format as `directions`.
+
+    Raises:
+        httpx.HTTPError: If the request fails, or still answers 429/5xx after the configured retries.
+    """
+    config = {**DEFAULT_ORS_CLIENT, **getattr(settings, "ORS_CLIENT", {})}
+    client = get_async_client()
+    body = {"coordinates": [list(c) for c in coords], **params}
+
+    for attempt in range(config["RETRIES"] + 1):
+        response = await client.post(f"/v2/directions/{profile}/json", json=body)
+        if response.status_code not in RETRY_STATUSES or attempt == config["RETRIES"]:
+            break
+        # same exponential backoff as the sync session, jittered
+        delay = config["BACKOFF_FACTOR"] * (2**attempt)
+        await asyncio.sleep(delay * (random.random() + 0.5))
+
+    response.raise_for_status()
+    return response.json()
+
+
+@receiver(setting_changed)
+def _reset_client_on_setting_changed(setting, **kwargs):
+    if setting == "ORS_CLIENT":
+        reset_session()
+        _async_clients.clear()
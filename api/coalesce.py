@@ -0,0 +1,186 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .metrics import REGISTRY, Counter
+
+DEFAULT_ROUTE_COALESCING = {
+    "ENABLED": True,
+    "CACHE": None,
+    "TIMEOUT": 30,
+    "RESULT_TIMEOUT": 10,
+    "POLL_INTERVAL": 0.05,
+}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one computation per key at a time, concurrent callers with the same key wait for it and share its result.
+
+    Within a process, waiting callers block on the running call. With a Django `cache`, processes also coordinate:
+    the first to `add` the key's lock computes and publishes the result, the others poll for it.
+
+    Args:
+        cache (BaseCache, optional): A cache shared by the worker processes, e.g. Redis or Memcached.
+                                     Defaults to None, coalescing within the process only.
+        timeout (float, optional): How long a lock is held and other processes wait for it (in seconds). Defaults to 30.
+        result_timeout (float, optional): How long a published result stays in the cache (in seconds). Defaults to 10.
+        poll_interval (float, optional): The sleep between polls for a result of another process. Defaults to 0.05.
+
+    Attributes:
+        coalesced (int): Calls that shared the result of a call running in the same process.
+        coalesced_remote (int): Calls that shared the result published by another process.
+
+    Example:
+        >>> flight = SingleFlight()
+        >>> status_code, body = flight.do(key, plan, data)
+
+    Notes:
+        - Results must be picklable for cross-process coordination, and should not raise: an exception is shared
+          with the callers of the same process but not published to other processes, which compute for themselves.
+    """
+
+    def __init__(self, cache=None, timeout=30, result_timeout=10, poll_interval=0.05):
+        self.cache = cache
+        self.timeout = timeout
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hashes JSON serializable parts into a key safe for any cache backend.
+        """
+        return hashlib.sha1(
+            json.dumps(parts, sort_keys=True, default=sorted).encode()
+        ).hexdigest()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._call(key, func, *args)
+            return call.result
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _call(self, key, func, *args):
+        if self.cache is None:
+            return func(*args)
+
+        lock_key, result_key = f"singleflight:lock:{key}", f"singleflight:result:{key}"
+        if self.cache.add(lock_key, 1, self.timeout):
+            try:
+                # a result left from an earlier flight is not handed to this one's waiters
+                self.cache.delete(result_key)
+                result = func(*args)
+                self.cache.set(result_key, result, self.result_timeout)
+                return result
+            finally:
+                self.cache.delete(lock_key)
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            result = self.cache.get(result_key)
+            if result is None and self.cache.get(lock_key) is None:
+                # the other process finished or failed, its result may have landed in between
+                result = self.cache.get(result_key)
+                if result is None:
+                    break
+            if result is not None:
+                with self._lock:
+                    self.coalesced_remote += 1
+                return result
+            time.sleep(self.poll_interval)
+
+        return func(*args)
+
+
+_route_flight = None
+_route_flight_lock = threading.Lock()
+
+
+def get_route_flight():
+    """
+    Returns the process-wide `SingleFlight` of the route endpoint configured by `ROUTE_COALESCING`,
+    or None when coalescing is disabled.
+    """
+    global _route_flight
+    config = {**DEFAULT_ROUTE_COALESCING, **getattr(settings, "ROUTE_COALESCING", {})}
+    if not config["ENABLED"]:
+        return None
+    if _route_flight is None:
+        with _route_flight_lock:
+            if _route_flight is None:
+                _route_flight = SingleFlight(
+                    cache=caches[config["CACHE"]] if config["CACHE"] else None,
+                    timeout=config["TIMEOUT"],
+                    result_timeout=config["RESULT_TIMEOUT"],
+                    poll_interval=config["POLL_INTERVAL"],
+                )
+    return _route_flight
+
+
+@receiver(setting_changed)
+def _reset_flight_on_setting_changed(setting, **kwargs):
+    global _route_flight
+    if setting == "ROUTE_COALESCING":
+        _route_flight = None
+
+
+def _coalesced(attribute):
+    def read():
+        flight = get_route_flight()
+        return 0 if flight is None else getattr(flight, attribute)
+
+    return read
+
+
+REGISTRY.extend(
+    [
+        Counter(
+            "route_requests_coalesced_total",
+            "Route requests that shared the result of an identical request in flight in the same process.",
+            _coalesced("coalesced"),
+        ),
+        Counter(
+            "route_requests_coalesced_remote_total",
+            "Route requests that shared the result of an identical request in flight in another process.",
+            _coalesced("coalesced_remote"),
+        ),
+    ]
+)
@@ -0,0 +1,394 @@
+import heapq
+import json
+import math
+import os
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.strtree import STRtree
+
+DEFAULT_GRAPH_PATH = "./api/data/graph"
+
+# written last by `RoadGraph.save`, like the station store manifest
+GRAPH_MANIFEST = "manifest.json"
+
+# arrays making up a road graph, one .npy file each
+GRAPH_ARRAYS = (
+    "lng",
+    "lat",
+    "indptr",
+    "targets",
+    "length",
+    "duration",
+    "name_codes",
+    "names",
+)
+
+EARTH_RADIUS = 6371000  # Earth's radius in meters
+
+# OpenRouteService step types used in the generated instructions
+STEP_DEPART = 11
+STEP_CONTINUE = 6
+STEP_ARRIVE = 10
+
+
+class NoRouteFound(LookupError):
+    """
+    Raised when a coordinate is too far from the road graph, or the endpoints are not connected.
+    """
+
+
+def haversine(lng1, lat1, lng2, lat2):
+    """
+    Great-circle distance between two points in meters, works on floats and numpy arrays.
+    """
+    lng1, lat1, lng2, lat2 = map(np.radians, (lng1, lat1, lng2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class RoadGraph:
+    """
+    A directed road network in compressed sparse row form, searched with bidirectional A*.
+
+    Attributes:
+        lng, lat (numpy.ndarray): float64 node coordinates.
+        indptr (numpy.ndarray): int64 offsets, the edges leaving node `u` are `indptr[u]:indptr[u + 1]`.
+        targets (numpy.ndarray): int32 target node of each edge.
+        length (numpy.ndarray): float64 edge lengths in meters, at least the great-circle distance of the edge.
+        duration (numpy.ndarray): float64 edge travel times in seconds, the search minimizes them.
+        name_codes (numpy.ndarray): int32 positions into `names`, the road name of each edge.
+        names (numpy.ndarray): The unique road names.
+    """
+
+    def __init__(self, lng, lat, indptr, targets, length, duration, name_codes, names):
+        self.lng = lng
+        self.lat = lat
+        self.indptr = indptr
+        self.targets = targets
+        self.length = length
+        self.duration = duration
+        self.name_codes = name_codes
+        self.names = names
+
+    def __len__(self):
+        return len(self.lng)
+
+    @classmethod
+    def from_edges(cls, lng, lat, source, target, length, duration, names):
+        """
+        Builds a graph from node coordinates and an edge list.
+
+        Args:
+            lng, lat (array-like): Node coordinates, node IDs are their positions.
+            source, target (array-like): The end nodes of each directed edge.
+            length (array-like): Edge lengths in meters.
+            duration (array-like): Edge travel times in seconds.
+            names (array-like): The road name of each edge.
+
+        Returns:
+            RoadGraph: The graph, edges sorted by source node.
+        """
+        source = np.asarray(source, dtype=np.int64)
+        order = np.argsort(source, kind="stable")
+        unique_names, name_codes = np.unique(
+            np.asarray(names, dtype=str), return_inverse=True
+        )
+        return cls(
+            lng=np.asarray(lng, dtype=np.float64),
+            lat=np.asarray(lat, dtype=np.float64),
+            indptr=np.searchsorted(source[order], np.arange(len(lng) + 1)).astype(
+                np.int64
+            ),
+            targets=np.asarray(target, dtype=np.int32)[order],
+            length=np.asarray(length, dtype=np.float64)[order],
+            duration=np.asarray(duration, dtype=np.float64)[order],
+            name_codes=name_codes.astype(np.int32)[order],
+            names=unique_names,
+        )
+
+    @classmethod
+    def from_csv(cls, nodes_path, edges_path):
+        """
+        Reads a road network exported as two CSV files.
+
+        Args:
+            nodes_path (str): Nodes with "lng" and "lat" columns, node IDs are the row positions.
+            edges_path (str): Directed edges with "source", "target", "length" (m), "duration" (s) and "name" columns.
+        """
+        nodes = pd.read_csv(nodes_path)
+        edges = pd.read_csv(edges_path, keep_default_na=False)
+        return cls.from_edges(
+            nodes["lng"],
+            nodes["lat"],
+            edges["source"],
+            edges["target"],
+            edges["length"],
+            edges["duration"],
+            edges["name"],
+        )
+
+    def save(self, path=DEFAULT_GRAPH_PATH):
+        """
+        Writes the graph as a directory with one uncompressed .npy file per array.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in GRAPH_ARRAYS:
+            target = os.path.join(path, f"{name}.npy")
+            with open(f"{target}.tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(f"{target}.tmp", target)
+
+        with open(os.path.join(path, GRAPH_MANIFEST), "w") as f:
+            json.dump(
+                {
+                    "nodes": len(self),
+                    "edges": len(self.targets),
+                    "arrays": GRAPH_ARRAYS,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path=DEFAULT_GRAPH_PATH):
+        """
+        Loads a graph written by `save`, the arrays are memory-mapped read only.
+        """
+        return cls(
+            **{
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in GRAPH_ARRAYS
+            }
+        )
+
+    @cached_property
+    def index(self):
+        return STRtree(shapely.points(self.lng, self.lat))
+
+    @cached_property
+    def max_speed(self):
+        # meters per second, turns the great-circle heuristic into a lower bound on travel time
+        return float(np.max(self.length / np.maximum(self.duration, 1e-9)))
+
+    @cached_property
+    def _forward(self):
+        # python lists, indexing them in the search loop is much faster than indexing numpy arrays
+        return (
+            self.indptr.tolist(),
+            self.targets.tolist(),
+            self.duration.tolist(),
+        )
+
+    @cached_property
+    def _coordinates(self):
+        return self.lng.tolist(), self.lat.tolist()
+
+    @cached_property
+    def _reverse(self):
+        sources = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        order = np.argsort(self.targets, kind="stable")
+        indptr = np.searchsorted(self.targets[order], np.arange(len(self) + 1))
+        return indptr.tolist(), sources[order].tolist(), order.tolist()
+
+    def snap(self, lng, lat, radius=None):
+        """
+        Returns the node nearest to a coordinate.
+
+        Raises:
+            NoRouteFound: If the nearest node is farther than `radius` meters.
+        """
+        node = int(self.index.nearest(shapely.Point(lng, lat)))
+        if (
+            radius is not None
+            and haversine(lng, lat, self.lng[node], self.lat[node]) > radius
+        ):
+            raise NoRouteFound(f"No road within {radius} m of ({lng}, {lat})")
+        return node
+
+    def shortest_path(self, source, target):
+        """
+        Finds the fastest path between two nodes with bidirectional A*.
+
+        Both searches share the averaged potential `(h_target(v) - h_source(v)) / 2`, where `h` is the great-circle
+        distance divided by the fastest edge speed. It is consistent in both directions, so the search stops as soon
+        as the two smallest queue keys add up to the best path found.
+
+        Returns:
+            list of int: The edge IDs along the path, in order.
+
+        Raises:
+            NoRouteFound: If `target` cannot be reached from `source`.
+        """
+        if source == target:
+            return []
+
+        indptr, targets, duration = self._forward
+        rindptr, rsources, redges = self._reverse
+        lng, lat = self._coordinates
+        speed = self.max_speed
+        s_lng, s_lat, t_lng, t_lat = lng[source], lat[source], lng[target], lat[target]
+        potentials = {}
+
+        def potential(v):
+            p = potentials.get(v)
+            if p is None:
+                v_lng, v_lat = lng[v], lat[v]
+                p = potentials[v] = (
+                    _haversine(v_lng, v_lat, t_lng, t_lat)
+                    - _haversine(v_lng, v_lat, s_lng, s_lat)
+                ) / (2 * speed)
+            return p
+
+        dist_f, dist_r = {source: 0.0}, {target: 0.0}
+        edge_f, edge_r = {source: -1}, {target: -1}
+        heap_f = [(potential(source), source)]
+        heap_r = [(-potential(target), target)]
+        best, meet = math.inf, None
+
+        while heap_f and heap_r:
+            if heap_f[0][0] + heap_r[0][0] >= best:
+                break
+
+            if heap_f[0][0] <= heap_r[0][0]:
+                key, u = heapq.heappop(heap_f)
+                d = dist_f[u]
+                if key > d + potential(u):
+                    continue
+                for e in range(indptr[u], indptr[u + 1]):
+                    v = targets[e]
+                    nd = d + duration[e]
+                    if nd < dist_f.get(v, math.inf):
+                        dist_f[v] = nd
+                        edge_f[v] = e
+                        heapq.heappush(heap_f, (nd + potential(v), v))
+                        if v in dist_r and nd + dist_r[v] < best:
+                            best, meet = nd + dist_r[v], v
+            else:
+                key, u = heapq.heappop(heap_r)
+                d = dist_r[u]
+                if key > d - potential(u):
+                    continue
+                for i in range(rindptr[u], rindptr[u + 1]):
+                    v = rsources[i]
+                    e = redges[i]
+                    nd = d + duration[e]
+                    if nd < dist_r.get(v, math.inf):
+                        dist_r[v] = nd
+                        edge_r[v] = e
+                        heapq.heappush(heap_r, (nd - potential(v), v))
+                        if v in dist_f and nd + dist_f[v] < best:
+                            best, meet = nd + dist_f[v], v
+
+        if meet is None:
+            raise NoRouteFound(f"Node {target} is not reachable from node {source}")
+
+        # walk back from the meeting node to both ends
+        edges = []
+        v = meet
+        while edge_f[v] != -1:
+            e = edge_f[v]
+            edges.append(e)
+            v = self._source_of(e)
+        edges.reverse()
+        v = meet
+        while edge_r[v] != -1:
+            e = edge_r[v]
+            edges.append(e)
+            v = targets[e]
+        return edges
+
+    def _source_of(self, edge):
+        return int(np.searchsorted(self.indptr, edge, side="right") - 1)
+
+
+def _haversine(lng1, lat1, lng2, lat2):
+    # scalar version of `haversine` for the search loop
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def directions_response(graph, legs):
+    """
+    Builds an OpenRouteService directions response from the edge paths of a route.
+
+    Args:
+        graph (RoadGraph): The graph the paths were found on.
+        legs (list of tuple): One `(source node, edge IDs)` pair per leg, in order.
+
+    Returns:
+        dict: `{"routes": [{"summary", "segments", "geometry"}]}`, one segment per leg with one step per named road.
+    """
+    # imported here, api.utils imports the routing backends
+    from .utils import encode_polyline
+
+    coordinates = []
+    segments = []
+    for source, edges in legs:
+        nodes = [source] + graph.targets[edges].tolist()
+        if coordinates:
+            # legs share their end node with the next start
+            nodes = nodes[1:]
+        offset = len(coordinates) - (1 if coordinates else 0)
+        coordinates.extend(zip(graph.lng[nodes].tolist(), graph.lat[nodes].tolist()))
+
+        steps = []
+        lengths = graph.length[edges].tolist()
+        durations = graph.duration[edges].tolist()
+        names = graph.names[graph.name_codes[edges]].tolist() if edges else []
+        for i, (length, duration, name) in enumerate(zip(lengths, durations, names)):
+            if steps and steps[-1]["name"] == name:
+                step = steps[-1]
+                step["distance"] += length
+                step["duration"] += duration
+                step["way_points"][1] = offset + i + 1
+                continue
+            steps.append(
+                {
+                    "distance": length,
+                    "duration": duration,
+                    "type": STEP_CONTINUE if steps else STEP_DEPART,
+                    "instruction": f"{'Continue' if steps else 'Head'} on {name or '-'}",
+                    "name": name or "-",
+                    "way_points": [offset + i, offset + i + 1],
+                }
+            )
+        end = offset + len(edges)
+        steps.append(
+            {
+                "distance": 0.0,
+                "duration": 0.0,
+                "type": STEP_ARRIVE,
+                "instruction": "Arrive at your destination",
+                "name": "-",
+                "way_points": [end, end],
+            }
+        )
+        segments.append(
+            {
+                "distance": float(sum(lengths)),
+                "duration": float(sum(durations)),
+                "steps": steps,
+            }
+        )
+
+    return {
+        "routes": [
+            {
+                "summary": {
+                    "distance": sum(segment["distance"] for segment in segments),
+                    "duration": sum(segment["duration"] for segment in segments),
+                },
+                "segments": segments,
+                "geometry": encode_polyline(coordinates),
+            }
+        ]
+    }
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from shapely.geometry import LineString
+
+from .exceptions import RouteException
+from .models import PrecomputedLane
+from .pipeline import (
+    dump_corridor,
+    load_corridor,
+    optimize_stops,
+    response_records,
+    route_coordinates,
+    serialize_response,
+)
+from .serializer import RouteOptimizerSerializer
+from .utils import (
+    cached_corridor_stations,
+    decode_polyline_array,
+    get_route,
+    station_data,
+    station_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRECOMPUTED_LANES = {
+    "ENABLED": True,
+    "ROUTE_TIMEOUT": 60 * 60 * 24 * 7,
+    "WORKERS": 8,
+}
+
+# what `precompute_lanes` did with each lane, in the order of the work it takes
+LANE_OUTCOMES = ("routed", "corridor", "optimized", "checked", "current", "failed")
+
+
+def _config():
+    return {**DEFAULT_PRECOMPUTED_LANES, **getattr(settings, "PRECOMPUTED_LANES", {})}
+
+
+def lane_key(data):
+    """
+    Returns the key of the lane of validated `RouteOptimizerSerializer` data: a hash of its stops,
+    optimizer and vehicle.
+    """
+    lane = [
+        [[round(value, 5) for value in point] for point in route_coordinates(data)],
+        data["optimizer"],
+        data["vehicle"].as_dict(),
+    ]
+    return hashlib.sha1(json.dumps(lane, sort_keys=True).encode()).hexdigest()
+
+
+def corridor_prices_key(corridor, stations):
+    """
+    Returns a fingerprint of the current prices of the stations in a corridor.
+    """
+    prices = np.ascontiguousarray(stations.price[corridor["index"]])
+    return hashlib.blake2b(prices.tobytes(), digest_size=16).hexdigest()
+
+
+def read_lanes(path):
+    """
+    Reads a lane list, one route request body per line in JSON Lines format. Blank lines are skipped.
+    """
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def lookup_lane(data):
+    """
+    Returns the precomputed lane of a route request when it is current, otherwise None.
+
+    A lane is current while its route has not expired and `precompute_lanes` last checked it against
+    the station locations and prices of the loaded table. One lookup on the unique lane key.
+
+    Notes:
+        - A failed lookup, e.g. before `manage.py migrate` created the table, is logged and the request
+          goes through the whole pipeline.
+    """
+    if not _config()["ENABLED"]:
+        return None
+    stations = station_data.snapshot()
+    try:
+        return PrecomputedLane.objects.filter(
+            key=lane_key(data),
+            route_expires__gt=timezone.now(),
+            stations_key=stations.geometry_key,
+            prices_key=stations.prices_key,
+        ).first()
+    except DatabaseError:
+        logger.warning("Precomputed lane lookup failed", exc_info=True)
+        return None
+
+
+def serve_lane(lane, options, stream=False):
+    """
+    Builds the response of a precomputed lane, shaped by the response `options` of the request.
+
+    Returns:
+        tuple: The HTTP status code and the response body, or its `response_records` with `stream`.
+    """
+    route, stops = json.loads(lane.route), json.loads(lane.stops)
+    if stream:
+        return status.HTTP_200_OK, response_records(
+            route, stops, lane.total_cost, **options
+        )
+    return serialize_response(route, stops, lane.total_cost, **options)
+
+
+def _fetch_route(lane):
+    coords, profile = lane
+    try:
+        # an expired lane is routed again, not served from the route cache
+        return get_route(coords, profile, refresh=True)
+    finally:
+        connections.close_all()
+
+
+def precompute_lanes(payloads, force=False, max_distance=100000):
+    """
+    Optimizes recurring lanes in bulk and stores them for `lookup_lane`, recomputing only what changed.
+
+    Args:
+        payloads (list): Request bodies in the `RouteOptimizerSerializer` format, one per lane.
+        force (bool, optional): Routes and optimizes every lane again. Defaults to False.
+        max_distance (float, optional): The corridor width in meters. Defaults to 100,000.
+
+    Returns:
+        dict: The number of lanes of each outcome in `LANE_OUTCOMES`, and the "errors" as
+              `(position, details)` pairs for the payloads that failed.
+
+    Notes:
+        - Lanes whose route expired (`PRECOMPUTED_LANES["ROUTE_TIMEOUT"]`) are "routed" again, with at most
+          `PRECOMPUTED_LANES["WORKERS"]` routing requests in flight.
+        - When the stations moved, the stored route gets a new "corridor". All new corridors are found
+          in one `cached_corridor_stations` call.
+        - After a price reload, a lane is "optimized" again only when the prices on its corridor changed,
+          otherwise it is "checked" against the new table without running the optimizer.
+        - A lane that can no longer be optimized is removed, its requests go through the whole pipeline.
+    """
+    config = _config()
+    now = timezone.now()
+    stations = station_data.snapshot()
+    summary = {outcome: 0 for outcome in LANE_OUTCOMES}
+    summary["errors"] = []
+
+    lanes = {}
+    for i, payload in enumerate(payloads):
+        serializer = RouteOptimizerSerializer(data=payload)
+        if not serializer.is_valid():
+            summary["failed"] += 1
+            summary["errors"].append((i, serializer.errors))
+            continue
+        data = serializer.validated_data
+        lanes.setdefault(lane_key(data), (i, payload, data))
+
+    existing = PrecomputedLane.objects.in_bulk(list(lanes), field_name="key")
+
+    # the least work each lane needs
+    outcomes = {}
+    for key in lanes:
+        lane = existing.get(key)
+        if force or lane is None or lane.route_expires <= now:
+            outcomes[key] = "routed"
+        elif lane.stations_key != stations.geometry_key:
+            outcomes[key] = "corridor"
+        elif lane.prices_key != stations.prices_key:
+            outcomes[key] = "checked"
+        else:
+            outcomes[key] = "current"
+
+    # fetch the expired routes concurrently, lanes differing only in optimizer or vehicle share one
+    routes = {}
+    fetch = {}
+    for key, outcome in outcomes.items():
+        if outcome == "routed":
+            data = lanes[key][2]
+            fetch.setdefault(
+                (route_coordinates(data), data["vehicle"].routing_profile), []
+            ).append(key)
+    with ThreadPoolExecutor(max_workers=config["WORKERS"]) as executor:
+        futures = {lane: executor.submit(_fetch_route, lane) for lane in fetch}
+    for lane, future in futures.items():
+        try:
+            result = future.result()
+        except Exception:
+            result = RouteException()
+        for key in fetch[lane]:
+            routes[key] = result
+
+    for key, outcome in outcomes.items():
+        if outcome == "corridor":
+            route = json.loads(existing[key].route)
+            line = LineString(decode_polyline_array(route["routes"][0]["geometry"]))
+            routes[key] = (line, route)
+        elif outcome == "checked":
+            routes[key] = (None, json.loads(existing[key].route))
+
+    # one corridor pass for every new route and moved station table
+    located = [
+        key
+        for key, outcome in outcomes.items()
+        if outcome in ("routed", "corridor")
+        and not isinstance(routes[key], APIException)
+    ]
+    corridors = {}
+    if located:
+        corridors = dict(
+            zip(
+                located,
+                cached_corridor_stations(
+                    [routes[key][0] for key in located], max_distance, stations
+                ),
+            )
+        )
+
+    created, updated, removed = [], [], []
+    for key, outcome in outcomes.items():
+        if outcome == "current":
+            summary["current"] += 1
+            continue
+
+        position, payload, data = lanes[key]
+        lane = existing.get(key)
+        if isinstance(routes[key], APIException):
+            summary["failed"] += 1
+            summary["errors"].append((position, {"detail": str(routes[key].detail)}))
+            continue
+        line, route = routes[key]
+
+        if outcome == "checked":
+            corridor = load_corridor(lane.corridor)
+            prices_key = corridor_prices_key(corridor, stations)
+            if prices_key == lane.corridor_prices_key:
+                # prices changed elsewhere, the stored stops still hold
+                lane.prices_key = stations.prices_key
+                updated.append(lane)
+                summary["checked"] += 1
+                continue
+            outcome = "optimized"
+        else:
+            corridor = corridors[key]
+            prices_key = corridor_prices_key(corridor, stations)
+
+        try:
+            stops, total_cost = optimize_stops(
+                station_rows(corridor, stations),
+                route,
+                data["optimizer"],
+                data["vehicle"],
+            )
+        except APIException as error:
+            summary["failed"] += 1
+            summary["errors"].append((position, {"detail": str(error.detail)}))
+            if lane is not None:
+                removed.append(lane.pk)
+            continue
+
+        if lane is None:
+            lane = PrecomputedLane(key=key)
+            created.append(lane)
+        else:
+            updated.append(lane)
+        lane.request = json.dumps(payload)
+        if outcome == "routed":
+            lane.route = json.dumps(route)
+            lane.route_expires = now + timedelta(seconds=config["ROUTE_TIMEOUT"])
+        lane.stations_key = stations.geometry_key
+        lane.prices_key = stations.prices_key
+        lane.corridor = dump_corridor(corridor)
+        lane.corridor_prices_key = prices_key
+        lane.stops = json.dumps(stops)
+        lane.total_cost = total_cost
+        lane.computed = now
+        summary[outcome] += 1
+
+    PrecomputedLane.objects.bulk_create(created)
+    PrecomputedLane.objects.bulk_update(
+        updated,
+        [
+            "request",
+            "route",
+            "route_expires",
+            "stations_key",
+            "prices_key",
+            "corridor",
+            "corridor_prices_key",
+            "stops",
+            "total_cost",
+            "computed",
+        ],
+        batch_size=500,
+    )
+    PrecomputedLane.objects.filter(pk__in=removed).delete()
+    return summary
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.graph import DEFAULT_GRAPH_PATH, RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Converts a road network exported as node and edge CSVs into the graph loaded by the offline routing backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--nodes", required=True, help="CSV of nodes with lng and lat columns"
+        )
+        parser.add_argument(
+            "--edges",
+            required=True,
+            help="CSV of directed edges with source, target, length, duration and name columns",
+        )
+        parser.add_argument(
+            "--output", default=DEFAULT_GRAPH_PATH, help="Road graph directory"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        graph = RoadGraph.from_csv(options["nodes"], options["edges"])
+        graph.save(options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {len(graph)} nodes and {len(graph.targets)} edges to {options['output']} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
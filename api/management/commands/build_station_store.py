@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.stations import DEFAULT_CSV_PATH, DEFAULT_STORE_PATH, StationTable
+
+
+class Command(BaseCommand):
+    help = "Converts the OPIS truckstop CSV into the memory-mapped station store loaded at startup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--csv", default=DEFAULT_CSV_PATH, help="OPIS CSV to read")
+        parser.add_argument(
+            "--output", default=DEFAULT_STORE_PATH, help="Station store directory"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stations = StationTable.from_csv(options["csv"])
+        stations.save(options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {len(stations)} stations to {options['output']} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
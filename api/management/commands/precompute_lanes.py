@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.lanes import LANE_OUTCOMES, precompute_lanes, read_lanes
+
+
+class Command(BaseCommand):
+    help = (
+        "Optimizes a list of recurring lanes in bulk for the route endpoint to answer from the database. "
+        "Run it again after a price reload or on a schedule, only lanes with an expired route, moved "
+        "stations or new prices on their corridor are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "lanes", help="JSON Lines file, one route request body per lane"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Route and optimize every lane again",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            payloads = read_lanes(options["lanes"])
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Unable to read {options['lanes']}: {error}")
+
+        summary = precompute_lanes(payloads, force=options["force"])
+
+        for position, details in summary["errors"]:
+            self.stderr.write(f"Lane {position + 1}: {details}")
+        counts = ", ".join(f"{summary[outcome]} {outcome}" for outcome in LANE_OUTCOMES)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Precomputed {len(payloads)} lanes in "
+                f"{time.perf_counter() - start:.2f}s: {counts}"
+            )
+        )
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets in seconds, from a cached corridor lookup up to a slow routing call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    A Prometheus style cumulative histogram with one series per label value.
+    """
+
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        """
+        Returns the histogram in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                label = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}'
+                )
+                lines.append(f"{self.name}_sum{{{label}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """
+    A Prometheus style counter whose value is read from a callable at render time.
+    """
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} counter",
+                f"{self.name} {self.read()}",
+            ]
+        )
+
+
+STAGE_SECONDS = Histogram(
+    "route_pipeline_stage_seconds",
+    "Latency of each route pipeline stage in seconds.",
+    label="stage",
+)
+
+# metrics exposed on the metrics endpoint, other modules append their own
+REGISTRY = [STAGE_SECONDS]
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class StageTimer:
+    """
+    Times the stages of one request, every stage is also recorded in `STAGE_SECONDS`.
+
+    Example:
+        >>> timer = StageTimer()
+        >>> with timer.stage("route"):
+        ...     line, route = get_route(coords)
+        >>> timer.server_timing()
+        'route;dur=412.7'
+    """
+
+    def __init__(self, histogram=STAGE_SECONDS):
+        self.histogram = histogram
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = elapsed
+            self.histogram.observe(name, elapsed)
+
+    def server_timing(self):
+        """
+        Returns the stage timings as a `Server-Timing` header value, durations in milliseconds.
+        """
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()
+        )
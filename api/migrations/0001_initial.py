@@ -0,0 +1,30 @@
+# Generated by Django 3.2.23 on 2026-10-17 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedRoute",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("value", models.TextField()),
+                ("expires", models.DateTimeField(db_index=True, null=True)),
+                ("accessed", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
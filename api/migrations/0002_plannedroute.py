@@ -0,0 +1,35 @@
+# Generated by Django 3.2.23 on 2026-10-17 06:08
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlannedRoute",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("optimizer", models.CharField(max_length=16)),
+                ("options", models.TextField()),
+                ("route", models.TextField()),
+                ("stations_key", models.CharField(max_length=32)),
+                ("corridor", models.TextField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("repriced", models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.23 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0002_plannedroute"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plannedroute",
+            name="vehicle",
+            field=models.TextField(default="{}"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.23 on 2026-10-17 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0003_plannedroute_vehicle"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PrecomputedLane",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=40, unique=True)),
+                ("request", models.TextField()),
+                ("route", models.TextField()),
+                ("route_expires", models.DateTimeField(db_index=True)),
+                ("stations_key", models.CharField(max_length=32)),
+                ("prices_key", models.CharField(max_length=32)),
+                ("corridor", models.TextField()),
+                ("corridor_prices_key", models.CharField(max_length=32)),
+                ("stops", models.TextField()),
+                ("total_cost", models.FloatField()),
+                ("computed", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+import uuid
+
+from django.db import models
+
+
+class CachedRoute(models.Model):
+    """
+    A routing service response stored by `api.cache.DatabaseRouteCache`.
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    value = models.TextField()
+    expires = models.DateTimeField(null=True, db_index=True)
+    accessed = models.DateTimeField(db_index=True)
+
+
+class PlannedRoute(models.Model):
+    """
+    An optimized route saved for re-pricing by `api.pipeline.reprice_routes`.
+
+    The corridor is stored without prices, as station table rows with their distance and projected
+    point along the route, so a re-price only joins the current prices onto it.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    optimizer = models.CharField(max_length=16)
+    vehicle = models.TextField(default="{}")
+    options = models.TextField()
+    route = models.TextField()
+    stations_key = models.CharField(max_length=32)
+    corridor = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    repriced = models.DateTimeField(null=True)
+
+
+class PrecomputedLane(models.Model):
+    """
+    A recurring lane optimized in bulk by `manage.py precompute_lanes`, served by `RouteOptimizerView`
+    without routing or optimizing.
+
+    The lane is current while its route has not expired and it was last checked against the prices
+    and station locations of the loaded station table, see `api.lanes.lookup_lane`.
+    """
+
+    key = models.CharField(max_length=40, unique=True)
+    request = models.TextField()
+    route = models.TextField()
+    route_expires = models.DateTimeField(db_index=True)
+    stations_key = models.CharField(max_length=32)
+    prices_key = models.CharField(max_length=32)
+    corridor = models.TextField()
+    corridor_prices_key = models.CharField(max_length=32)
+    stops = models.TextField()
+    total_cost = models.FloatField()
+    computed = models.DateTimeField()
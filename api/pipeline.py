@@ -0,0 +1,697 @@
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import shapely
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from shapely.geometry import LineString
+
+from .exceptions import RouteException, StationException
+from .models import PlannedRoute
+from .serializer import (
+    RESPONSE_PARTS,
+    RouteOptimizerResponseSerializer,
+    RouteOptimizerSerializer,
+)
+from .utils import (
+    DEG_TO_M,
+    OPTIMIZERS,
+    cached_corridor_stations,
+    decode_polyline,
+    decode_polyline_array,
+    encode_polyline,
+    find_stations_on_route,
+    find_stations_on_routes,
+    get_route,
+    route_distances,
+    station_data,
+    station_rows,
+)
+from .vehicles import VehicleProfile
+
+DEFAULT_ROUTE_BATCH = {
+    "MAX_SIZE": 5000,
+    "WORKERS": 8,
+}
+
+DEFAULT_ROUTE_EXECUTOR = {
+    "KIND": "thread",
+    "WORKERS": 4,
+}
+
+# corridor columns stored with a planned route, the rest is rebuilt from the station table
+PLANNED_CORRIDOR_COLUMNS = {
+    "index": np.int64,
+    "distance": np.int64,
+    "lat": np.float64,
+    "lng": np.float64,
+}
+
+
+def optimize_stops(stations, route, optimizer, vehicle=None):
+    """
+    Runs the selected optimizer over the stations on a route.
+
+    Args:
+        stations (list of dict): The stations on the route, see `find_stations_on_route`.
+        route (dict): The routing service response.
+        optimizer (str): The optimizer mode, a key of `OPTIMIZERS`.
+        vehicle (VehicleProfile, optional): The vehicle range, fuel and consumption. Defaults to the "default" profile.
+
+    Raises:
+        StationException: If the optimizer fails or no stations are in range.
+    """
+    if vehicle is None:
+        vehicle = VehicleProfile.from_settings()
+    try:
+        stops, total_cost = OPTIMIZERS[optimizer](
+            stations,
+            route["routes"][0]["summary"]["distance"],
+            **vehicle.optimizer_options(),
+        )
+    except Exception:
+        raise StationException()
+
+    if stops is None:
+        # no stations in range error
+        raise StationException()
+    return stops, total_cost
+
+
+def _step(step):
+    return {
+        "distance": float(step["distance"]),
+        "duration": float(step["duration"]),
+        "type": int(step["type"]),
+        "instruction": step["instruction"],
+        "name": step["name"],
+        "way_points": [int(point) for point in step["way_points"]],
+    }
+
+
+def _stop(stop, leg=None):
+    shaped = {
+        "distance": int(stop["distance"]),
+        "price": float(stop["price"]),
+        "Truckstop_Name": stop["Truckstop_Name"],
+        "Address": stop["Address"],
+        "lat": float(stop["lat"]),
+        "lng": float(stop["lng"]),
+    }
+    if "gallons" in stop:
+        shaped["gallons"] = float(stop["gallons"])
+    if leg is not None:
+        shaped["leg"] = leg
+    return shaped
+
+
+def _segment(segment, steps):
+    shaped = {
+        "distance": float(segment["distance"]),
+        "duration": float(segment["duration"]),
+    }
+    if steps:
+        shaped["steps"] = [_step(step) for step in segment["steps"]]
+    return shaped
+
+
+def route_coordinates(data):
+    """
+    Returns the coordinates to route through for validated `RouteOptimizerSerializer` data: start, waypoints, end.
+    """
+    return (data["start"], *data.get("waypoints", ()), data["end"])
+
+
+def stop_legs(stops, route, line=None):
+    """
+    Finds the leg each stop is on, for routes through waypoints.
+
+    Args:
+        stops (list of dict): The fuel stops, with their "distance" along the route in meters.
+        route (dict): The routing service response, one segment per leg.
+        line (LineString, optional): The decoded route geometry, when the caller already has it.
+
+    Returns:
+        list of int: The leg index of each stop, or None for a route without waypoints.
+
+    Notes:
+        - Leg ends are the geometry vertices the last step of each segment points at, measured along the
+          line the same way the corridor measures stop distances. A stop at a waypoint opens the next leg.
+    """
+    segments = route["routes"][0].get("segments", [])
+    if len(segments) < 2:
+        return None
+
+    if line is None:
+        coordinates = decode_polyline_array(route["routes"][0]["geometry"])
+    else:
+        coordinates = shapely.get_coordinates(line)
+    # whole meters, like the corridor distances
+    ends = np.floor(
+        route_distances(coordinates)[
+            [segment["steps"][-1]["way_points"][-1] for segment in segments[:-1]]
+        ]
+    )
+    distances = [stop["distance"] for stop in stops]
+    return np.searchsorted(ends, distances, side="right").tolist()
+
+
+def response_options(data):
+    """
+    Picks the response shaping options out of validated `RouteOptimizerSerializer` data.
+    """
+    return {
+        "include": data.get("include", RESPONSE_PARTS),
+        "simplify": data.get("simplify"),
+        "geometry_format": data.get("geometry_format", "polyline"),
+    }
+
+
+def shape_geometry(geometry, line=None, simplify=None, geometry_format="polyline"):
+    """
+    Simplifies and converts an encoded route geometry.
+
+    Args:
+        geometry (str): The encoded polyline of the route.
+        line (LineString, optional): The decoded geometry, when the caller already has it.
+        simplify (float, optional): The Douglas-Peucker tolerance in meters. Defaults to None, no simplification.
+        geometry_format (str, optional): "polyline" or "geojson". Defaults to "polyline".
+
+    Returns:
+        str or dict: The encoded polyline, or a GeoJSON LineString.
+
+    Notes:
+        - The tolerance is measured in an equirectangular projection at the mean latitude of the route,
+          the kept vertices are the exact input coordinates.
+    """
+    if not simplify:
+        if geometry_format == "geojson":
+            return decode_polyline(geometry)
+        return geometry
+
+    if line is None:
+        coordinates = decode_polyline_array(geometry)
+    else:
+        coordinates = shapely.get_coordinates(line)
+    # the route is in degrees, a degree of longitude counts cos(latitude) as much as a degree of latitude
+    # at the mean latitude of the route, the vertex positions ride along as z to keep the exact coordinates
+    scale = np.cos(np.radians(coordinates[:, 1].mean()))
+    projected = shapely.linestrings(
+        coordinates[:, 0] * scale, coordinates[:, 1], np.arange(len(coordinates))
+    )
+    simplified = projected.simplify(simplify / DEG_TO_M, preserve_topology=False)
+    kept = shapely.get_coordinates(simplified, include_z=True)[:, 2].astype(int)
+    coordinates = coordinates[kept]
+    if geometry_format == "geojson":
+        return {"type": "LineString", "coordinates": coordinates.tolist()}
+    return encode_polyline(coordinates)
+
+
+def build_response_data(
+    route,
+    stops,
+    total_cost,
+    line=None,
+    include=RESPONSE_PARTS,
+    simplify=None,
+    geometry_format="polyline",
+):
+    """
+    Builds the response body of a single optimized route.
+
+    The body holds exactly the fields of `RouteOptimizerResponseSerializer`, with the same types its
+    validation produces, so it can be returned without running the serializer. Extra routing service
+    fields are left out.
+
+    Args:
+        route (dict): The routing service response.
+        stops (list of dict): The fuel stops.
+        total_cost (float): The total fuel cost.
+        line (LineString, optional): The decoded route geometry, saves decoding it again when simplifying.
+        include (iterable, optional): The route parts to return, of "segments", "steps" and "geometry".
+                                      Steps are only returned inside segments. Defaults to all.
+        simplify (float, optional): The geometry simplification tolerance in meters. Defaults to None.
+        geometry_format (str, optional): "polyline" or "geojson". Defaults to "polyline".
+    """
+    summary = route["routes"][0]["summary"]
+    shaped_route = {
+        "summary": {
+            "distance": float(summary["distance"]),
+            "duration": float(summary["duration"]),
+        },
+    }
+    if "segments" in include:
+        shaped_route["segments"] = [
+            _segment(segment, "steps" in include)
+            for segment in route["routes"][0]["segments"]
+        ]
+    if "geometry" in include:
+        shaped_route["geometry"] = shape_geometry(
+            route["routes"][0]["geometry"], line, simplify, geometry_format
+        )
+
+    legs = stop_legs(stops, route, line) or [None] * len(stops)
+    return {
+        "route": shaped_route,
+        "stops": [_stop(stop, leg) for stop, leg in zip(stops, legs)],
+        "total_cost": float(total_cost),
+        "total_distance_meters": float(summary["distance"]),
+    }
+
+
+def response_records(
+    route,
+    stops,
+    total_cost,
+    line=None,
+    include=RESPONSE_PARTS,
+    simplify=None,
+    geometry_format="polyline",
+):
+    """
+    Builds the response body of a single optimized route as a sequence of records, for streaming.
+
+    The first record is the `build_response_data` body without the route segments. When segments are
+    included, each follows as its own record with its position in "segment", built as it is sent.
+
+    Yields:
+        dict: The records of the response, see `RouteOptimizerView` for the NDJSON format.
+    """
+    yield build_response_data(
+        route,
+        stops,
+        total_cost,
+        line=line,
+        include=[part for part in include if part != "segments"],
+        simplify=simplify,
+        geometry_format=geometry_format,
+    )
+    if "segments" in include:
+        for i, segment in enumerate(route["routes"][0]["segments"]):
+            yield {"segment": i, **_segment(segment, "steps" in include)}
+
+
+def serialize_response(route, stops, total_cost, **options):
+    """
+    Builds the response body of a single optimized route, validating it only when `VALIDATE_RESPONSES` is set.
+
+    Returns:
+        tuple: The HTTP status code and the response body.
+
+    Notes:
+        - Validation re-parses every segment and step of the route, it is meant for debug and test runs.
+          The contract test in `api.tests` keeps `build_response_data` in line with the serializer.
+    """
+    response_data = build_response_data(route, stops, total_cost, **options)
+    if not getattr(settings, "VALIDATE_RESPONSES", False):
+        return status.HTTP_200_OK, response_data
+
+    # Validate Response Format
+    response_serializer = RouteOptimizerResponseSerializer(data=response_data)
+    if not response_serializer.is_valid():
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {
+            "error": "Invalid response format",
+            "details": response_serializer.errors,
+        }
+    return status.HTTP_200_OK, response_serializer.validated_data
+
+
+def plan_route(line, route, optimizer, options=None, vehicle=None):
+    """
+    Runs the CPU-bound stages of a single route request: corridor, optimize and serialize.
+
+    Args:
+        line (LineString): The route geometry returned by `get_route`.
+        route (dict): The routing service response returned by `get_route`.
+        optimizer (str): The optimizer mode, a key of `OPTIMIZERS`.
+        options (dict, optional): Response shaping options, see `response_options`.
+        vehicle (VehicleProfile, optional): The vehicle the stops are planned for. Defaults to the "default" profile.
+
+    Returns:
+        tuple: The HTTP status code and the response body.
+
+    Raises:
+        StationException: If no stations are found in range.
+    """
+    try:
+        # find candidate stations on route
+        stations = find_stations_on_route(line)
+    except Exception:
+        raise StationException()
+
+    stops, total_cost = optimize_stops(stations, route, optimizer, vehicle)
+    return serialize_response(route, stops, total_cost, line=line, **(options or {}))
+
+
+def dump_corridor(corridor):
+    """
+    Serializes the `PLANNED_CORRIDOR_COLUMNS` of a `corridor_stations` result to JSON, for storage.
+    """
+    return json.dumps(
+        {name: corridor[name].tolist() for name in PLANNED_CORRIDOR_COLUMNS}
+    )
+
+
+def load_corridor(data):
+    """
+    Reads a corridor stored by `dump_corridor` back into arrays.
+    """
+    value = json.loads(data)
+    return {
+        name: np.array(value[name], dtype=dtype)
+        for name, dtype in PLANNED_CORRIDOR_COLUMNS.items()
+    }
+
+
+def save_planned_route(
+    line,
+    route,
+    optimizer,
+    options,
+    vehicle=None,
+    max_distance=100000,
+    corridor=None,
+):
+    """
+    Saves an optimized route for re-pricing with `reprice_routes`.
+
+    Args:
+        line (LineString): The route geometry returned by `get_route`.
+        route (dict): The routing service response returned by `get_route`.
+        optimizer (str): The optimizer mode, a key of `OPTIMIZERS`.
+        options (dict): Response shaping options, see `response_options`.
+        vehicle (VehicleProfile, optional): The vehicle the route is planned for. Defaults to the "default" profile.
+        max_distance (float, optional): The corridor width in meters. Defaults to 100,000.
+        corridor (dict, optional): The corridor of the route with the "geometry_key" of its station table, as
+                                   returned by `StationPool.plan_stops` with `with_corridor`. Defaults to None,
+                                   the corridor is looked up in this process.
+
+    Returns:
+        UUID: The ID of the saved route.
+
+    Notes:
+        - Without `corridor`, the corridor cache of this process answers when the request located the
+          corridor here. Routes planned in `StationPool` workers pass theirs, this process never located it.
+    """
+    if vehicle is None:
+        vehicle = VehicleProfile.from_settings()
+    if corridor is None:
+        stations = station_data.snapshot()
+        corridor = cached_corridor_stations([line], max_distance, stations)[0]
+        stations_key = stations.geometry_key
+    else:
+        # a reload after the worker ran leaves an outdated key, `reprice_routes` locates it again
+        stations_key = corridor["geometry_key"]
+    planned = PlannedRoute.objects.create(
+        optimizer=optimizer,
+        vehicle=json.dumps(vehicle.as_dict()),
+        options=json.dumps({**options, "include": sorted(options["include"])}),
+        route=json.dumps(route),
+        stations_key=stations_key,
+        corridor=dump_corridor(corridor),
+    )
+    return planned.id
+
+
+def reprice_routes(route_ids, max_distance=100000):
+    """
+    Re-optimizes saved routes against the current station prices, without calling the routing service.
+
+    Args:
+        route_ids (list of UUID): IDs returned by `save_planned_route`.
+        max_distance (float, optional): The corridor width in meters. Defaults to 100,000.
+
+    Returns:
+        list of dict: One entry per ID, in order, in the same format as `optimize_batch` results.
+                      Successful bodies carry the "route_id".
+
+    Notes:
+        - The stored corridor is only joined with the current prices. When the stations moved since the
+          route was saved (a different `StationTable.geometry_key`), the corridor is recomputed from the
+          stored geometry and saved again.
+    """
+    planned = PlannedRoute.objects.in_bulk(route_ids)
+    stations = station_data.snapshot()
+    results = []
+    moved = []
+
+    for route_id in route_ids:
+        plan = planned.get(route_id)
+        if plan is None:
+            error = NotFound("Route not found.")
+            results.append(
+                {"status": error.status_code, "error": {"detail": error.detail}}
+            )
+            continue
+
+        route = json.loads(plan.route)
+        if plan.stations_key == stations.geometry_key:
+            corridor = load_corridor(plan.corridor)
+        else:
+            line = LineString(decode_polyline_array(route["routes"][0]["geometry"]))
+            corridor = cached_corridor_stations([line], max_distance, stations)[0]
+            plan.stations_key = stations.geometry_key
+            plan.corridor = dump_corridor(corridor)
+            moved.append(plan)
+
+        try:
+            stops, total_cost = optimize_stops(
+                station_rows(corridor, stations),
+                route,
+                plan.optimizer,
+                VehicleProfile(**json.loads(plan.vehicle)),
+            )
+            status_code, body = serialize_response(
+                route, stops, total_cost, **json.loads(plan.options)
+            )
+        except APIException as error:
+            results.append(
+                {"status": error.status_code, "error": {"detail": error.detail}}
+            )
+            continue
+
+        if status_code == status.HTTP_200_OK:
+            body["route_id"] = str(plan.id)
+            results.append({"status": status_code, "data": body})
+        else:
+            results.append({"status": status_code, "error": body})
+
+    PlannedRoute.objects.bulk_update(moved, ["stations_key", "corridor"])
+    PlannedRoute.objects.filter(id__in=planned).update(repriced=timezone.now())
+    return results
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide pool that async views offload `plan_route` to, configured by `ROUTE_EXECUTOR`.
+
+    "KIND" is "thread" or "process", a process pool keeps the CPU-bound stages from holding
+    the GIL of the serving process. The "shared_memory" kind is served by `api.workers.get_station_pool`
+    instead, for the sync views too.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = {
+                    **DEFAULT_ROUTE_EXECUTOR,
+                    **getattr(settings, "ROUTE_EXECUTOR", {}),
+                }
+                pool = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+                _executor = pool[config["KIND"]](max_workers=config["WORKERS"])
+    return _executor
+
+
+def _fetch_route(lane):
+    coords, profile = lane
+    try:
+        return get_route(coords, profile)
+    finally:
+        # worker threads open their own database connections for the route cache
+        connections.close_all()
+
+
+def iter_batch(payloads, stream=False):
+    """
+    Optimizes a batch of route requests, yielding the results of each lane once it is computed.
+
+    Args:
+        payloads (list): Request bodies in the `RouteOptimizerSerializer` format.
+        stream (bool, optional): Finish each lane as soon as its route arrives rather than once all routes
+                                 arrived. Defaults to False.
+
+    Yields:
+        tuple: The positions of the payloads sharing a result, and the result, either `{"status": 200, "data": ...}`
+               with the same body as the single route endpoint, or `{"status": <code>, "error": ...}`. Invalid
+               payloads come first. A failure is the error result of the items it concerns.
+
+    Notes:
+        - Identical lanes (start, waypoints, end and routing profile) are routed once, their items share
+          the route and corridor. Items with the same optimizer and vehicle also share the optimization.
+        - Routes are fetched concurrently, with at most `ROUTE_BATCH["WORKERS"]` requests in flight. All of them
+          go through one `find_stations_on_routes` call, identical geometries share a corridor. With `stream`,
+          each lane goes through corridor, optimize and serialize while the other routes are still in flight,
+          in the order the routes arrive.
+        - Closing the generator early, e.g. when a streaming client goes away, cancels the routes not yet fetched.
+    """
+    config = {**DEFAULT_ROUTE_BATCH, **getattr(settings, "ROUTE_BATCH", {})}
+
+    # validate every item, the valid ones are grouped by lane
+    lanes = {}
+    for i, payload in enumerate(payloads):
+        serializer = RouteOptimizerSerializer(data=payload)
+        if not serializer.is_valid():
+            yield (
+                [i],
+                {
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "error": {"error": "Invalid input", "details": serializer.errors},
+                },
+            )
+            continue
+        data = serializer.validated_data
+        options = response_options(data)
+        # items differing only in response shape share the optimization
+        shape = (
+            frozenset(options["include"]),
+            options["simplify"],
+            options["geometry_format"],
+            data["save"],
+        )
+        vehicle = data["vehicle"]
+        # vehicles routed with the same profile share the route and corridor
+        lanes.setdefault(
+            (route_coordinates(data), vehicle.routing_profile), {}
+        ).setdefault((data["optimizer"], vehicle), {}).setdefault(shape, (options, []))[
+            1
+        ].append(i)
+
+    # fetch the unique routes concurrently
+    executor = ThreadPoolExecutor(max_workers=config["WORKERS"])
+    try:
+        futures = {executor.submit(_fetch_route, lane): lane for lane in lanes}
+        if stream:
+            # each lane is finished as its route arrives
+            batches = ([future] for future in as_completed(futures))
+        else:
+            # one corridor pass for every route once all arrived
+            batches = [list(futures)]
+        for batch in batches:
+            yield from _finish_lanes(
+                [(lanes[futures[future]], future) for future in batch]
+            )
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _error_result(items, error):
+    return items, {"status": error.status_code, "error": {"detail": error.detail}}
+
+
+def _lane_items(vehicles):
+    return [
+        i for shapes in vehicles.values() for _, items in shapes.values() for i in items
+    ]
+
+
+def _lane_stations(lines):
+    """
+    Finds the stations along each route in one `find_stations_on_routes` call.
+
+    Returns:
+        list: One list of stations per route, or a `StationException` for the routes whose corridor failed.
+              A failed pass over several routes is retried route by route, so only the failing lanes fail.
+    """
+    try:
+        return find_stations_on_routes(lines)
+    except Exception:
+        if len(lines) == 1:
+            return [StationException()]
+    return [_lane_stations([line])[0] for line in lines]
+
+
+def _finish_lanes(lanes):
+    """
+    Runs corridor, optimize and serialize for batch lanes whose routes were fetched, yielding the results
+    of their items. Failures are yielded as error results of the items they concern.
+    """
+    routed = []
+    for vehicles, future in lanes:
+        try:
+            routed.append((vehicles, *future.result()))
+        except Exception:
+            yield _error_result(_lane_items(vehicles), RouteException())
+    if not routed:
+        return
+
+    corridors = _lane_stations([line for _, line, _ in routed])
+    for (vehicles, line, route), stations in zip(routed, corridors):
+        if isinstance(stations, APIException):
+            yield _error_result(_lane_items(vehicles), stations)
+            continue
+
+        for (optimizer, vehicle), shapes in vehicles.items():
+            try:
+                stops, total_cost = optimize_stops(stations, route, optimizer, vehicle)
+            except APIException as error:
+                yield _error_result(
+                    [i for _, items in shapes.values() for i in items], error
+                )
+                continue
+
+            for shape, (options, items) in shapes.items():
+                status_code, body = serialize_response(
+                    route, stops, total_cost, line=line, **options
+                )
+                if status_code != status.HTTP_200_OK:
+                    yield items, {"status": status_code, "error": body}
+                    continue
+                if shape[-1]:
+                    try:
+                        body["route_id"] = str(
+                            save_planned_route(line, route, optimizer, options, vehicle)
+                        )
+                    except DatabaseError:
+                        yield _error_result(
+                            items, APIException("Unable to save the route.")
+                        )
+                        continue
+                yield items, {"status": status_code, "data": body}
+
+
+def optimize_batch(payloads):
+    """
+    Optimizes a batch of route requests, failures are reported per item instead of failing the batch.
+
+    Args:
+        payloads (list): Request bodies in the `RouteOptimizerSerializer` format.
+
+    Returns:
+        list of dict: One `iter_batch` result per payload, in order.
+    """
+    results = [None] * len(payloads)
+    for positions, result in iter_batch(payloads):
+        for i in positions:
+            results[i] = result
+    return results
+
+
+def batch_records(payloads):
+    """
+    Optimizes a batch of route requests for streaming, one `iter_batch` result per payload with its "index".
+
+    Yields:
+        dict: The records of the response, in the order the results are computed.
+    """
+    for positions, result in iter_batch(payloads, stream=True):
+        for i in positions:
+            yield {"index": i, **result}
@@ -0,0 +1,49 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library encoder
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer using orjson when it is installed, otherwise it behaves as DRF's `JSONRenderer`.
+
+    Indented output (e.g. `Accept: application/json; indent=4`) is left to the standard renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
+class NDJSONRenderer(ORJSONRenderer):
+    """
+    Newline-delimited JSON, one record per line, selected with `Accept: application/x-ndjson` or `?format=ndjson`.
+
+    Streaming views send their records one by one with `stream`. Any other response, e.g. an error,
+    is a single record.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # one record per line, never indented
+        return super().render(data, None, renderer_context) + b"\n"
+
+    def stream(self, records):
+        for record in records:
+            yield self.render(record)
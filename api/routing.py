@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .client import directions, directions_async
+from .graph import DEFAULT_GRAPH_PATH, RoadGraph, directions_response
+
+DEFAULT_ROUTING = {
+    "BACKEND": "api.routing.ORSRoutingBackend",
+    "MODE": "live",
+    "FIXTURE_DIR": "./api/fixtures/routes",
+    "OPTIONS": {},
+}
+
+ROUTING_MODES = ("live", "record", "replay")
+
+
+class FixtureNotFound(LookupError):
+    """
+    Raised in replay mode for a request that was never recorded.
+    """
+
+
+class BaseRoutingBackend:
+    """
+    Base class for routing backends, `get_route` asks the configured backend for directions.
+
+    Subclasses implement `directions`, returning a response in the OpenRouteService directions
+    format: `{"routes": [{"summary": ..., "segments": ..., "geometry": <encoded polyline>}]}`.
+    """
+
+    def __init__(self, **options):
+        pass
+
+    def directions(self, coords, profile="driving-car", **params):
+        raise NotImplementedError
+
+    async def directions_async(self, coords, profile="driving-car", **params):
+        return await sync_to_async(self.directions)(coords, profile, **params)
+
+
+class ORSRoutingBackend(BaseRoutingBackend):
+    """
+    The OpenRouteService directions API, through the pooled sessions of `api.client`.
+    """
+
+    def directions(self, coords, profile="driving-car", **params):
+        return directions(coords, profile=profile, **params)
+
+    async def directions_async(self, coords, profile="driving-car", **params):
+        return await directions_async(coords, profile=profile, **params)
+
+
+class GraphRoutingBackend(BaseRoutingBackend):
+    """
+    In-process routing over a local road graph, built by `manage.py build_road_graph`. No network is involved.
+
+    Coordinates snap to the nearest graph node within `radiuses` meters, each pair of consecutive coordinates
+    is one leg found with bidirectional A* (see `api.graph.RoadGraph.shortest_path`).
+
+    Args:
+        path (str, optional): The graph directory written by `RoadGraph.save`. Defaults to "./api/data/graph".
+    """
+
+    def __init__(self, path=DEFAULT_GRAPH_PATH, **options):
+        self.path = path
+
+    @cached_property
+    def graph(self):
+        graph = RoadGraph.load(self.path)
+        # built here rather than in the first search
+        graph.index
+        graph._forward
+        graph._reverse
+        return graph
+
+    def directions(self, coords, profile="driving-car", radiuses=None, **params):
+        if not isinstance(radiuses, (list, tuple)):
+            radiuses = [radiuses] * len(coords)
+        nodes = [
+            self.graph.snap(lng, lat, radius)
+            for (lng, lat), radius in zip(coords, radiuses)
+        ]
+        legs = [
+            (source, self.graph.shortest_path(source, target))
+            for source, target in zip(nodes, nodes[1:])
+        ]
+        return directions_response(self.graph, legs)
+
+
+class FixtureRoutingBackend(BaseRoutingBackend):
+    """
+    Records the responses of another backend to disk, or replays them without any network access.
+
+    Every request is stored as one JSON file in `fixture_dir`, named by a hash of the profile,
+    coordinates and parameters, holding both the request and the response.
+
+    Args:
+        backend (BaseRoutingBackend): The backend answering live and record mode requests.
+        mode (str): "record" or "replay".
+        fixture_dir (str): The directory of the fixture files.
+    """
+
+    def __init__(self, backend, mode, fixture_dir):
+        self.backend = backend
+        self.mode = mode
+        self.fixture_dir = fixture_dir
+        # replayed responses stay in memory, load tests do not read the disk per request
+        self._replayed = {}
+
+    @staticmethod
+    def request(coords, profile, params):
+        return {
+            "profile": profile,
+            "coordinates": [list(c) for c in coords],
+            "params": params,
+        }
+
+    def fixture_path(self, request):
+        key = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.fixture_dir, f"{key}.json")
+
+    def directions(self, coords, profile="driving-car", **params):
+        request = self.request(coords, profile, params)
+        if self.mode == "replay":
+            return self.replay(request)
+
+        route = self.backend.directions(coords, profile, **params)
+        self.record(request, route)
+        return route
+
+    async def directions_async(self, coords, profile="driving-car", **params):
+        request = self.request(coords, profile, params)
+        if self.mode == "replay":
+            return self.replay(request)
+
+        route = await self.backend.directions_async(coords, profile, **params)
+        self.record(request, route)
+        return route
+
+    def replay(self, request):
+        path = self.fixture_path(request)
+        route = self._replayed.get(path)
+        if route is None:
+            try:
+                with open(path) as f:
+                    route = json.load(f)["response"]
+            except FileNotFoundError:
+                raise FixtureNotFound(f"No recorded route for {request} in {path}")
+            self._replayed[path] = route
+        return route
+
+    def record(self, request, route):
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        path = self.fixture_path(request)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"request": request, "response": route}, f)
+        os.replace(f"{path}.tmp", path)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_routing_backend():
+    """
+    Returns the process-wide routing backend configured by the `ROUTING` setting.
+
+    "MODE" is "live" (the backend answers), "record" (the backend answers and every response is written
+    to "FIXTURE_DIR") or "replay" (responses are read from "FIXTURE_DIR", the backend is never called).
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = {**DEFAULT_ROUTING, **getattr(settings, "ROUTING", {})}
+                if config["MODE"] not in ROUTING_MODES:
+                    raise ValueError(f"Unknown routing mode {config['MODE']!r}")
+                options = {k.lower(): v for k, v in config["OPTIONS"].items()}
+                backend = import_string(config["BACKEND"])(**options)
+                if config["MODE"] != "live":
+                    backend = FixtureRoutingBackend(
+                        backend, config["MODE"], config["FIXTURE_DIR"]
+                    )
+                _backend = backend
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend_on_setting_changed(setting, **kwargs):
+    global _backend
+    if setting == "ROUTING":
+        _backend = None
@@ -1,6 +1,15 @@
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from .vehicles import ROUTING_PROFILES, VehicleProfile
+
+# optional parts of the route in a response, all of them by default
+RESPONSE_PARTS = ("segments", "steps", "geometry")
+
+# OpenRouteService accepts at most 50 coordinates per directions request, start and end included
+MAX_WAYPOINTS = 48
+
 
 class CoordinateField(serializers.Field):
     def to_internal_value(self, data):
@@ -38,9 +47,121 @@ class CoordinateField(serializers.Field):
         return {"lat": value[0], "lng": value[1]}
 
 
+class IncludeField(serializers.MultipleChoiceField):
+    """
+    A multiple choice field that also accepts comma separated strings, e.g. "segments,geometry", alone or
+    as the repeated values of a form or query string.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, (list, tuple)):
+            data = [
+                part.strip()
+                for value in data
+                for part in (value.split(",") if isinstance(value, str) else [value])
+                if not isinstance(part, str) or part.strip()
+            ]
+        return super().to_internal_value(data)
+
+
+class VehicleSerializer(serializers.Serializer):
+    routing_profile = serializers.ChoiceField(
+        choices=ROUTING_PROFILES,
+        required=False,
+        help_text="Routing service profile, e.g. 'driving-hgv' for heavy goods vehicles",
+    )
+    mpg = serializers.FloatField(
+        min_value=0.1, required=False, help_text="Fuel consumption in miles per gallon"
+    )
+    tank_gallons = serializers.FloatField(
+        min_value=0.1, required=False, help_text="Tank capacity in gallons"
+    )
+    range_miles = serializers.FloatField(
+        min_value=1,
+        required=False,
+        help_text="Range of a full tank in miles, defaults to what the tank holds at the given MPG",
+    )
+    start_fuel = serializers.FloatField(
+        min_value=0,
+        max_value=1,
+        required=False,
+        help_text="Fuel level at the start of the trip, as a fraction of a full tank",
+    )
+
+
+class VehicleField(serializers.Field):
+    """
+    A vehicle profile, by the name of one configured in `VEHICLE_PROFILES` or as an object.
+
+    Fields missing from an object are taken from the "default" profile, except the range which follows
+    the given tank and MPG.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                return VehicleProfile.from_settings(data)
+            except KeyError:
+                raise ValidationError(f"Unknown vehicle profile '{data}'.")
+
+        serializer = VehicleSerializer(data=data)
+        if not serializer.is_valid():
+            raise ValidationError(serializer.errors)
+        fields = serializer.validated_data
+
+        default = VehicleProfile.from_settings().as_dict()
+        if "mpg" in fields or "tank_gallons" in fields:
+            default["range_miles"] = None
+        vehicle = VehicleProfile(**{**default, **fields})
+        if vehicle.range_miles > vehicle.tank_gallons * vehicle.mpg * (1 + 1e-9):
+            raise ValidationError(
+                {"range_miles": ["The range is more than the tank holds at this MPG."]}
+            )
+        return vehicle
+
+    def to_representation(self, value):
+        return value.as_dict()
+
+
 class RouteOptimizerSerializer(serializers.Serializer):
     start = CoordinateField(help_text="Start coordinates (object or 'lat,lng' string)")
     end = CoordinateField(help_text="End coordinates (object or 'lat,lng' string)")
+    waypoints = serializers.ListField(
+        child=CoordinateField(),
+        default=list,
+        max_length=MAX_WAYPOINTS,
+        help_text="Intermediate stops between start and end, in driving order. The whole trip is routed and fueled as one",
+    )
+    vehicle = VehicleField(
+        default=VehicleProfile.from_settings,
+        help_text="Vehicle profile, the name of a configured profile or an object of its fields. Defaults to 'default'",
+    )
+    optimizer = serializers.ChoiceField(
+        choices=["greedy", "exact"],
+        default="greedy",
+        help_text="Stop selection: 'greedy' cheapest stop per range window, 'exact' minimum cost with partial fills",
+    )
+    include = IncludeField(
+        choices=RESPONSE_PARTS,
+        default=lambda: set(RESPONSE_PARTS),
+        help_text="Route parts in the response, any of 'segments', 'steps' and 'geometry'. Defaults to all",
+    )
+    simplify = serializers.FloatField(
+        min_value=0,
+        required=False,
+        help_text="Douglas-Peucker simplification tolerance of the geometry, in meters",
+    )
+    geometry_format = serializers.ChoiceField(
+        choices=["polyline", "geojson"],
+        default="polyline",
+        help_text="Geometry output: 'polyline' encoded string or a 'geojson' LineString",
+    )
+    save = serializers.BooleanField(
+        default=False,
+        help_text="Save the route so it can be re-priced later by its 'route_id'",
+    )
 
 
 class FuelStopSerializer(serializers.Serializer):
@@ -50,6 +171,11 @@ class FuelStopSerializer(serializers.Serializer):
     Address = serializers.CharField()
     lat = serializers.FloatField()
     lng = serializers.FloatField()
+    gallons = serializers.FloatField(required=False)
+    leg = serializers.IntegerField(
+        required=False,
+        help_text="Index of the leg the stop is on, for routes with waypoints",
+    )
 
 
 class StepSerializer(serializers.Serializer):
@@ -64,7 +190,7 @@ class StepSerializer(serializers.Serializer):
 class SegmentSerializer(serializers.Serializer):
     distance = serializers.FloatField()
     duration = serializers.FloatField()
-    steps = serializers.ListSerializer(child=StepSerializer())
+    steps = serializers.ListSerializer(child=StepSerializer(), required=False)
 
 
 class SummarySeriealizer(serializers.Serializer):
@@ -74,15 +200,62 @@ class SummarySeriealizer(serializers.Serializer):
 
 class RouteSerializer(serializers.Serializer):
     summary = SummarySeriealizer()
-    segments = serializers.ListSerializer(child=SegmentSerializer())
-    geometry = serializers.CharField()
+    segments = serializers.ListSerializer(child=SegmentSerializer(), required=False)
+    geometry = serializers.JSONField(
+        required=False,
+        help_text="Encoded polyline string, or a GeoJSON LineString object",
+    )
 
 
 class RouteOptimizerResponseSerializer(serializers.Serializer):
     route = RouteSerializer()
     stops = FuelStopSerializer(many=True)
-    total_cost = serializers.FloatField()
+    total_cost = serializers.FloatField(
+        help_text="Fuel cost. 'greedy' prices the whole trip at the stop prices, starting fuel included, "
+        "'exact' only the fuel bought at the stops"
+    )
     total_distance_meters = serializers.FloatField()
+    route_id = serializers.UUIDField(
+        required=False, help_text="ID of the saved route, for re-pricing"
+    )
+
+
+class RouteBatchSerializer(serializers.Serializer):
+    routes = serializers.ListField(
+        child=serializers.JSONField(),
+        allow_empty=False,
+        help_text="Route requests, each in the same format as the single route endpoint",
+    )
+
+    def validate_routes(self, value):
+        max_size = getattr(settings, "ROUTE_BATCH", {}).get("MAX_SIZE", 5000)
+        if len(value) > max_size:
+            raise ValidationError(f"A batch can hold at most {max_size} routes.")
+        return value
+
+
+class RouteRepriceBatchSerializer(serializers.Serializer):
+    route_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        help_text="IDs of saved routes to re-price",
+    )
+
+    def validate_route_ids(self, value):
+        max_size = getattr(settings, "ROUTE_BATCH", {}).get("MAX_SIZE", 5000)
+        if len(value) > max_size:
+            raise ValidationError(f"A batch can hold at most {max_size} routes.")
+        return value
+
+
+class RouteBatchItemSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    data = RouteOptimizerResponseSerializer(required=False)
+    error = serializers.DictField(required=False)
+
+
+class RouteBatchResponseSerializer(serializers.Serializer):
+    results = RouteBatchItemSerializer(many=True)
 
 
 class ErrorSerializer(serializers.Serializer):
@@ -0,0 +1,369 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import shapely
+from django.dispatch import Signal
+from shapely.strtree import STRtree
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_PATH = "./api/data/test.csv"
+DEFAULT_STORE_PATH = "./api/data/stations"
+
+# written last by `StationTable.save`, its modification time marks a complete store and it lists
+# the digest of every array the store is made of
+STORE_MANIFEST = "manifest.json"
+
+# sent after a reload swapped in a new station table, with `version` and `geometry_changed`
+stations_reloaded = Signal()
+
+# arrays making up a station store, one .npy file each
+STORE_ARRAYS = (
+    "ids",
+    "lng",
+    "lat",
+    "price",
+    "name_codes",
+    "names",
+    "address_codes",
+    "addresses",
+)
+
+
+class StoreMismatch(ValueError):
+    """
+    Raised by `StationTable.load` when an array of a station store does not match its manifest,
+    e.g. while `StationTable.save` is replacing the store.
+    """
+
+
+def array_digest(array):
+    """
+    Returns a fingerprint of the contents of an array.
+    """
+    return hashlib.blake2b(
+        np.ascontiguousarray(array).tobytes(), digest_size=16
+    ).hexdigest()
+
+
+class StationTable:
+    """
+    Column-oriented fuel station data with a spatial index over the station locations.
+
+    Attributes:
+        ids (numpy.ndarray): OPIS truckstop IDs.
+        lng, lat (numpy.ndarray): float64 station coordinates.
+        price (numpy.ndarray): float64 retail prices.
+        name_codes, address_codes (numpy.ndarray): int32 positions into the interned `names` and `addresses`.
+        names, addresses (numpy.ndarray): The unique station names and addresses.
+        points (numpy.ndarray): One Shapely Point per station, in row order.
+        index (STRtree): A Shapely STRtree over `points`, query results are row positions.
+        geometry_key (str): A fingerprint of the station IDs and locations, equal for tables whose
+                            rows only differ in prices, names or addresses.
+        prices_key (str): A fingerprint of the prices.
+        digests (dict): The `array_digest` of each array for a table loaded from a store, otherwise None.
+    """
+
+    def __init__(
+        self, ids, lng, lat, price, name_codes, names, address_codes, addresses
+    ):
+        self.ids = ids
+        self.lng = lng
+        self.lat = lat
+        self.price = price
+        self.name_codes = name_codes
+        self.names = names
+        self.address_codes = address_codes
+        self.addresses = addresses
+        self.digests = None
+
+    @cached_property
+    def points(self):
+        return shapely.points(self.lng, self.lat)
+
+    @cached_property
+    def index(self):
+        return STRtree(self.points)
+
+    @cached_property
+    def geometry_key(self):
+        digest = hashlib.blake2b(digest_size=16)
+        for column in (self.ids, self.lng, self.lat):
+            digest.update(np.ascontiguousarray(column).tobytes())
+        return digest.hexdigest()
+
+    @cached_property
+    def prices_key(self):
+        return array_digest(self.price)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def same_geometry(self, other):
+        """
+        Returns True when both tables hold the same stations at the same locations, in the same order.
+        """
+        if self.ids is other.ids and self.lng is other.lng and self.lat is other.lat:
+            return True
+        return (
+            np.array_equal(self.ids, other.ids)
+            and np.array_equal(self.lng, other.lng)
+            and np.array_equal(self.lat, other.lat)
+        )
+
+    def share_geometry(self, other):
+        """
+        Reuses the points and spatial index of `other`, which must have the same geometry.
+        """
+        self.points = other.points
+        self.index = other.index
+        self.geometry_key = other.geometry_key
+
+    def names_at(self, rows):
+        return self.names[self.name_codes[rows]]
+
+    def addresses_at(self, rows):
+        return self.addresses[self.address_codes[rows]]
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_CSV_PATH):
+        """
+        Reads an OPIS truckstop CSV, stations without a "Geocode" are dropped.
+
+        Args:
+            path (str): The path of the semicolon separated CSV file.
+
+        Returns:
+            StationTable: The parsed stations, in file order.
+        """
+        frame = pd.read_csv(
+            path,
+            delimiter=";",
+            usecols=[
+                "OPIS Truckstop ID",
+                "Truckstop Name",
+                "Address",
+                "Retail Price",
+                "Geocode",
+            ],
+        )
+        frame = frame.dropna(subset=["Geocode"])
+
+        # "[lng, lat]" strings split in one pass instead of a literal_eval per row
+        geocode = (
+            frame["Geocode"].str.strip("[] ").str.split(",", expand=True).astype(float)
+        )
+        names, name_codes = np.unique(
+            frame["Truckstop Name"].to_numpy(dtype=str), return_inverse=True
+        )
+        addresses, address_codes = np.unique(
+            frame["Address"].to_numpy(dtype=str), return_inverse=True
+        )
+        return cls(
+            ids=frame["OPIS Truckstop ID"].to_numpy(dtype=np.int64),
+            lng=geocode[0].to_numpy(dtype=np.float64),
+            lat=geocode[1].to_numpy(dtype=np.float64),
+            price=frame["Retail Price"].to_numpy(dtype=np.float64),
+            name_codes=name_codes.astype(np.int32),
+            names=names,
+            address_codes=address_codes.astype(np.int32),
+            addresses=addresses,
+        )
+
+    def save(self, path=DEFAULT_STORE_PATH):
+        """
+        Writes the table as a station store, a directory with one uncompressed .npy file per array.
+
+        The manifest, listing the digest of every array, replaces the previous one last. Until then
+        `load` finds arrays that do not match the manifest and fails instead of mixing two stores.
+        """
+        os.makedirs(path, exist_ok=True)
+        digests = {}
+        for name in STORE_ARRAYS:
+            # replaced rather than overwritten, tables still mapping the old file keep reading it
+            target = os.path.join(path, f"{name}.npy")
+            array = getattr(self, name)
+            with open(f"{target}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{target}.tmp", target)
+            digests[name] = array_digest(array)
+
+        manifest = os.path.join(path, STORE_MANIFEST)
+        with open(f"{manifest}.tmp", "w") as f:
+            json.dump(
+                {"stations": len(self), "arrays": STORE_ARRAYS, "digests": digests}, f
+            )
+        os.replace(f"{manifest}.tmp", manifest)
+
+    @classmethod
+    def load(cls, path=DEFAULT_STORE_PATH, current=None):
+        """
+        Loads a station store written by `save`.
+
+        Args:
+            path (str, optional): The store directory. Defaults to "./api/data/stations".
+            current (StationTable, optional): The table in use. Its arrays whose digest matches the manifest
+                                              are reused instead of loaded, so a price update only reads
+                                              the price file.
+
+        The arrays are memory-mapped read only, so worker processes share the file pages
+        through the OS page cache instead of each holding a parsed copy.
+
+        Raises:
+            StoreMismatch: If an array does not match the digest in the manifest, the store is being written.
+
+        Notes:
+            - A mapped array keeps reading the file it was loaded from, so the digest is checked on the
+              mapped contents and a file replaced after the check is not read.
+            - Stores written before the manifest listed digests are loaded without the check.
+        """
+        with open(os.path.join(path, STORE_MANIFEST)) as f:
+            digests = json.load(f).get("digests")
+
+        reusable = (current is not None and current.digests) or {}
+        arrays = {}
+        for name in STORE_ARRAYS:
+            if digests is not None and reusable.get(name) == digests[name]:
+                arrays[name] = getattr(current, name)
+                continue
+            arrays[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            if digests is not None and array_digest(arrays[name]) != digests[name]:
+                raise StoreMismatch(
+                    f"{name}.npy in {path} does not match the store manifest"
+                )
+        stations = cls(**arrays)
+        stations.digests = digests
+        return stations
+
+
+def load_stations(
+    store_path=DEFAULT_STORE_PATH, csv_path=DEFAULT_CSV_PATH, current=None
+):
+    """
+    Loads the station store when one was built, reusing the unchanged arrays of the `current` table,
+    otherwise parses the CSV.
+    """
+    if os.path.isdir(store_path):
+        return StationTable.load(store_path, current)
+    return StationTable.from_csv(csv_path)
+
+
+class StationDataManager:
+    """
+    Holds the current station table and swaps in new ones when the station data changes.
+
+    Readers take a `snapshot()` once per operation and use it throughout, a reload replaces the
+    reference atomically so in-flight work finishes on the table it started with.
+
+    Attributes:
+        version (int): Incremented on every swap, caches keyed by it are invalidated by reloads.
+    """
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH, csv_path=DEFAULT_CSV_PATH):
+        self.store_path = store_path
+        self.csv_path = csv_path
+        self.version = 0
+        self._stations = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def configure(self, store_path, csv_path):
+        self.store_path = store_path
+        self.csv_path = csv_path
+
+    def snapshot(self):
+        """
+        Returns the current `StationTable`, loading it on first use.
+        """
+        stations = self._stations
+        if stations is None:
+            self._reload(initial=True)
+            stations = self._stations
+        return stations
+
+    def source_path(self):
+        if os.path.isdir(self.store_path):
+            return os.path.join(self.store_path, STORE_MANIFEST)
+        return self.csv_path
+
+    def source_mtime(self):
+        try:
+            return os.stat(self.source_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self, wait=False):
+        """
+        Rebuilds the station table from the data files in a background thread, then swaps it in.
+
+        Args:
+            wait (bool, optional): Block until the new table is in place. Defaults to False.
+
+        Notes:
+            - A station store is compared with the current table array by array, only the arrays whose digest
+              changed are loaded. A price update reads the price file and reuses every other column.
+            - A CSV source is parsed in full.
+            - When the station locations are unchanged, the new table reuses the current points and spatial index.
+        """
+        thread = threading.Thread(target=self._reload, daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _reload(self, initial=False):
+        with self._lock:
+            current = self._stations
+            if initial and current is not None:
+                # another thread finished the first load while this one waited
+                return
+            try:
+                stations = load_stations(self.store_path, self.csv_path, current)
+                if current is not None and current.same_geometry(stations):
+                    stations.share_geometry(current)
+                else:
+                    # build the index here rather than in the first request using the table
+                    stations.index
+            except Exception:
+                if current is None:
+                    raise
+                logger.exception(
+                    "Station data reload failed, keeping version %s", self.version
+                )
+                return
+
+            self._stations = stations
+            self.version += 1
+            geometry_changed = current is None or stations.index is not current.index
+
+        stations_reloaded.send(
+            sender=self.__class__,
+            manager=self,
+            version=self.version,
+            geometry_changed=geometry_changed,
+        )
+
+    def watch(self, interval):
+        """
+        Polls the station data file every `interval` seconds and reloads when it changes.
+        """
+        if self._watcher is not None:
+            return
+
+        def poll():
+            last = self.source_mtime()
+            while True:
+                time.sleep(interval)
+                mtime = self.source_mtime()
+                if mtime != last:
+                    last = mtime
+                    self._reload()
+
+        self._watcher = threading.Thread(target=poll, daemon=True)
+        self._watcher.start()
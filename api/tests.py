@@ -1,8 +1,170 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import shapely
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError
+from django.test import Client, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from shapely.geometry import LineString
+
+from .cache import (
+    CorridorCache,
+    DatabaseRouteCache,
+    DjangoRouteCache,
+    LocMemRouteCache,
+)
+from .client import get_session
+from .coalesce import SingleFlight
+from .exceptions import StationException
+from .graph import NoRouteFound, RoadGraph, haversine
+from .lanes import lane_key, lookup_lane, precompute_lanes
+from .models import PlannedRoute, PrecomputedLane
+from .pipeline import (
+    PLANNED_CORRIDOR_COLUMNS,
+    build_response_data,
+    load_corridor,
+    optimize_stops,
+    response_options,
+    save_planned_route,
+    serialize_response,
+    stop_legs,
+)
+from .renderers import ORJSONRenderer
+from .routing import FixtureNotFound, get_routing_backend
+from .serializer import RouteOptimizerResponseSerializer, RouteOptimizerSerializer
+from .stations import (
+    STORE_ARRAYS,
+    StationDataManager,
+    StationTable,
+    StoreMismatch,
+    stations_reloaded,
+)
+from .utils import (
+    DEG_TO_M,
+    EARTH_RADIUS,
+    MAX_DISTANCE,
+    METERS_TO_MILES,
+    calculate_min_cost_stops,
+    calculate_optimal_stops,
+    corridor_stations,
+    corridor_stations_many,
+    decode_polyline,
+    decode_polyline_array,
+    encode_polyline,
+    find_stations_on_route,
+    get_route,
+    route_distances,
+    station_data,
+    station_rows,
+)
+from .vehicles import VehicleProfile
+from .workers import StationPool
+
+FAKE_ROUTE = {
+    "routes": [
+        {
+            "summary": {"distance": 1000.0, "duration": 60.0},
+            "segments": [
+                {
+                    "distance": 1000.0,
+                    "duration": 60.0,
+                    "steps": [
+                        {
+                            "distance": 1000.0,
+                            "duration": 60.0,
+                            "type": 11,
+                            "instruction": "Head west",
+                            "name": "-",
+                            "way_points": [0, 2],
+                        }
+                    ],
+                }
+            ],
+            "geometry": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+        }
+    ]
+}
+
+
+class FakeDirectionsServer:
+    """
+    Local stand-in for the OpenRouteService directions API, answers every POST with `route`
+    after first failing with the statuses in `failures`.
+    """
+
+    def __init__(self, failures=(), route=FAKE_ROUTE):
+        self.failures = list(failures)
+        self.route = route
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                server.requests.append((self.path, json.loads(self.rfile.read(length))))
+                status_code = server.failures.pop(0) if server.failures else 200
+                body = json.dumps(server.route if status_code == 200 else {}).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
 
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
 
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@contextmanager
+def fake_directions(failures=(), route=FAKE_ROUTE, **client):
+    """
+    Routes the requests of the block to a `FakeDirectionsServer` through an empty route cache,
+    `client` overrides `ORS_CLIENT` options. Yields the server.
+    """
+    with FakeDirectionsServer(failures, route) as server:
+        with (
+            override_settings(ORS_CLIENT={"BASE_URL": server.url, **client}),
+            mock.patch("api.utils.get_route_cache", return_value=LocMemRouteCache()),
+        ):
+            yield server
+
+
+# directions responses replayed for `RouteOptimizerTest`, built in the ORS format along the parallel of each
+# request. `ROUTING_MODE=record` with an ORS token records the real roads instead, the expectations then differ.
+ROUTE_FIXTURES = "./api/fixtures/routes"
+
+
+@override_settings(
+    ROUTING={
+        "MODE": os.getenv("ROUTING_MODE", "replay"),
+        "FIXTURE_DIR": ROUTE_FIXTURES,
+    }
+)
 class RouteOptimizerTest(APITestCase):
     def setUp(self):
         self.url = reverse("find_optimal_route")
@@ -42,17 +204,18 @@ class RouteOptimizerTest(APITestCase):
         # check response code
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        # check stops returned
+        # check stops returned, the station is on the route half a degree of longitude past the start,
+        # the great-circle length of that stretch of the parallel
         self.assertEqual(
             response.data["stops"],
             [
                 {
-                    "distance": 35969,
+                    "distance": 46667,
                     "price": 3.00733333,
                     "Truckstop_Name": "WOODSHED OF BIG CABIN",
                     "Address": "I-44, EXIT 283 & US-69",
-                    "lat": 32.75175,
-                    "lng": -98.90258,
+                    "lat": 32.92599,
+                    "lng": -99.22488,
                 }
             ],
         )
@@ -62,3 +225,1463 @@ class RouteOptimizerTest(APITestCase):
 
         # check total cost
         self.assertEqual(response.data["total_cost"], 150.85986459379134)
+
+
+def ground_truth(route_line, lng, lat, step=0.0005):
+    """
+    Great-circle distance of each point to a route and along the route to its nearest point, found by sampling
+    the route every `step` degrees (about 50 meters).
+    """
+    samples = shapely.get_coordinates(shapely.segmentize(route_line, step))
+    along = route_distances(samples)
+    offsets, nearest = [], []
+    for chunk in range(0, len(lng), 100):
+        part = slice(chunk, chunk + 100)
+        distances = haversine(
+            lng[part, None], lat[part, None], samples[:, 0], samples[:, 1]
+        )
+        nearest.append(distances.argmin(axis=1))
+        offsets.append(distances.min(axis=1))
+    nearest = np.concatenate(nearest)
+    return np.concatenate(offsets), along[nearest]
+
+
+def station_table(lng, lat, price=None):
+    n = len(lng)
+    return StationTable(
+        ids=np.arange(n),
+        lng=np.asarray(lng, dtype=float),
+        lat=np.asarray(lat, dtype=float),
+        price=np.full(n, 3.0) if price is None else np.asarray(price, dtype=float),
+        name_codes=np.arange(n, dtype=np.int32),
+        names=np.array([f"STOP {i}" for i in range(n)], dtype=object),
+        address_codes=np.zeros(n, dtype=np.int32),
+        addresses=np.array(["I-10"], dtype=object),
+    )
+
+
+class RouteStopsTest(APITestCase):
+    def setUp(self):
+        # past the tank range with one station in the corridor, the route needs a stop there
+        line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+        self.route = json.loads(json.dumps(FAKE_ROUTE))
+        self.route["routes"][0]["geometry"] = encode_polyline(line.coords)
+        self.route["routes"][0]["summary"]["distance"] = 850000.0
+        self.sample_data = {"start": "32.5,-99.5", "end": "33.0,-97.0"}
+
+    def post(self, optimizer):
+        with fake_directions(route=self.route) as server:
+            response = self.client.post(
+                reverse("find_optimal_route"),
+                {**self.sample_data, "optimizer": optimizer},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(response.data["total_distance_meters"], 850000.0)
+        (stop,) = response.data["stops"]
+        self.assertEqual(stop["Truckstop_Name"], "WOODSHED OF BIG CABIN")
+        self.assertLess(stop["distance"], MAX_DISTANCE)
+        return stop, response.data["total_cost"]
+
+    def test_greedy_stop(self):
+        stop, total_cost = self.post("greedy")
+
+        # the whole trip is fueled at the only station
+        gallons = 850000.0 * METERS_TO_MILES / 10
+        self.assertAlmostEqual(total_cost, gallons * stop["price"])
+
+    def test_exact_stop(self):
+        stop, total_cost = self.post("exact")
+
+        # only the fuel past the starting tank is bought
+        gallons = (850000.0 - MAX_DISTANCE) * METERS_TO_MILES / 10
+        self.assertAlmostEqual(stop["gallons"], gallons, places=4)
+        self.assertAlmostEqual(total_cost, gallons * stop["price"], places=4)
+
+
+class CorridorDistanceTest(SimpleTestCase):
+    def test_corridor_width_in_meters(self):
+        # a north-south route, stations due east just inside and outside 100 km at several latitudes
+        route_line = LineString([(-100.0, 28.0), (-100.0, 49.0)])
+        lat = np.repeat(np.arange(30.0, 48.0, 2.0), 4)
+        km = np.tile([60.0, 99.0, 101.0, 140.0], len(lat) // 4)
+        lng = -100.0 + np.degrees(km * 1000 / (EARTH_RADIUS * np.cos(np.radians(lat))))
+        table = station_table(lng, lat)
+
+        corridor = corridor_stations(route_line, 100000, table)
+
+        offsets, along = ground_truth(route_line, table.lng, table.lat)
+        self.assertEqual(
+            sorted(corridor["index"].tolist()),
+            np.flatnonzero(offsets <= 100000).tolist(),
+        )
+        # the degree conversion alone would have dropped most of these
+        self.assertGreater(len(corridor["index"]), len(lat) // 4 * 2 - 1)
+        np.testing.assert_allclose(
+            corridor["offset"], offsets[corridor["index"]], rtol=0.005
+        )
+        # the projected point sits on the station's parallel, a little short of the great-circle foot
+        np.testing.assert_allclose(
+            corridor["distance"], along[corridor["index"]], rtol=0, atol=1000
+        )
+
+    def test_diagonal_route(self):
+        route_line = LineString([(-118.2, 34.0), (-104.9, 39.7), (-87.6, 41.9)])
+        rng = np.random.default_rng(0)
+        table = station_table(rng.uniform(-120, -85, 1000), rng.uniform(30, 45, 1000))
+
+        corridor = corridor_stations(route_line, 100000, table)
+
+        offsets, along = ground_truth(route_line, table.lng, table.lat, step=0.002)
+        inside = set(corridor["index"].tolist())
+        # only stations within a few hundred meters of the boundary may disagree
+        for i in np.flatnonzero(np.abs(offsets - 100000) > 500):
+            self.assertEqual(i in inside, offsets[i] <= 100000)
+        np.testing.assert_allclose(
+            corridor["offset"], offsets[corridor["index"]], rtol=0.005, atol=100
+        )
+        np.testing.assert_allclose(
+            corridor["distance"], along[corridor["index"]], rtol=0, atol=1000
+        )
+
+
+class FindStationsOnRouteTest(SimpleTestCase):
+    def test_index_matches_full_scan(self):
+        route_line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+        max_distance = 100000
+
+        stations = find_stations_on_route(route_line, max_distance)
+
+        # every station within range found by scanning the whole table
+        table = station_data.snapshot()
+        offsets = ground_truth(route_line, table.lng, table.lat, step=0.002)[0]
+        expected = table.names[table.name_codes][offsets <= max_distance]
+        self.assertEqual(
+            sorted(s["Truckstop_Name"] for s in stations), sorted(expected)
+        )
+        self.assertGreater(len(stations), 0)
+
+    def test_corridor_columns(self):
+        route_line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+
+        corridor = corridor_stations(route_line, max_distance=100000)
+        stations = find_stations_on_route(route_line, max_distance=100000)
+
+        # columns line up with the row-oriented result
+        self.assertEqual(
+            corridor["distance"].tolist(), [s["distance"] for s in stations]
+        )
+        self.assertTrue((corridor["offset"] <= 100000).all())
+        self.assertTrue((corridor["distance"][:-1] <= corridor["distance"][1:]).all())
+
+
+class CorridorCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = CorridorCache(max_entries=2)
+        patcher = mock.patch("api.utils.get_corridor_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_lane_skips_corridor(self):
+        route_line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+
+        with mock.patch(
+            "api.utils.corridor_stations_many", wraps=corridor_stations_many
+        ) as corridor:
+            first = find_stations_on_route(route_line)
+            second = find_stations_on_route(LineString(route_line.coords))
+
+        self.assertEqual(corridor.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_key_and_eviction(self):
+        route_line = LineString([(-99.5, 32.5), (-98.5, 33.5)])
+        key = self.cache.make_key(route_line, 100000, 1)
+
+        self.assertNotEqual(key, self.cache.make_key(route_line, 50000, 1))
+        self.assertNotEqual(key, self.cache.make_key(route_line, 100000, 2))
+
+        # least recently used first
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_cleared_on_geometry_reload(self):
+        self.cache.set("a", 1)
+        with mock.patch("api.cache._corridor_cache", self.cache):
+            # price-only reloads keep the corridors
+            for geometry_changed, entries in [(False, 1), (True, 0)]:
+                stations_reloaded.send(
+                    sender=StationDataManager,
+                    manager=station_data,
+                    version=station_data.version + 1,
+                    geometry_changed=geometry_changed,
+                )
+                self.assertEqual(len(self.cache), entries)
+
+
+class CalculateMinCostStopsTest(SimpleTestCase):
+    def setUp(self):
+        self.stations = [
+            {"distance": 100000, "price": 3.50, "Truckstop_Name": "Station A"},
+            {"distance": 300000, "price": 3.20, "Truckstop_Name": "Station B"},
+            {"distance": 600000, "price": 3.40, "Truckstop_Name": "Station C"},
+        ]
+
+    def test_partial_fill_at_cheapest_station(self):
+        stops, total_cost = calculate_min_cost_stops(self.stations, 1000000)
+
+        # only the fuel missing after the starting tank is bought, all of it at B
+        self.assertEqual([s["Truckstop_Name"] for s in stops], ["Station B"])
+        self.assertAlmostEqual(stops[0]["gallons"], 12.1371192190976)
+        self.assertAlmostEqual(total_cost, 12.1371192190976 * 3.20)
+
+        # never more expensive than the greedy stops on the same basis: the starting fuel is free and every
+        # stop buys the fuel burnt up to the next one
+        greedy_stops, _ = calculate_optimal_stops(self.stations, 1000000)
+        ends = [stop["distance"] for stop in greedy_stops[1:]] + [1000000]
+        greedy_cost = sum(
+            (end - stop["distance"]) * METERS_TO_MILES / 10 * stop["price"]
+            for stop, end in zip(greedy_stops, ends)
+        )
+        self.assertLess(total_cost, greedy_cost)
+
+    def test_no_stops_needed(self):
+        self.assertEqual(calculate_min_cost_stops(self.stations, 800000), ([], 0.0))
+
+    def test_unable_to_reach_next_station(self):
+        self.assertEqual(
+            calculate_min_cost_stops(self.stations, 1000000, start_fuel=50000),
+            (None, None),
+        )
+
+
+class VehicleProfileTest(SimpleTestCase):
+    def vehicle(self, value):
+        serializer = RouteOptimizerSerializer(
+            data={"start": "0,0", "end": "0,1", "vehicle": value}
+        )
+        if not serializer.is_valid():
+            return serializer.errors["vehicle"]
+        return serializer.validated_data["vehicle"]
+
+    def test_vehicle_field(self):
+        self.assertEqual(
+            self.vehicle("hgv-sleeper"), VehicleProfile.from_settings("hgv-sleeper")
+        )
+        self.assertIn("Unknown vehicle profile", str(self.vehicle("scooter")))
+
+        # missing fields come from the default profile, the range follows the tank
+        vehicle = self.vehicle({"mpg": 6.5, "tank_gallons": 150, "start_fuel": 0.5})
+        self.assertEqual(vehicle.routing_profile, "driving-car")
+        self.assertAlmostEqual(vehicle.range_miles, 975)
+        self.assertAlmostEqual(
+            vehicle.optimizer_options()["start_fuel"], 975 / 2 / METERS_TO_MILES
+        )
+
+        self.assertIn("range_miles", self.vehicle({"mpg": 5, "range_miles": 300}))
+        self.assertIn("routing_profile", self.vehicle({"routing_profile": "bike"}))
+
+        serializer = RouteOptimizerSerializer(data={"start": "0,0", "end": "0,1"})
+        self.assertTrue(serializer.is_valid())
+        self.assertAlmostEqual(
+            serializer.validated_data["vehicle"].tank_range, MAX_DISTANCE, delta=0.01
+        )
+
+    def test_range_and_start_fuel(self):
+        stations = [
+            {"distance": 100000, "price": 3.50},
+            {"distance": 300000, "price": 3.20},
+            {"distance": 600000, "price": 3.40},
+        ]
+
+        # the starting fuel only reaches the first station
+        stops, _ = calculate_optimal_stops(
+            stations, 1000000, tank_range=400000, start_fuel=150000
+        )
+        self.assertEqual([s["distance"] for s in stops], [100000, 300000, 600000])
+
+        # an empty tank is filled at a station at the start
+        at_start = [{"distance": 0, "price": 3.60}, *stations]
+        for optimizer in (calculate_optimal_stops, calculate_min_cost_stops):
+            stops, _ = optimizer(at_start, 1000000, tank_range=400000, start_fuel=0)
+            self.assertEqual(stops[0]["distance"], 0, optimizer.__name__)
+            self.assertEqual(
+                optimizer(stations, 1000000, tank_range=400000, start_fuel=0),
+                (None, None),
+            )
+
+        # the fuel burnt beyond the starting fuel is bought
+        stops, _ = calculate_min_cost_stops(stations, 1000000, start_fuel=100000, mpg=5)
+        self.assertEqual([s["distance"] for s in stops], [100000, 300000])
+        self.assertAlmostEqual(
+            sum(s["gallons"] for s in stops), 900000 * METERS_TO_MILES / 5
+        )
+
+
+class RouteCacheTest(TestCase):
+    def setUp(self):
+        self.line = LineString([(-99.22488, 32.92599), (-100.22488, 32.92599)])
+        self.route = {"routes": [{"summary": {"distance": 1.0, "duration": 1.0}}]}
+
+    def test_key_rounds_coordinates(self):
+        cache = LocMemRouteCache(precision=3)
+        self.assertEqual(
+            cache.make_key([(-99.224881, 32.925991), (-100.2, 32.9)]),
+            cache.make_key([(-99.224879, 32.925989), (-100.2, 32.9)]),
+        )
+
+    def test_lru_eviction_and_counters(self):
+        cache = LocMemRouteCache(max_entries=2)
+        cache.set("a", (self.line, self.route))
+        cache.set("b", (self.line, self.route))
+        cache.get("a")
+        cache.set("c", (self.line, self.route))
+
+        # "b" was the least recently used entry
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1})
+
+    def test_expired_entries_are_misses(self):
+        cache = LocMemRouteCache(timeout=0)
+        cache.set("a", (self.line, self.route))
+        self.assertIsNone(cache.get("a"))
+
+    def test_database_backend_round_trip(self):
+        cache = DatabaseRouteCache(max_entries=1)
+        cache.set("a", (self.line, self.route))
+        cache.set("b", (self.line, self.route))
+
+        line, route = cache.get("b")
+        self.assertTrue(line.equals(self.line))
+        self.assertEqual(route, self.route)
+        self.assertIsNone(cache.get("a"))
+
+    def test_django_backend_clears_only_routes(self):
+        cache = DjangoRouteCache()
+        caches["default"].set("session", "kept")
+        cache.set("a", (self.line, self.route))
+        self.assertIsNotNone(cache.get("a"))
+
+        cache.clear()
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(caches["default"].get("session"), "kept")
+        cache.set("a", (self.line, self.route))
+        self.assertIsNotNone(cache.get("a"))
+
+    def test_cache_hit_skips_routing_service(self):
+        cache = LocMemRouteCache()
+        coords = [(-99.22488, 32.92599), (-100.22488, 32.92599)]
+        cache.set(cache.make_key(coords), (self.line, self.route))
+
+        with (
+            mock.patch("api.utils.get_route_cache", return_value=cache),
+            mock.patch("api.utils.get_routing_backend") as backend,
+        ):
+            line, route = get_route(coords)
+
+        backend.assert_not_called()
+        self.assertIs(line, self.line)
+
+
+class RoutingBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.coords = [(-120.2, 38.5), (-126.453, 43.252)]
+
+    def test_record_then_replay(self):
+        with FakeDirectionsServer() as server:
+            with override_settings(
+                ORS_CLIENT={"BASE_URL": server.url},
+                ROUTING={"MODE": "record", "FIXTURE_DIR": self.tmp.name},
+            ):
+                recorded = get_routing_backend().directions(self.coords, radiuses=5000)
+
+        # the server is gone, replay needs no network
+        with override_settings(
+            ORS_CLIENT={"BASE_URL": server.url},
+            ROUTING={"MODE": "replay", "FIXTURE_DIR": self.tmp.name},
+        ):
+            backend = get_routing_backend()
+            self.assertEqual(backend.directions(self.coords, radiuses=5000), recorded)
+            self.assertEqual(
+                async_to_sync(backend.directions_async)(self.coords, radiuses=5000),
+                recorded,
+            )
+
+            # a different request was never recorded
+            with self.assertRaises(FixtureNotFound):
+                backend.directions(self.coords, radiuses=1000)
+
+
+class GraphRoutingBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # a square, the road through B is faster than the one through D
+        lng, lat = [-99.0, -98.0, -98.0, -99.0], [32.0, 32.0, 33.0, 33.0]
+        source, target = [0, 1, 0, 3], [1, 2, 3, 2]
+        length = [100000.0, 120000.0, 120000.0, 100000.0]
+        duration = [3500.0, 4000.0, 8000.0, 7000.0]
+        names = ["I-20", "US-83", "Local Rd", "Local Rd"]
+        RoadGraph.from_edges(
+            lng,
+            lat,
+            source + target,
+            target + source,
+            length * 2,
+            duration * 2,
+            names * 2,
+        ).save(self.tmp.name)
+        self.routing = {
+            "BACKEND": "api.routing.GraphRoutingBackend",
+            "OPTIONS": {"PATH": self.tmp.name},
+        }
+
+    def test_get_route_offline(self):
+        coords = [(-99.001, 32.001), (-98.0, 33.0)]
+        with (
+            override_settings(ROUTING=self.routing),
+            mock.patch("api.utils.get_route_cache", return_value=LocMemRouteCache()),
+        ):
+            line, route = get_route(coords)
+
+        self.assertEqual(line.coords[:], [(-99.0, 32.0), (-98.0, 32.0), (-98.0, 33.0)])
+        self.assertEqual(route["routes"][0]["summary"]["distance"], 220000.0)
+        self.assertEqual(route["routes"][0]["summary"]["duration"], 7500.0)
+        steps = route["routes"][0]["segments"][0]["steps"]
+        self.assertEqual([step["name"] for step in steps], ["I-20", "US-83", "-"])
+        self.assertEqual(
+            [step["way_points"] for step in steps], [[0, 1], [1, 2], [2, 2]]
+        )
+
+    def test_coordinates_off_the_graph(self):
+        with override_settings(ROUTING=self.routing):
+            with self.assertRaises(NoRouteFound):
+                get_routing_backend().directions(
+                    [(-97.0, 32.0), (-98.0, 33.0)], radiuses=5000
+                )
+
+
+class ORSClientTest(SimpleTestCase):
+    def test_session_is_shared(self):
+        with override_settings(ORS_CLIENT={"BASE_URL": "http://127.0.0.1:1"}):
+            self.assertIs(get_session(), get_session())
+
+    def test_get_route_against_local_server(self):
+        coords = [(-120.2, 38.5), (-126.453, 43.252)]
+        with fake_directions(failures=[503], BACKOFF_FACTOR=0) as server:
+            line, route = get_route(coords)
+
+        # the 503 was retried by the session
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[-1][0], "/v2/directions/driving-car/json")
+        self.assertEqual(
+            server.requests[-1][1]["coordinates"], [list(c) for c in coords]
+        )
+        self.assertEqual(
+            list(line.coords), [(-120.2, 38.5), (-120.95, 40.7), (-126.453, 43.252)]
+        )
+        self.assertEqual(route, FAKE_ROUTE)
+
+
+class PolylineTest(SimpleTestCase):
+    def test_decode_array(self):
+        coordinates = decode_polyline_array("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+        self.assertEqual(coordinates.shape, (3, 2))
+        self.assertEqual(
+            coordinates.tolist(),
+            [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]],
+        )
+        self.assertEqual(
+            decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")["coordinates"],
+            coordinates.tolist(),
+        )
+
+    def test_round_trip_3d(self):
+        points = [[-99.22488, 32.92599, 412.3], [-100.22488, 32.92599, 398.0]]
+
+        coordinates = decode_polyline_array(encode_polyline(points, is3d=True), True)
+
+        self.assertEqual(coordinates.tolist(), points)
+
+    def test_truncated_polyline(self):
+        with self.assertRaises(ValueError):
+            decode_polyline_array("_p~iF~ps|U_ulLnnqC_mqNvxq")
+
+
+class RouteBatchOptimizerTest(APITestCase):
+    def setUp(self):
+        self.url = reverse("find_optimal_route_batch")
+
+    def test_per_item_results(self):
+        lane = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+        sample_data = {"routes": [lane, {"start": "91,0", "end": "0,0"}, lane]}
+
+        with fake_directions() as server:
+            response = self.client.post(self.url, sample_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, invalid, duplicate = response.data["results"]
+
+        # the duplicate lane was only routed once
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(first, duplicate)
+        self.assertEqual(first["status"], status.HTTP_200_OK)
+        self.assertEqual(first["data"]["stops"], [])
+        self.assertEqual(first["data"]["total_distance_meters"], 1000.0)
+
+        # the invalid item fails on its own
+        self.assertEqual(invalid["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertIn("start", invalid["error"]["details"])
+
+    def test_vehicles_share_the_corridor(self):
+        lane = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+        sample_data = {
+            "routes": [
+                lane,
+                {**lane, "vehicle": {"mpg": 6, "start_fuel": 0.5}},
+                {**lane, "vehicle": "hgv-sleeper"},
+            ]
+        }
+
+        with (
+            fake_directions() as server,
+            mock.patch("api.utils.get_corridor_cache", return_value=CorridorCache()),
+            mock.patch(
+                "api.utils.corridor_stations_many",
+                wraps=corridor_stations_many,
+            ) as corridor,
+        ):
+            response = self.client.post(self.url, sample_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["status"] for item in response.data["results"]], [200] * 3
+        )
+
+        # one route per routing profile, one corridor for the same geometry
+        self.assertEqual(
+            sorted(path for path, _ in server.requests),
+            ["/v2/directions/driving-car/json", "/v2/directions/driving-hgv/json"],
+        )
+        self.assertEqual(sum(len(call.args[0]) for call in corridor.call_args_list), 1)
+
+    def test_stage_failures_per_item(self):
+        lane = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+        sample_data = {
+            "routes": [
+                lane,
+                {**lane, "save": True},
+                {"start": "38.5,-121.2", "end": "43.252,-126.453"},
+            ]
+        }
+        lines = {
+            -120.2: LineString(
+                decode_polyline_array(FAKE_ROUTE["routes"][0]["geometry"])
+            ),
+            -121.2: LineString([(-121.2, 38.5), (-126.453, 43.252)]),
+        }
+
+        def find_stations(route_lines):
+            if any(line.equals(lines[-121.2]) for line in route_lines):
+                raise ValueError("corridor failed")
+            return [[] for _ in route_lines]
+
+        with (
+            mock.patch(
+                "api.pipeline.get_route",
+                side_effect=lambda coords, profile: (lines[coords[0][0]], FAKE_ROUTE),
+            ),
+            mock.patch(
+                "api.pipeline.find_stations_on_routes", side_effect=find_stations
+            ) as corridor,
+            mock.patch(
+                "api.pipeline.save_planned_route",
+                side_effect=DatabaseError("database is locked"),
+            ),
+        ):
+            response = self.client.post(self.url, sample_data, format="json")
+
+        # one corridor pass for both lanes, retried lane by lane when it fails
+        self.assertEqual(
+            [len(call.args[0]) for call in corridor.call_args_list], [2, 1, 1]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, saved, other = response.data["results"]
+        self.assertEqual(first["status"], status.HTTP_200_OK)
+        self.assertEqual(saved["status"], status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(saved["error"]["detail"], "Unable to save the route.")
+        self.assertEqual(other["status"], status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(
+            other["error"]["detail"], "Unable to find fueling stations in route"
+        )
+
+    def test_empty_batch(self):
+        response = self.client.post(self.url, {"routes": []}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StreamingResponseTest(APITestCase):
+    def post(self, url, sample_data, **extra):
+        with fake_directions():
+            response = self.client.post(url, sample_data, format="json", **extra)
+            if response.streaming:
+                # the records are computed as the body is read
+                lines = b"".join(response.streaming_content).splitlines()
+                return response, [json.loads(line) for line in lines]
+            return response, None
+
+    def test_batch_records(self):
+        lane = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+        sample_data = {"routes": [lane, {"start": "91,0", "end": "0,0"}, lane]}
+        url = reverse("find_optimal_route_batch")
+
+        response, records = self.post(
+            url, sample_data, HTTP_ACCEPT="application/x-ndjson"
+        )
+        buffered, _ = self.post(url, sample_data)
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        # invalid items are sent before any lane is routed
+        self.assertEqual(records[0]["index"], 1)
+        self.assertEqual(records[0]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [
+                {key: value for key, value in record.items() if key != "index"}
+                for record in sorted(records, key=lambda record: record["index"])
+            ],
+            json.loads(json.dumps(buffered.data["results"])),
+        )
+
+    def test_batch_failure_records(self):
+        sample_data = {
+            "routes": [
+                {"start": "38.5,-120.2", "end": "43.252,-126.453"},
+                {"start": "38.5,-121.2", "end": "43.252,-126.453"},
+            ]
+        }
+
+        def find_stations(route_lines):
+            if route_lines[0].coords[0][0] == -121.2:
+                raise ValueError("corridor failed")
+            return [[]]
+
+        with (
+            mock.patch(
+                "api.pipeline.get_route",
+                side_effect=lambda coords, profile: (LineString(coords), FAKE_ROUTE),
+            ),
+            mock.patch(
+                "api.pipeline.find_stations_on_routes", side_effect=find_stations
+            ),
+        ):
+            response = self.client.post(
+                reverse("find_optimal_route_batch"),
+                sample_data,
+                format="json",
+                HTTP_ACCEPT="application/x-ndjson",
+            )
+            records = [
+                json.loads(line)
+                for line in b"".join(response.streaming_content).splitlines()
+            ]
+
+        # the failing lane is an error record, the stream goes on
+        self.assertEqual(
+            sorted((record["index"], record["status"]) for record in records),
+            [(0, status.HTTP_200_OK), (1, status.HTTP_500_INTERNAL_SERVER_ERROR)],
+        )
+
+    def test_route_records(self):
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+        url = reverse("find_optimal_route")
+
+        response, records = self.post(url + "?format=ndjson", sample_data)
+        buffered, _ = self.post(url, sample_data)
+
+        # the segments follow the rest of the body, one record each
+        head, *segments = records
+        self.assertNotIn("segments", head["route"])
+        self.assertEqual([segment.pop("segment") for segment in segments], [0])
+        head["route"]["segments"] = segments
+        self.assertEqual(head, json.loads(json.dumps(buffered.data)))
+
+    def test_error_record(self):
+        response = self.client.post(
+            reverse("find_optimal_route") + "?format=ndjson", {"start": "91,0"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.content.count(b"\n"), 1)
+        self.assertIn("start", json.loads(response.content)["details"])
+
+
+class AsyncRouteOptimizerTest(SimpleTestCase):
+    def setUp(self):
+        self.url = reverse("find_optimal_route_async")
+
+    def test_async_route(self):
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+
+        with fake_directions(failures=[429], BACKOFF_FACTOR=0) as server:
+            response = self.client.post(
+                self.url, sample_data, content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(response.json()["stops"], [])
+        self.assertEqual(response.json()["total_distance_meters"], 1000.0)
+
+    def test_invalid_input(self):
+        response = self.client.post(
+            self.url, {"start": "91,0"}, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()["error"], "Invalid input")
+
+    def test_csrf_exempt(self):
+        # API clients post without a CSRF cookie, as they do to the DRF views
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(
+            self.url, {"start": "91,0"}, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StationPoolTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(0)
+        cls.table = station_table(
+            rng.uniform(-106, -94, 2000),
+            rng.uniform(30, 36, 2000),
+            rng.uniform(2.8, 4.2, 2000).round(3),
+        )
+        cls.pool = StationPool(workers=1, stations=lambda: cls.table)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        super().tearDownClass()
+
+    def plan_in_process(self, line, route, vehicle):
+        corridor = corridor_stations(line, 100000, self.table)
+        return optimize_stops(
+            station_rows(corridor, self.table), route, "exact", vehicle
+        )
+
+    def test_matches_in_process_stages(self):
+        line = LineString([(-105.5, 32.0), (-100.0, 33.5), (-94.5, 32.5)])
+        route = {"routes": [{"summary": {"distance": 1100000.0}}]}
+        vehicle = VehicleProfile(tank_gallons=30, start_fuel=0.5)
+
+        stops, total_cost = self.pool.plan_stops(line, route, "exact", vehicle)
+
+        self.assertGreater(len(stops), 1)
+        self.assertEqual(
+            (stops, total_cost), self.plan_in_process(line, route, vehicle)
+        )
+
+        # a price reload is shared again, the workers keep their index
+        repriced = StationTable(
+            **{name: getattr(self.table, name) for name in STORE_ARRAYS}
+        )
+        repriced.price = self.table.price * 2
+        repriced.share_geometry(self.table)
+        original, type(self).table = self.table, repriced
+        try:
+            stops, repriced_cost = self.pool.plan_stops(line, route, "exact", vehicle)
+        finally:
+            type(self).table = original
+        self.assertAlmostEqual(repriced_cost, total_cost * 2)
+        self.assertEqual(len(self.pool._shared), 2)
+
+    def test_corridor_for_saving(self):
+        line = LineString([(-105.5, 32.0), (-100.0, 33.5), (-94.5, 32.5)])
+        route = {"routes": [{"summary": {"distance": 1100000.0}}]}
+        vehicle = VehicleProfile(tank_gallons=30, start_fuel=0.5)
+
+        stops, total_cost, corridor = self.pool.plan_stops(
+            line, route, "exact", vehicle, with_corridor=True
+        )
+
+        self.assertEqual(
+            (stops, total_cost), self.plan_in_process(line, route, vehicle)
+        )
+        self.assertEqual(corridor.pop("geometry_key"), self.table.geometry_key)
+        expected = corridor_stations(line, 100000, self.table)
+        for name in PLANNED_CORRIDOR_COLUMNS:
+            np.testing.assert_array_equal(corridor[name], expected[name])
+
+    def test_no_stations_in_range(self):
+        line = LineString([(-120.0, 45.0), (-110.0, 45.0)])
+        route = {"routes": [{"summary": {"distance": 2000000.0}}]}
+
+        with self.assertRaises(StationException):
+            self.pool.plan_stops(line, route, "greedy")
+
+
+class StationTableTest(SimpleTestCase):
+    def test_store_round_trip(self):
+        stations = StationTable.from_csv("./api/data/test.csv")
+
+        with tempfile.TemporaryDirectory() as path:
+            stations.save(path)
+            loaded = StationTable.load(path)
+
+            self.assertEqual(len(loaded), len(stations))
+            for name in ("ids", "lng", "lat", "price"):
+                self.assertEqual(
+                    getattr(loaded, name).tolist(), getattr(stations, name).tolist()
+                )
+            self.assertEqual(
+                loaded.names_at([0, 1]).tolist(),
+                ["WOODSHED OF BIG CABIN", "KWIK TRIP #796"],
+            )
+            self.assertEqual(
+                loaded.index.query(shapely.box(-99.3, 32.9, -99.2, 33.0)).tolist(),
+                [0],
+            )
+
+
+class StationDataManagerTest(APITestCase):
+    def setUp(self):
+        self.stations = StationTable.from_csv("./api/data/test.csv")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stations.save(self.tmp.name)
+        self.manager = StationDataManager(self.tmp.name, "./api/data/test.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_price_reload_keeps_geometry(self):
+        before = self.manager.snapshot()
+
+        self.stations.price = self.stations.price + 0.25
+        self.stations.save(self.tmp.name)
+        with mock.patch("api.stations.np.load", wraps=np.load) as load:
+            self.manager.reload(wait=True)
+        after = self.manager.snapshot()
+
+        # in-flight holders of the old snapshot still see the old prices
+        self.assertAlmostEqual(after.price[0] - before.price[0], 0.25)
+        self.assertIs(after.index, before.index)
+        self.assertEqual(self.manager.version, 2)
+
+        # only the prices were read, every other column is the current one
+        self.assertEqual(
+            [os.path.basename(call.args[0]) for call in load.call_args_list],
+            ["price.npy"],
+        )
+        for name in STORE_ARRAYS:
+            if name != "price":
+                self.assertIs(getattr(after, name), getattr(before, name))
+
+    def test_geometry_reload_rebuilds_index(self):
+        before = self.manager.snapshot()
+
+        self.stations.lng = self.stations.lng + 1.0
+        self.stations.save(self.tmp.name)
+        self.manager.reload(wait=True)
+
+        self.assertIsNot(self.manager.snapshot().index, before.index)
+
+    def test_reload_during_store_write_keeps_table(self):
+        before = self.manager.snapshot()
+
+        # `save` replaced the price file, the manifest still lists the previous prices
+        target = os.path.join(self.tmp.name, "price.npy")
+        with open(f"{target}.tmp", "wb") as f:
+            np.save(f, self.stations.price + 0.25)
+        os.replace(f"{target}.tmp", target)
+        self.manager.reload(wait=True)
+
+        # the manifest lists the current arrays, none of the new files is read
+        self.assertIs(self.manager.snapshot().price, before.price)
+
+        # without a current table to reuse, the store is refused
+        manager = StationDataManager(self.tmp.name, "./api/data/test.csv")
+        with self.assertRaises(StoreMismatch):
+            manager.snapshot()
+
+    def test_reload_requires_admin(self):
+        response = self.client.post(reverse("reload_stations"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SingleFlightTest(SimpleTestCase):
+    def run_concurrently(self, calls):
+        results = [None] * len(calls)
+
+        def run(i, call):
+            results[i] = call()
+
+        threads = [
+            threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        computation = mock.Mock(side_effect=lambda: release.wait() and "route")
+
+        threads, results = self.run_concurrently(
+            [lambda: flight.do("lane", computation)] * 5
+        )
+        # the waiting callers are counted before the computation is released
+        while flight.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(computation.call_count, 1)
+        self.assertEqual(results, ["route"] * 5)
+        self.assertEqual(flight.do("lane", lambda: "next"), "next")
+
+    def test_processes_coordinate_through_cache(self):
+        cache = caches["default"]
+        leader, follower = SingleFlight(cache), SingleFlight(cache, poll_interval=0.001)
+        started, release = threading.Event(), threading.Event()
+
+        def compute():
+            started.set()
+            release.wait()
+            return "route"
+
+        threads, results = self.run_concurrently(
+            [
+                lambda: leader.do("lane", compute),
+                lambda: started.wait() and follower.do("lane", lambda: "own"),
+            ]
+        )
+        started.wait()
+        time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["route", "route"])
+        self.assertEqual(follower.coalesced_remote, 1)
+
+
+class WaypointsTest(APITestCase):
+    def setUp(self):
+        # two legs along the equator, the waypoint at 1 degree east
+        segment = FAKE_ROUTE["routes"][0]["segments"][0]
+        self.route = {
+            "routes": [
+                {
+                    "summary": {"distance": 222390.0, "duration": 7200.0},
+                    "segments": [
+                        {
+                            **segment,
+                            "steps": [{**segment["steps"][0], "way_points": [0, 1]}],
+                        },
+                        {
+                            **segment,
+                            "steps": [{**segment["steps"][0], "way_points": [1, 2]}],
+                        },
+                    ],
+                    "geometry": encode_polyline([(0, 0), (1, 0), (2, 0)]),
+                }
+            ]
+        }
+        self.line = LineString([(0, 0), (1, 0), (2, 0)])
+        self.stops = [
+            {
+                "distance": distance,
+                "price": 3.0,
+                "Truckstop_Name": "STOP",
+                "Address": "I-10",
+                "lat": 0.0,
+                "lng": distance / DEG_TO_M,
+            }
+            for distance in (50000, int(DEG_TO_M), 150000)
+        ]
+
+    def test_stop_legs(self):
+        # a stop at the waypoint opens the next leg
+        self.assertEqual(stop_legs(self.stops, self.route, self.line), [0, 1, 1])
+        self.assertEqual(stop_legs(self.stops, self.route), [0, 1, 1])
+        self.assertIsNone(stop_legs(self.stops, FAKE_ROUTE))
+
+        response_data = build_response_data(self.route, self.stops, 0.0)
+        self.assertEqual([stop["leg"] for stop in response_data["stops"]], [0, 1, 1])
+        serializer = RouteOptimizerResponseSerializer(data=response_data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_one_route_and_corridor_for_the_trip(self):
+        sample_data = {
+            "start": "0,0",
+            "waypoints": ["0,1"],
+            "end": "0,2",
+        }
+
+        with (
+            mock.patch(
+                "api.views.get_route", return_value=(self.line, self.route)
+            ) as get_route,
+            mock.patch(
+                "api.views.find_stations_on_route", return_value=self.stops
+            ) as find_stations,
+            mock.patch(
+                "api.pipeline.OPTIMIZERS",
+                {"greedy": mock.Mock(return_value=(self.stops[::2], 150.0))},
+            ) as optimizers,
+        ):
+            response = self.client.post(
+                reverse("find_optimal_route"), sample_data, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        get_route.assert_called_once_with(
+            ((0.0, 0.0), (1.0, 0.0), (2.0, 0.0)), "driving-car"
+        )
+        find_stations.assert_called_once_with(self.line)
+        # fuel state is carried across legs, the optimizer sees the whole trip
+        optimizers["greedy"].assert_called_once()
+        self.assertEqual(optimizers["greedy"].call_args.args, (self.stops, 222390.0))
+        self.assertEqual([stop["leg"] for stop in response.data["stops"]], [0, 1])
+
+    def test_form_body(self):
+        # repeated form values are kept, query options only fill what the body leaves out
+        sample_data = {
+            "start": "0,0",
+            "waypoints": ["0,0.5", "0,1"],
+            "end": "0,2",
+            "include": ["segments", "steps"],
+        }
+
+        with (
+            mock.patch(
+                "api.views.get_route", return_value=(self.line, self.route)
+            ) as get_route,
+            mock.patch("api.views.find_stations_on_route", return_value=self.stops),
+            mock.patch(
+                "api.pipeline.OPTIMIZERS",
+                {"greedy": mock.Mock(return_value=(self.stops[::2], 150.0))},
+            ),
+        ):
+            response = self.client.post(
+                reverse("find_optimal_route") + "?include=geometry&simplify=10",
+                sample_data,
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        get_route.assert_called_once_with(
+            ((0.0, 0.0), (0.5, 0.0), (1.0, 0.0), (2.0, 0.0)), "driving-car"
+        )
+        self.assertEqual(set(response.data["route"]), {"summary", "segments"})
+        self.assertIn("steps", response.data["route"]["segments"][0])
+
+    def test_waypoint_limit(self):
+        sample_data = {"start": "0,0", "waypoints": ["0,1"] * 49, "end": "0,2"}
+
+        response = self.client.post(
+            reverse("find_optimal_route"), sample_data, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("waypoints", response.data["details"])
+
+
+class PipelineMetricsTest(APITestCase):
+    def test_stage_timings(self):
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+
+        with (
+            fake_directions(),
+            mock.patch(
+                "api.pipeline.OPTIMIZERS",
+                {"greedy": mock.Mock(return_value=([], 0.0))},
+            ) as optimizers,
+        ):
+            response = self.client.post(reverse("find_optimal_route"), sample_data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the optimizer runs once per request
+        self.assertEqual(optimizers["greedy"].call_count, 1)
+
+        stages = [
+            timing.split(";")[0] for timing in response["Server-Timing"].split(", ")
+        ]
+        self.assertEqual(
+            stages, ["validate", "lane", "route", "corridor", "optimize", "serialize"]
+        )
+
+        metrics = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('route_pipeline_stage_seconds_count{stage="optimize"}', metrics)
+        self.assertIn("route_cache_misses_total", metrics)
+        self.assertIn("route_requests_coalesced_total", metrics)
+
+    def test_query_response_options(self):
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453"}
+
+        with (
+            fake_directions(),
+            mock.patch(
+                "api.pipeline.OPTIMIZERS",
+                {"greedy": mock.Mock(return_value=([], 0.0))},
+            ),
+        ):
+            response = self.client.post(
+                reverse("find_optimal_route")
+                + "?include=geometry&geometry_format=geojson",
+                sample_data,
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["route"]), {"summary", "geometry"})
+        self.assertEqual(response.data["route"]["geometry"]["type"], "LineString")
+
+    def test_error_response_timings(self):
+        response = self.client.post(reverse("find_optimal_route"), {"start": "91,0"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response["Server-Timing"].startswith("validate;dur="))
+
+
+class RouteRepriceTest(APITestCase):
+    def setUp(self):
+        # one station in the corridor, the exact optimizer buys a little fuel there
+        self.line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+        self.route = json.loads(json.dumps(FAKE_ROUTE))
+        self.route["routes"][0]["geometry"] = encode_polyline(self.line.coords)
+        self.route["routes"][0]["summary"]["distance"] = 850000.0
+        self.route_id = save_planned_route(
+            self.line, self.route, "exact", response_options({})
+        )
+
+    def repriced_table(self, factor):
+        table = station_data.snapshot()
+        repriced = StationTable(**{name: getattr(table, name) for name in STORE_ARRAYS})
+        repriced.price = table.price * factor
+        repriced.share_geometry(table)
+        return repriced
+
+    def test_reprice_joins_current_prices(self):
+        url = reverse("reprice_route", args=[self.route_id])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["route_id"], str(self.route_id))
+
+        with (
+            mock.patch.object(
+                station_data, "snapshot", return_value=self.repriced_table(2)
+            ),
+            mock.patch("api.pipeline.cached_corridor_stations") as corridor,
+        ):
+            repriced = self.client.post(url)
+
+        # no geometry work, only the prices changed
+        corridor.assert_not_called()
+        self.assertAlmostEqual(
+            repriced.data["total_cost"], response.data["total_cost"] * 2
+        )
+        self.assertIsNotNone(PlannedRoute.objects.get(id=self.route_id).repriced)
+
+    def test_moved_stations_recompute_corridor(self):
+        moved = self.repriced_table(1)
+        moved.geometry_key = "moved"
+
+        with mock.patch.object(station_data, "snapshot", return_value=moved):
+            response = self.client.post(
+                reverse("reprice_route_batch"),
+                {"route_ids": [str(self.route_id), str(uuid.uuid4())]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            [status.HTTP_200_OK, status.HTTP_404_NOT_FOUND],
+        )
+        self.assertEqual(
+            PlannedRoute.objects.get(id=self.route_id).stations_key, "moved"
+        )
+
+    def test_save_from_route_endpoint(self):
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453", "save": True}
+
+        with fake_directions():
+            response = self.client.post(reverse("find_optimal_route"), sample_data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            PlannedRoute.objects.filter(id=response.data["route_id"]).exists()
+        )
+
+    def test_save_pool_corridor(self):
+        # the serving process never located the corridor of a route planned in a worker
+        stations = station_data.snapshot()
+        corridor = corridor_stations(self.line, 100000, stations)
+        pool = mock.Mock()
+        pool.plan_stops.return_value = (
+            [],
+            0.0,
+            {**corridor, "geometry_key": stations.geometry_key},
+        )
+        sample_data = {"start": "38.5,-120.2", "end": "43.252,-126.453", "save": True}
+
+        with (
+            fake_directions(),
+            mock.patch("api.views.get_station_pool", return_value=pool),
+            mock.patch("api.pipeline.cached_corridor_stations") as cached,
+        ):
+            response = self.client.post(reverse("find_optimal_route"), sample_data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(pool.plan_stops.call_args.kwargs["with_corridor"])
+        cached.assert_not_called()
+        planned = PlannedRoute.objects.get(id=response.data["route_id"])
+        self.assertEqual(planned.stations_key, stations.geometry_key)
+        self.assertEqual(
+            json.loads(planned.corridor)["index"], corridor["index"].tolist()
+        )
+
+
+class PrecomputedLaneTest(APITestCase):
+    def setUp(self):
+        # the one-station lane of RouteRepriceTest
+        self.line = LineString([(-99.5, 32.5), (-98.5, 33.5), (-97.0, 33.0)])
+        self.route = json.loads(json.dumps(FAKE_ROUTE))
+        self.route["routes"][0]["geometry"] = encode_polyline(self.line.coords)
+        self.route["routes"][0]["summary"]["distance"] = 850000.0
+        self.payload = {
+            "start": "32.5,-99.5",
+            "end": "33.0,-97.0",
+            "optimizer": "exact",
+        }
+        patcher = mock.patch(
+            "api.lanes.get_route", return_value=(self.line, self.route)
+        )
+        self.get_route = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def repriced_table(self, prices):
+        table = station_data.snapshot()
+        repriced = StationTable(**{name: getattr(table, name) for name in STORE_ARRAYS})
+        repriced.price = prices
+        repriced.share_geometry(table)
+        return repriced
+
+    def test_lane_key(self):
+        def key(**payload):
+            serializer = RouteOptimizerSerializer(data={**self.payload, **payload})
+            serializer.is_valid(raise_exception=True)
+            return lane_key(serializer.validated_data)
+
+        # coordinates are rounded to about a meter, the optimizer and vehicle are part of the lane
+        self.assertEqual(key(), key(start="32.500001,-99.500001"))
+        self.assertNotEqual(key(), key(optimizer="greedy"))
+        self.assertNotEqual(key(), key(vehicle={"mpg": 6}))
+        self.assertEqual(len(key()), PrecomputedLane._meta.get_field("key").max_length)
+
+    def test_serves_precomputed_lane(self):
+        summary = precompute_lanes([self.payload, self.payload])
+        self.assertEqual(summary["routed"], 1)
+        self.get_route.assert_called_once_with(
+            ((-99.5, 32.5), (-97.0, 33.0)), "driving-car", refresh=True
+        )
+
+        with mock.patch("api.views.get_route") as get_route:
+            response = self.client.post(reverse("find_optimal_route"), self.payload)
+
+        get_route.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["stops"]), 1)
+        stages = [
+            timing.split(";")[0] for timing in response["Server-Timing"].split(", ")
+        ]
+        self.assertEqual(stages, ["validate", "lane", "serialize"])
+
+        # nothing changed, nothing is recomputed
+        self.assertEqual(precompute_lanes([self.payload])["current"], 1)
+        self.assertEqual(self.get_route.call_count, 1)
+
+    def test_lookup_without_table(self):
+        data = RouteOptimizerSerializer(data=self.payload)
+        data.is_valid(raise_exception=True)
+
+        with (
+            mock.patch.object(
+                PrecomputedLane.objects,
+                "filter",
+                side_effect=OperationalError("no such table: api_precomputedlane"),
+            ),
+            self.assertLogs("api.lanes", "WARNING"),
+        ):
+            self.assertIsNone(lookup_lane(data.validated_data))
+
+    def test_recomputes_only_what_changed(self):
+        precompute_lanes([self.payload])
+        lane = PrecomputedLane.objects.get()
+        table = station_data.snapshot()
+        on_corridor = load_corridor(lane.corridor)["index"]
+
+        # a price change off the corridor keeps the stops
+        prices = table.price.copy()
+        prices[np.setdiff1d(np.arange(len(table)), on_corridor)[0]] += 1
+        with (
+            mock.patch.object(
+                station_data, "snapshot", return_value=self.repriced_table(prices)
+            ),
+            mock.patch("api.lanes.optimize_stops") as optimize,
+        ):
+            summary = precompute_lanes([self.payload])
+        optimize.assert_not_called()
+        self.assertEqual(summary["checked"], 1)
+
+        # a price change on the corridor re-runs the optimizer on the stored corridor
+        with (
+            mock.patch.object(
+                station_data, "snapshot", return_value=self.repriced_table(prices * 2)
+            ),
+            mock.patch("api.lanes.cached_corridor_stations") as corridor,
+        ):
+            summary = precompute_lanes([self.payload])
+        corridor.assert_not_called()
+        self.assertEqual(summary["optimized"], 1)
+        self.assertAlmostEqual(
+            PrecomputedLane.objects.get().total_cost, lane.total_cost * 2
+        )
+
+        # an expired route is routed again
+        PrecomputedLane.objects.update(route_expires=timezone.now())
+        self.assertEqual(precompute_lanes([self.payload])["routed"], 1)
+        self.assertEqual(self.get_route.call_count, 2)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as lanes:
+            lanes.write(json.dumps(self.payload) + "\n\n" + json.dumps({"start": "x"}))
+            lanes.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("precompute_lanes", lanes.name, stdout=out, stderr=err)
+
+        self.assertIn("1 routed", out.getvalue())
+        self.assertIn("1 failed", out.getvalue())
+        self.assertIn("Lane 2:", err.getvalue())
+        self.assertTrue(PrecomputedLane.objects.exists())
+
+
+class ResponseContractTest(SimpleTestCase):
+    def setUp(self):
+        # routing service fields outside the response schema are dropped
+        self.route = json.loads(json.dumps(FAKE_ROUTE))
+        self.route["routes"][0]["summary"]["distance"] = 1000
+        self.route["routes"][0]["bbox"] = [-126.453, 38.5, -120.2, 43.252]
+        self.route["routes"][0]["segments"][0]["steps"][0]["exit_number"] = 2
+        self.stops = [
+            {
+                "distance": 35969,
+                "price": 3.00733333,
+                "Truckstop_Name": "WOODSHED OF BIG CABIN",
+                "Address": "I-44, EXIT 283 & US-69",
+                "lat": 32.75175,
+                "lng": -98.90258,
+                "gallons": 12.5,
+            }
+        ]
+
+    def test_trusted_body_matches_serializer(self):
+        response_data = build_response_data(self.route, self.stops, 150)
+
+        serializer = RouteOptimizerResponseSerializer(data=response_data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(
+            json.loads(json.dumps(serializer.validated_data)), response_data
+        )
+
+    def test_shaped_bodies_match_serializer(self):
+        for options in [
+            {"include": ()},
+            {"include": ("segments",)},
+            {"include": ("geometry",), "geometry_format": "geojson"},
+            {"simplify": 1000, "geometry_format": "geojson"},
+            {"simplify": 1000},
+        ]:
+            with self.subTest(options=options):
+                response_data = build_response_data(
+                    self.route, self.stops, 150, **options
+                )
+
+                serializer = RouteOptimizerResponseSerializer(data=response_data)
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_response_shaping(self):
+        response_data = build_response_data(
+            self.route, self.stops, 150, include=("segments",)
+        )
+        self.assertEqual(
+            response_data["route"]["segments"], [{"distance": 1000.0, "duration": 60.0}]
+        )
+        self.assertNotIn("geometry", response_data["route"])
+
+        # geojson without simplification is the decoded polyline
+        response_data = build_response_data(
+            self.route, self.stops, 150, geometry_format="geojson"
+        )
+        self.assertEqual(
+            response_data["route"]["geometry"],
+            decode_polyline(self.route["routes"][0]["geometry"]),
+        )
+
+        # the middle point is far off the straight line, a larger tolerance drops it
+        for tolerance, points in [(1000, 3), (1000000, 2)]:
+            response_data = build_response_data(
+                self.route, self.stops, 150, simplify=tolerance
+            )
+            coordinates = decode_polyline(response_data["route"]["geometry"])
+            self.assertEqual(len(coordinates["coordinates"]), points)
+
+    def test_simplify_tolerance_at_latitude(self):
+        # the middle point is 0.02 degrees of longitude off a meridian at 60.5N, about 1.1 km, half of it
+        # at the equator
+        route = json.loads(json.dumps(self.route))
+        route["routes"][0]["geometry"] = encode_polyline(
+            [(10.0, 60.0), (10.02, 60.5), (10.0, 61.0)]
+        )
+        for tolerance, points in [(1000, 3), (1500, 2)]:
+            response_data = build_response_data(
+                route, [], 150, simplify=tolerance, geometry_format="geojson"
+            )
+            coordinates = response_data["route"]["geometry"]["coordinates"]
+            self.assertEqual(len(coordinates), points)
+            self.assertEqual(coordinates[0], [10.0, 60.0])
+
+    def test_validation_only_when_enabled(self):
+        with override_settings(VALIDATE_RESPONSES=False):
+            with mock.patch(
+                "api.pipeline.RouteOptimizerResponseSerializer"
+            ) as serializer:
+                status_code, _ = serialize_response(self.route, self.stops, 150)
+
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        serializer.assert_not_called()
+
+    def test_orjson_renderer(self):
+        response_data = build_response_data(self.route, self.stops, 150)
+
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(response_data)), response_data
+        )
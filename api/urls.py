@@ -1,10 +1,38 @@
 from django.urls import path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from .views import RouteOptimizerView
+from .views import (
+    RouteBatchOptimizerView,
+    RouteBatchRepriceView,
+    RouteOptimizerView,
+    RouteRepriceView,
+    StationReloadView,
+    route_optimizer_async,
+)
 
 urlpatterns = [
     path("schema/", SpectacularAPIView.as_view(), name="schema"),
     path("docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
     path("route/", RouteOptimizerView.as_view(), name="find_optimal_route"),
+    path(
+        "route/async/",
+        route_optimizer_async,
+        name="find_optimal_route_async",
+    ),
+    path("stations/reload/", StationReloadView.as_view(), name="reload_stations"),
+    path(
+        "route/batch/",
+        RouteBatchOptimizerView.as_view(),
+        name="find_optimal_route_batch",
+    ),
+    path(
+        "route/<uuid:route_id>/reprice/",
+        RouteRepriceView.as_view(),
+        name="reprice_route",
+    ),
+    path(
+        "route/reprice/",
+        RouteBatchRepriceView.as_view(),
+        name="reprice_route_batch",
+    ),
 ]
@@ -1,19 +1,77 @@
-import ast
+import bisect
 import math
-import os
+from collections import deque
 
-import openrouteservice
-import pandas as pd
-from dotenv import load_dotenv
-from openrouteservice.directions import directions
-from shapely.geometry import LineString, Point
+import numpy as np
+import shapely
+from asgiref.sync import sync_to_async
+from shapely.geometry import LineString
 
-load_dotenv()
-token = os.getenv("token")
+from .cache import get_corridor_cache, get_route_cache
+from .graph import haversine
+from .routing import get_routing_backend
+from .stations import StationDataManager
 
-FUEL_STATIONS = pd.read_csv("./api/data/test.csv", delimiter=";")
-FUEL_STATIONS = FUEL_STATIONS.dropna(subset=["Geocode"])
-FUEL_STATIONS["Geocode"] = FUEL_STATIONS["Geocode"].apply(ast.literal_eval)
+# current station table, read through `station_data.snapshot()`
+station_data = StationDataManager()
+
+# Constants
+EARTH_RADIUS = 6371000  # Earth's radius in meters
+DEG_TO_M = (2 * math.pi * EARTH_RADIUS) / 360  # Meters per degree
+MAX_DISTANCE = 804672  # vehicle range in meters (500 miles)
+METERS_TO_MILES = 0.000621371192
+MILES_PER_GALLON = 10
+CORRIDOR_BLOCK_SIZE = 256  # route segments per corridor index query
+CORRIDOR_SEGMENT_DEGREES = 0.1  # longest route segment measured in one projection
+
+
+def decode_polyline_array(polyline, is3d=False):
+    """
+    Decodes a Polyline string into a NumPy coordinate array.
+
+    Args:
+        polyline (str): An encoded polyline, only the geometry.
+        is3d (bool, optional): Specifies if geometry contains Z component. Defaults to False.
+
+    Returns:
+        numpy.ndarray: A contiguous float64 array of shape (N, 2) with (longitude, latitude) rows,
+                       or (N, 3) with (longitude, latitude, elevation) rows when `is3d` is set.
+
+    Raises:
+        ValueError: If the polyline is truncated.
+
+    Notes:
+        - The varints are decoded for the whole byte buffer at once: every byte contributes its low 5 bits
+          shifted by its position inside its value, and values end at bytes without the continuation bit.
+        - The output is bit-exact with `decode_polyline`.
+    """
+    dims = 3 if is3d else 2
+    chunks = np.frombuffer(polyline.encode("ascii"), dtype=np.uint8).astype(np.int64)
+    chunks -= 63
+
+    if not len(chunks):
+        return np.empty((0, dims), dtype=np.float64)
+
+    ends = np.flatnonzero(chunks < 0x20)
+    if not len(ends) or ends[-1] != len(chunks) - 1 or len(ends) % dims:
+        raise ValueError("Invalid polyline, the encoded values are truncated.")
+
+    # position of each byte inside its value
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((chunks & 0x1F) << (5 * position), starts)
+
+    # zigzag decode, then accumulate the deltas per column
+    deltas = (values >> 1) ^ -(values & 1)
+    totals = np.cumsum(deltas.reshape(-1, dims), axis=0)
+
+    coordinates = np.empty((len(totals), dims), dtype=np.float64)
+    coordinates[:, 0] = totals[:, 1] / 1e5
+    coordinates[:, 1] = totals[:, 0] / 1e5
+    if is3d:
+        # elevation keeps the python rounding to stay exact
+        coordinates[:, 2] = [round(z * 1e-2, 1) for z in totals[:, 2].tolist()]
+    return coordinates
 
 
 def decode_polyline(polyline, is3d=False):
@@ -25,69 +83,51 @@ def decode_polyline(polyline, is3d=False):
     :returns: GeoJSON Linestring geometry
     :rtype: dict
     """
-    points = []
-    index = lat = lng = z = 0
-
-    while index < len(polyline):
-        result = 1
-        shift = 0
-        while True:
-            b = ord(polyline[index]) - 63 - 1
-            index += 1
-            result += b << shift
-            shift += 5
-            if b < 0x1F:
-                break
-        lat += (~result >> 1) if (result & 1) != 0 else (result >> 1)
-
-        result = 1
-        shift = 0
-        while True:
-            b = ord(polyline[index]) - 63 - 1
-            index += 1
-            result += b << shift
-            shift += 5
-            if b < 0x1F:
-                break
-        lng += ~(result >> 1) if (result & 1) != 0 else (result >> 1)
-
-        if is3d:
-            result = 1
-            shift = 0
-            while True:
-                b = ord(polyline[index]) - 63 - 1
-                index += 1
-                result += b << shift
-                shift += 5
-                if b < 0x1F:
-                    break
-            if (result & 1) != 0:
-                z += ~(result >> 1)
-            else:
-                z += result >> 1
-
-            points.append(
-                [
-                    round(lng * 1e-5, 6),
-                    round(lat * 1e-5, 6),
-                    round(z * 1e-2, 1),
-                ]
-            )
-
-        else:
-            points.append([round(lng * 1e-5, 6), round(lat * 1e-5, 6)])
+    points = decode_polyline_array(polyline, is3d).tolist()
 
     geojson = {"type": "LineString", "coordinates": points}
 
     return geojson
 
 
-def get_route(coords):
+def encode_polyline(coordinates, is3d=False):
+    """
+    Encodes coordinates into a Polyline string, the inverse of `decode_polyline`.
+
+    Args:
+        coordinates (array-like): (longitude, latitude) or (longitude, latitude, elevation) rows.
+        is3d (bool, optional): Specifies if the elevation should be encoded. Defaults to False.
+
+    Returns:
+        str: The encoded polyline.
+    """
+    encoded = []
+    previous = (0, 0, 0)
+    for point in coordinates:
+        current = (
+            round(point[1] * 1e5),
+            round(point[0] * 1e5),
+            round(point[2] * 1e2) if is3d else 0,
+        )
+        for value, last in list(zip(current, previous))[: 3 if is3d else 2]:
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                encoded.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            encoded.append(chr(delta + 63))
+        previous = current
+    return "".join(encoded)
+
+
+def get_route(coords, profile="driving-car", refresh=False):
     """
     Retrieves a route between the provided coordinates using the OpenRouteService API and returns the route's geometry and details.
 
     Args:
         coords (list of tuples): A list of coordinate tuples (longitude, latitude) representing the start and end points of the route.
+        profile (str, optional): The routing profile, e.g. "driving-hgv" for heavy goods vehicles. Defaults to "driving-car".
+        refresh (bool, optional): Skips the cached route and caches the new one in its place. Defaults to False.
 
     Returns:
         tuple: A tuple containing:
@@ -103,22 +143,302 @@ def get_route(coords):
         {'distance': 1234.5, 'duration': 567.8}
 
     Notes:
+        - Responses are cached by the route cache configured in the `ROUTE_CACHE` setting, a cache hit skips
+          both the API call and decoding the polyline.
+        - Directions come from the backend configured by the `ROUTING` setting (see `api.routing`). The default
+          backend goes through the shared, pooled session returned by `api.client.get_session`, configured by the
+          `ORS_CLIENT` setting. Record and replay modes write responses to disk and serve them without network.
         - Requires a valid OpenRouteService API token stored in the `token` variable.
         - The `radiuses` parameter is set to 5000 meters, meaning the route will snap to the nearest road within 5 km of the provided coordinates.
-        - The function uses the `driving-car` profile for routing.
+        - Routes use the `driving-car` profile unless the vehicle profile of the request asks for another one.
     """
-    # request from openroutesapi
-    client = openrouteservice.Client(key=token)
-    route = directions(client, coords, profile="driving-car", radiuses=5000)
+    route_cache = get_route_cache()
+    key = route_cache.make_key(coords, profile=profile)
+    cached = None if refresh else route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # request from openroutesapi, or the configured routing backend
+    route = get_routing_backend().directions(coords, profile=profile, radiuses=5000)
 
     # extract line geometry
     encoded_polyline = route["routes"][0]["geometry"]
-    decoded_polyline = decode_polyline(encoded_polyline)
+    line = LineString(decode_polyline_array(encoded_polyline))
+    route_cache.set(key, (line, route))
+    return line, route
 
-    line = LineString(decoded_polyline["coordinates"])
+
+async def get_route_async(coords, profile="driving-car"):
+    """
+    Async variant of `get_route`, the routing service is awaited instead of blocking a worker thread.
+
+    Args:
+        coords (list of tuples): A list of coordinate tuples (longitude, latitude) representing the start and end points of the route.
+        profile (str, optional): The routing profile. Defaults to "driving-car".
+
+    Returns:
+        tuple: The same `(LineString, route)` pair as `get_route`.
+
+    Notes:
+        - Shares the route cache with `get_route`, cache lookups run in a thread since backends may hit the database.
+        - The default backend awaits the pooled `httpx.AsyncClient` returned by `api.client.get_async_client`.
+    """
+    route_cache = get_route_cache()
+    key = route_cache.make_key(coords, profile=profile)
+    cached = await sync_to_async(route_cache.get)(key)
+    if cached is not None:
+        return cached
+
+    route = await get_routing_backend().directions_async(
+        coords, profile=profile, radiuses=5000
+    )
+
+    # extract line geometry
+    encoded_polyline = route["routes"][0]["geometry"]
+    line = LineString(decode_polyline_array(encoded_polyline))
+    await sync_to_async(route_cache.set)(key, (line, route))
     return line, route
 
 
+def corridor_stations(route_line: LineString, max_distance=100000, stations=None):
+    """
+    Locates all fuel stations within `max_distance` of a route in one batched pass.
+
+    Args:
+        route_line (LineString): A Shapely LineString object representing the geometry of the route.
+        max_distance (float, optional): The maximum allowable distance (in meters) between a station and the route.
+                                        Defaults to 100,000 meters (100 km).
+        stations (StationTable, optional): The station table to search. Defaults to the current snapshot.
+
+    Returns:
+        dict of numpy.ndarray: Column arrays of equal length, one entry per station in the corridor:
+            - "index" (int): The row of the station in `stations`.
+            - "offset" (float): The distance between the station and the route (in meters).
+            - "distance" (int): The distance along the route to the station's projected point (in meters).
+            - "lat" (float): The latitude of the station's projected point on the route.
+            - "lng" (float): The longitude of the station's projected point on the route.
+          The columns are sorted by "distance" in ascending order.
+
+    Notes:
+        - Candidates come from the spatial index of `stations`, the distances and projections are then computed in
+          meters for all of them at once with NumPy, see `corridor_stations_many`.
+    """
+    return corridor_stations_many([route_line], max_distance, stations)[0]
+
+
+def densify(coordinates, max_degrees=CORRIDOR_SEGMENT_DEGREES):
+    """
+    Splits the route segments longer than `max_degrees` into equal pieces.
+
+    Args:
+        coordinates (numpy.ndarray): The (longitude, latitude) vertices of the route.
+        max_degrees (float, optional): The longest piece. Defaults to 0.1 degrees.
+
+    Returns:
+        tuple: The (longitude, latitude) vertices of the pieces, and the position of each input vertex among them.
+    """
+    if len(coordinates) < 2:
+        return coordinates, np.arange(len(coordinates))
+
+    delta = np.diff(coordinates, axis=0)
+    pieces = np.maximum(np.ceil(np.hypot(*delta.T) / max_degrees), 1).astype(np.int64)
+    ends = np.cumsum(pieces)
+    segment = np.repeat(np.arange(len(delta)), pieces)
+    fraction = (np.arange(ends[-1]) - np.repeat(ends - pieces, pieces)) / pieces[
+        segment
+    ]
+    dense = coordinates[segment] + fraction[:, None] * delta[segment]
+    return np.vstack([dense, coordinates[-1:]]), np.concatenate(([0], ends))
+
+
+def route_distances(coordinates):
+    """
+    Returns the distance along a route to each of its vertices (in meters), starting at 0.
+
+    Args:
+        coordinates (numpy.ndarray): The (longitude, latitude) vertices of the route.
+
+    Notes:
+        - Segments are measured as the great-circle lengths of their `densify` pieces, the same way
+          the corridor measures the distance along the route to a station.
+    """
+    dense, vertices = densify(coordinates)
+    lengths = haversine(*dense[:-1].T, *dense[1:].T)
+    return np.concatenate(([0.0], np.cumsum(lengths)))[vertices]
+
+
+def corridor_stations_many(route_lines, max_distance=100000, stations=None):
+    """
+    Locates the fuel stations in the corridors of several routes.
+
+    Args:
+        route_lines (list of LineString): The route geometries.
+        max_distance (float, optional): The maximum allowable distance (in meters) between a station and a route.
+                                        Defaults to 100,000 meters (100 km).
+        stations (StationTable, optional): The station table to search. Defaults to the current snapshot.
+
+    Returns:
+        list of dict: One `corridor_stations` result per route, in the order of `route_lines`.
+
+    Notes:
+        - Routes are split into segments and the index is queried with the envelope of each segment, widened by
+          `max_distance` in degrees of longitude at the segment's latitude. The candidate (segment, station) pairs
+          are then measured in meters with NumPy, each in an equirectangular projection centered on the pair, so a
+          degree of longitude counts `cos(latitude)` as much as a degree of latitude. Over corridor distances this
+          is within a fraction of a percent of the great-circle distance, without a GEOS call per pair.
+        - Each station keeps its nearest segment, the distance along the route is the great-circle length of the
+          route up to that segment plus the projected part of the segment.
+        - Segments are processed in blocks of `CORRIDOR_BLOCK_SIZE`, which bounds the memory of the candidate
+          pairs on long routes. The routes share one scratch array of nearest distances per station.
+    """
+    if stations is None:
+        stations = station_data.snapshot()
+    nearest = np.full(len(stations.lng), np.inf)
+    return [
+        _route_corridor(line, max_distance, stations, nearest) for line in route_lines
+    ]
+
+
+def _route_corridor(route_line, max_distance, stations, nearest):
+    # long segments are split, each is measured at the scale of its own latitude
+    coordinates = densify(shapely.get_coordinates(route_line))[0]
+    starts, ends = coordinates[:-1], coordinates[1:]
+    along = route_distances(coordinates)[:-1]
+
+    # a degree of longitude is shortest at the latitude furthest from the equator the corridor reaches,
+    # searching that many degrees in every direction keeps every station within max_distance
+    max_degrees = max_distance / DEG_TO_M
+    max_lat = np.minimum(
+        np.maximum(np.abs(starts[:, 1]), np.abs(ends[:, 1])) + max_degrees, 89.0
+    )
+    search = max_degrees / np.cos(np.radians(max_lat)) * (1 + 1e-9)
+    envelopes = shapely.box(
+        np.minimum(starts[:, 0], ends[:, 0]) - search,
+        np.minimum(starts[:, 1], ends[:, 1]) - search,
+        np.maximum(starts[:, 0], ends[:, 0]) + search,
+        np.maximum(starts[:, 1], ends[:, 1]) + search,
+    )
+
+    parts = []
+    for block in range(0, len(envelopes), CORRIDOR_BLOCK_SIZE):
+        segment, index = stations.index.query(
+            envelopes[block : block + CORRIDOR_BLOCK_SIZE]
+        )
+        segment += block
+
+        # station to segment in a local projection centered on the pair, in meters
+        lng, lat = stations.lng[index], stations.lat[index]
+        (ax, ay), (bx, by) = starts[segment].T, ends[segment].T
+        scale = np.cos(np.radians((lat + (ay + by) / 2) / 2))
+        ux, uy = (ax - lng) * scale, ay - lat
+        vx, vy = (bx - ax) * scale, by - ay
+        length2 = vx * vx + vy * vy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(np.where(length2 > 0, -(ux * vx + uy * vy) / length2, 0), 0, 1)
+        offset = np.hypot(ux + t * vx, uy + t * vy) * DEG_TO_M
+
+        # only the pairs nearest so far are kept, later blocks may still beat them
+        np.minimum.at(nearest, index, offset)
+        keep = (offset <= max_distance) & (offset <= nearest[index])
+        parts.append((segment[keep], index[keep], offset[keep], t[keep]))
+
+    segment, index, offset, t = (
+        np.concatenate([part[i] for part in parts]) if parts else np.empty(0, dtype)
+        for i, dtype in enumerate((np.int64, np.int64, np.float64, np.float64))
+    )
+    nearest_offset = nearest[index]
+    # reset the scratch array for the next route
+    nearest[index] = np.inf
+
+    # the nearest segment of each station, the first one along the route on ties
+    keep = offset <= nearest_offset
+    segment, index, offset, t = segment[keep], index[keep], offset[keep], t[keep]
+    _, first = np.unique(index, return_index=True)
+    segment, index, offset, t = segment[first], index[first], offset[first], t[first]
+
+    projected = starts[segment] + t[:, None] * (ends[segment] - starts[segment])
+    segment_lengths = haversine(*starts[segment].T, *ends[segment].T)
+    distance = (along[segment] + t * segment_lengths).astype(np.int64)
+
+    # by distance along the route, ties keep the station table order
+    order = np.lexsort((index, distance))
+    return {
+        "index": index[order],
+        "offset": offset[order],
+        "distance": distance[order],
+        "lat": projected[order, 1],
+        "lng": projected[order, 0],
+    }
+
+
+def cached_corridor_stations(route_lines, max_distance, stations):
+    """
+    Returns `corridor_stations_many` results through the corridor cache, only the missing corridors are computed.
+
+    Args:
+        route_lines (list of LineString): The route geometries.
+        max_distance (float): The maximum allowable distance (in meters) between a station and a route.
+        stations (StationTable): The station table to search, its `geometry_key` is part of the cache key.
+
+    Returns:
+        list of dict: One `corridor_stations` result per route, in the order of `route_lines`.
+    """
+    cache = get_corridor_cache()
+    keys = [
+        cache.make_key(line, max_distance, stations.geometry_key)
+        for line in route_lines
+    ]
+    corridors = [cache.get(key) for key in keys]
+
+    # routes with the same geometry, e.g. one lane routed for several vehicles, are computed once
+    missing = {}
+    for i, corridor in enumerate(corridors):
+        if corridor is None:
+            missing.setdefault(keys[i], i)
+    if missing:
+        computed = corridor_stations_many(
+            [route_lines[i] for i in missing.values()], max_distance, stations
+        )
+        for key, corridor in zip(missing, computed):
+            cache.set(key, corridor)
+        computed = dict(zip(missing, computed))
+        corridors = [
+            computed[key] if corridor is None else corridor
+            for key, corridor in zip(keys, corridors)
+        ]
+    return corridors
+
+
+def station_rows(corridor, stations):
+    """
+    Turns a `corridor_stations` result into the station dictionaries returned by `find_stations_on_route`.
+
+    `stations` must be the table the corridor was computed on.
+    """
+    prices = stations.price[corridor["index"]]
+    names = stations.names_at(corridor["index"])
+    addresses = stations.addresses_at(corridor["index"])
+
+    return [
+        {
+            "distance": distance,
+            "price": price,
+            "Truckstop_Name": name,
+            "Address": address,
+            "lat": lat,
+            "lng": lng,
+        }
+        for distance, price, name, address, lat, lng in zip(
+            corridor["distance"].tolist(),
+            prices.tolist(),
+            names.tolist(),
+            addresses.tolist(),
+            corridor["lat"].tolist(),
+            corridor["lng"].tolist(),
+        )
+    ]
+
+
 def find_stations_on_route(route_line: LineString, max_distance=100000):
     """
     Finds fuel stations located near a given route and calculates their distance along the route.
@@ -140,15 +460,15 @@ def find_stations_on_route(route_line: LineString, max_distance=100000):
                       The list is sorted by the "distance" key in ascending order.
 
     Notes:
-        - The function assumes the existence of a global `FUEL_STATIONS` DataFrame containing fuel station data.
-        - The `FUEL_STATIONS` DataFrame must have the following columns:
-            - "Geocode": A tuple or list containing the station's longitude and latitude.
-            - "Retail Price": The price of fuel at the station.
-            - "Truckstop Name": The name of the station.
-            - "Address": The address of the station.
-        - The function calculates the geometric distance between the station and the route, projects the station onto the route,
-          and computes the distance along the route to the projected point.
-        - Distances are converted from degrees to meters using Earth's radius (6,371,000 meters).
+        - Fuel station data and its spatial index come from the current snapshot of the global `station_data`
+          manager (`api.stations.StationDataManager`), loaded from the station store or the OPIS CSV.
+        - Only stations returned by the index for the route corridor are examined, the rest of the table is never touched.
+        - Corridors are memoized by route geometry, `max_distance` and station geometry (see `api.cache.CorridorCache`),
+          a repeat lane only joins the current prices onto the cached corridor.
+        - The geometry work is done by `corridor_stations`, which calculates the geometric distance between each station
+          and the route, projects the station onto the route, and computes the distance along the route to the projected point.
+        - Distances are measured in meters on the sphere (6,371,000 meters radius), a degree of longitude is
+          shorter than a degree of latitude away from the equator.
 
     Example:
         >>> route_line = LineString([(8.681495, 49.41461), (8.687872, 49.420318)])
@@ -158,37 +478,38 @@ def find_stations_on_route(route_line: LineString, max_distance=100000):
         "Station A" 1234
         "Station B" 5678
     """
-    # Constants
-    EARTH_RADIUS = 6371000  # Earth's radius in meters
-    DEG_TO_M = (2 * math.pi * EARTH_RADIUS) / 360  # Meters per degree
-
-    stations = []
-    for _, row in FUEL_STATIONS.iterrows():
-        lat = row["Geocode"][1]
-        lng = row["Geocode"][0]
-        station_point = Point(lng, lat)
-        distance = (
-            route_line.distance(station_point) * DEG_TO_M
-        )  # in geometric distance in degrees --> to meters
-        if distance <= max_distance:
-            projected_point = route_line.interpolate(route_line.project(station_point))
-            distance_along = (
-                route_line.project(projected_point) * DEG_TO_M
-            )  # Convert to meters
-            stations.append(
-                {
-                    "distance": int(distance_along),
-                    "price": row["Retail Price"],
-                    "Truckstop_Name": row["Truckstop Name"],
-                    "Address": row["Address"],
-                    "lat": projected_point.y,
-                    "lng": projected_point.x,
-                }
-            )
-    return sorted(stations, key=lambda x: x["distance"])
-
-
-def calculate_optimal_stops(stations, total_distance):
+    # one snapshot for the whole call, a reload in the meantime does not affect it
+    stations = station_data.snapshot()
+    corridor = cached_corridor_stations([route_line], max_distance, stations)[0]
+    return station_rows(corridor, stations)
+
+
+def find_stations_on_routes(route_lines, max_distance=100000):
+    """
+    Finds the fuel stations near each of several routes, sharing one station snapshot and corridor cache lookup.
+
+    Args:
+        route_lines (list of LineString): The route geometries.
+        max_distance (float, optional): The maximum allowable distance (in meters) between a station and a route.
+                                        Defaults to 100,000 meters (100 km).
+
+    Returns:
+        list of list of dict: One `find_stations_on_route` result per route, in the order of `route_lines`.
+    """
+    stations = station_data.snapshot()
+    return [
+        station_rows(corridor, stations)
+        for corridor in cached_corridor_stations(route_lines, max_distance, stations)
+    ]
+
+
+def calculate_optimal_stops(
+    stations,
+    total_distance,
+    tank_range=MAX_DISTANCE,
+    start_fuel=None,
+    mpg=MILES_PER_GALLON,
+):
     """
     Calculates the optimal fuel stops along a route based on fuel price and vehicle range.
 
@@ -198,21 +519,30 @@ def calculate_optimal_stops(stations, total_distance):
             - "price" (float): The retail price of fuel at the station.
             - Other keys (e.g., "Truckstop_Name", "Address", etc.) are ignored in this function.
         total_distance (float): The total distance of the route in meters.
+        tank_range (float, optional): The distance a full tank covers (in meters). Defaults to 804,672 meters (500 miles).
+        start_fuel (float, optional): The fuel in the tank at the start of the trip, expressed as range in meters.
+                                      Defaults to a full tank.
+        mpg (float, optional): The fuel consumption in miles per gallon. Defaults to 10.
 
     Returns:
         tuple: A tuple containing:
             - stops (list of dict): A list of selected fuel stations where the vehicle should stop.
                                     Each dictionary contains the same keys as the input `stations`.
             - total_cost (float): The estimated total cost of fuel for the trip, based on the selected stops.
+                                  The whole trip is priced, starting fuel included: the stretch up to each stop
+                                  at that stop's price, the rest of the trip at the last stop's price.
 
             If no valid stops are found (e.g., no stations within range), returns `(None, None)`.
 
     Notes:
-        - The function assumes a maximum vehicle range of 804,672 meters (500 miles).
-        - The fuel consumption rate is assumed to be 10 miles per gallon (mpg).
+        - The vehicle range, starting fuel and consumption come from the vehicle profile of the request
+          (see `api.vehicles.VehicleProfile`), by default 500 miles at 10 mpg from a full tank.
+        - Stations are sorted by distance, so each window of candidates is a slice found by bisection
+          instead of a scan over all stations.
         - The function iteratively selects the cheapest fuel station within the vehicle's range for each segment of the trip.
         - If the total distance is less than the vehicle's range, no stops are needed, and the function returns an empty list and a cost of 0.0.
         - If no stations are found within the vehicle's range at any point, the function returns `(None, None)`.
+          With an empty tank at the start, only a station at the start of the route is in range.
 
     Example:
         >>> stations = [
@@ -229,49 +559,176 @@ def calculate_optimal_stops(stations, total_distance):
         >>> print(f"Total cost: ${total_cost:.2f}")
         Total cost: $64.50
     """
-    MAX_DISTANCE = 804672  # in meters
+    if start_fuel is None:
+        start_fuel = tank_range
 
     # if the trip is less than range
-    if total_distance <= MAX_DISTANCE:
+    if total_distance <= start_fuel:
         return [], 0.0
 
+    # stations sorted by distance so each window is a slice found by bisection
+    stations = sorted(stations, key=lambda x: x["distance"])
+    distances = [s["distance"] for s in stations]
+
     stops = []
     total_cost = 0.0
     current_position = 0.0
-
-    # loop over the whole trip in 500 mile segmanets
-    while current_position + MAX_DISTANCE < total_distance:
-        # select candidate stations from all the nearby stations
-        candidates = [
-            s
-            for s in stations
-            if current_position < s["distance"] <= current_position + MAX_DISTANCE
+    # the starting fuel reaches the first stop, every stop fills the tank
+    reach = start_fuel
+
+    # loop over the whole trip in tank range segmanets
+    while current_position + reach < total_distance:
+        # select candidate stations from all the nearby stations, a station at the start
+        # is a candidate too so a trip can start on an empty tank
+        if stops:
+            first = bisect.bisect_right(distances, current_position)
+        else:
+            first = bisect.bisect_left(distances, current_position)
+        candidates = stations[
+            first : bisect.bisect_right(distances, current_position + reach)
         ]
 
         # if there is no candidates then return empty stops and cost
         if len(candidates) == 0:
             return None, None  # No stations in range
 
-        # select the cheapest candidate in the next 500 miles
+        # select the cheapest candidate within reach
         cheapest = min(candidates, key=lambda x: x["price"])
 
         # calculate the distance along the line of route to said candidate
         segment_distance = cheapest["distance"] - current_position
-        segment_distance_miles = segment_distance * 0.000621371192
+        segment_distance_miles = segment_distance * METERS_TO_MILES
 
         # calculate how much fuel would it take to travel the segment at the current price
-        total_cost += (segment_distance_miles / 10) * cheapest["price"]
+        total_cost += (segment_distance_miles / mpg) * cheapest["price"]
 
         # append the stop to stops list
         stops.append(cheapest)
 
         # update current position
         current_position = cheapest["distance"]
+        reach = tank_range
 
     # Add cost for remaining distance
     remaining = total_distance - current_position
     if remaining > 0 and stops:
-        remaining_miles = remaining * 0.000621371192
-        total_cost += (remaining_miles / 10) * stops[-1]["price"]
+        remaining_miles = remaining * METERS_TO_MILES
+        total_cost += (remaining_miles / mpg) * stops[-1]["price"]
 
     return stops, total_cost
+
+
+def calculate_min_cost_stops(
+    stations,
+    total_distance,
+    tank_range=MAX_DISTANCE,
+    start_fuel=None,
+    mpg=MILES_PER_GALLON,
+):
+    """
+    Calculates the minimum cost fuel stops along a route, allowing partial fills at each stop.
+
+    Args:
+        stations (list of dict): A list of fuel station dictionaries, where each dictionary contains:
+            - "distance" (int): The distance along the route to the station (in meters).
+            - "price" (float): The retail price of fuel at the station.
+            - Other keys (e.g., "Truckstop_Name", "Address", etc.) are copied to the returned stops.
+        total_distance (float): The total distance of the route in meters.
+        tank_range (float, optional): The distance a full tank covers (in meters). Defaults to 804,672 meters (500 miles).
+        start_fuel (float, optional): The fuel in the tank at the start of the trip, expressed as range in meters.
+                                      Defaults to a full tank.
+        mpg (float, optional): The fuel consumption in miles per gallon. Defaults to 10.
+
+    Returns:
+        tuple: A tuple containing:
+            - stops (list of dict): The stations where fuel is bought, in route order. Each dictionary contains the
+                                    same keys as the input `stations` plus "gallons", the fuel bought at that stop.
+            - total_cost (float): The cost of the fuel bought along the route. Fuel already in the tank is free,
+                                  unlike the whole trip priced by `calculate_optimal_stops`, so the two costs of
+                                  the same stops differ by the starting fuel.
+
+            If the route cannot be completed with the given stations, returns `(None, None)`.
+
+    Notes:
+        - This is the classic gas station algorithm. The tank is kept as a deque of fuel lots sorted by price,
+          at every station the lots pricier than the local price are handed back (never bought) and the tank is
+          topped up at the local price. Driving burns the cheapest lots first, so only the fuel actually burnt
+          is ever paid for, at the cheapest price reachable for it.
+        - Each station enters and leaves the deque at most once, so the run is O(n) after the O(n log n) sort.
+
+    Example:
+        >>> stations = [
+        ...     {"distance": 100000, "price": 3.50, "Truckstop_Name": "Station A", "Address": "123 Main St"},
+        ...     {"distance": 300000, "price": 3.20, "Truckstop_Name": "Station B", "Address": "456 Elm St"},
+        ...     {"distance": 600000, "price": 3.40, "Truckstop_Name": "Station C", "Address": "789 Oak St"},
+        ... ]
+        >>> stops, total_cost = calculate_min_cost_stops(stations, 1000000)
+        >>> for stop in stops:
+        ...     print(stop["Truckstop_Name"], round(stop["gallons"], 2))
+        Station B 12.14
+        >>> print(f"Total cost: ${total_cost:.2f}")
+        Total cost: $38.84
+    """
+    if start_fuel is None:
+        start_fuel = tank_range
+
+    stations = sorted(stations, key=lambda x: x["distance"])
+
+    # fuel lots as [station position or None for the starting fuel, price, range in meters]
+    tank = deque([[None, 0.0, start_fuel]]) if start_fuel > 0 else deque()
+    level = start_fuel
+    burnt = [0.0] * len(stations)
+    current_position = 0.0
+
+    def drive(distance):
+        # burn the cheapest lots first, returns False when the tank runs dry
+        nonlocal level
+        while distance > 0:
+            if not tank:
+                return False
+            lot = tank[0]
+            used = min(lot[2], distance)
+            if lot[0] is not None:
+                burnt[lot[0]] += used
+            lot[2] -= used
+            level -= used
+            distance -= used
+            if lot[2] <= 0:
+                tank.popleft()
+        return True
+
+    for i, station in enumerate(stations):
+        if station["distance"] >= total_distance:
+            break
+        if not drive(station["distance"] - current_position):
+            return None, None  # No stations in range
+        current_position = station["distance"]
+
+        # hand back any fuel that is pricier than here, it is bought here instead
+        while tank and tank[-1][1] > station["price"]:
+            level -= tank.pop()[2]
+
+        # top up at the local price
+        if tank_range - level > 0:
+            tank.append([i, station["price"], tank_range - level])
+            level = tank_range
+
+    if not drive(total_distance - current_position):
+        return None, None  # No stations in range
+
+    stops = []
+    total_cost = 0.0
+    for station, meters in zip(stations, burnt):
+        if meters > 0:
+            gallons = meters * METERS_TO_MILES / mpg
+            total_cost += gallons * station["price"]
+            stops.append({**station, "gallons": gallons})
+
+    return stops, total_cost
+
+
+# optimizer modes selectable per request
+OPTIMIZERS = {
+    "greedy": calculate_optimal_stops,
+    "exact": calculate_min_cost_stops,
+}
@@ -0,0 +1,101 @@
+from django.conf import settings
+
+from .utils import MAX_DISTANCE, METERS_TO_MILES, MILES_PER_GALLON
+
+# routing service profiles a vehicle may route with
+ROUTING_PROFILES = ("driving-car", "driving-hgv")
+
+# the vehicle the optimizers assumed before profiles, 500 miles at 10 MPG from a full tank
+DEFAULT_VEHICLE_PROFILES = {
+    "default": {
+        "routing_profile": "driving-car",
+        "mpg": MILES_PER_GALLON,
+        "tank_gallons": MAX_DISTANCE * METERS_TO_MILES / MILES_PER_GALLON,
+        "range_miles": None,
+        "start_fuel": 1.0,
+    },
+}
+
+
+class VehicleProfile:
+    """
+    The vehicle a route is planned for: how far it goes on a tank, how much fuel it burns and how it is routed.
+
+    Args:
+        routing_profile (str, optional): The routing service profile, e.g. "driving-hgv". Defaults to "driving-car".
+        mpg (float, optional): Fuel consumption in miles per gallon. Defaults to 10.
+        tank_gallons (float, optional): Tank capacity in gallons. Defaults to 50.
+        range_miles (float, optional): The distance driven on a full tank before refueling. Defaults to what the tank
+                                       holds at `mpg`, a shorter range keeps a reserve in the tank.
+        start_fuel (float, optional): The fuel level at the start of the trip, as a fraction of a full tank's range.
+                                      Defaults to 1.0, a full tank.
+
+    Example:
+        >>> vehicle = VehicleProfile(routing_profile="driving-hgv", mpg=6.5, tank_gallons=150)
+        >>> stops, total_cost = calculate_min_cost_stops(stations, total_distance, **vehicle.optimizer_options())
+    """
+
+    def __init__(
+        self,
+        routing_profile="driving-car",
+        mpg=MILES_PER_GALLON,
+        tank_gallons=MAX_DISTANCE * METERS_TO_MILES / MILES_PER_GALLON,
+        range_miles=None,
+        start_fuel=1.0,
+    ):
+        self.routing_profile = routing_profile
+        self.mpg = float(mpg)
+        self.tank_gallons = float(tank_gallons)
+        self.range_miles = (
+            self.tank_gallons * self.mpg if range_miles is None else float(range_miles)
+        )
+        self.start_fuel = float(start_fuel)
+
+    @classmethod
+    def from_settings(cls, name="default"):
+        """
+        Builds a profile configured by the `VEHICLE_PROFILES` setting.
+
+        Raises:
+            KeyError: If no profile has this name.
+        """
+        profiles = {
+            **DEFAULT_VEHICLE_PROFILES,
+            **getattr(settings, "VEHICLE_PROFILES", {}),
+        }
+        return cls(**profiles[name])
+
+    @property
+    def tank_range(self):
+        """
+        The range of a full tank in meters.
+        """
+        return self.range_miles / METERS_TO_MILES
+
+    def as_dict(self):
+        return {
+            "routing_profile": self.routing_profile,
+            "mpg": self.mpg,
+            "tank_gallons": self.tank_gallons,
+            "range_miles": self.range_miles,
+            "start_fuel": self.start_fuel,
+        }
+
+    def optimizer_options(self):
+        """
+        The keyword arguments of the optimizers in `api.utils.OPTIMIZERS` for this vehicle.
+        """
+        return {
+            "tank_range": self.tank_range,
+            "start_fuel": self.start_fuel * self.tank_range,
+            "mpg": self.mpg,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, VehicleProfile) and self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(tuple(self.as_dict().values()))
+
+    def __repr__(self):
+        return f"VehicleProfile({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
@@ -1,15 +1,76 @@
+import asyncio
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from drf_spectacular.utils import OpenApiExample, OpenApiResponse, extend_schema
 from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .coalesce import SingleFlight, get_route_flight
 from .exceptions import RouteException, StationException
+from .lanes import lookup_lane, serve_lane
+from .metrics import StageTimer, render_metrics
+from .pipeline import (
+    batch_records,
+    get_executor,
+    optimize_batch,
+    optimize_stops,
+    plan_route,
+    reprice_routes,
+    response_options,
+    response_records,
+    route_coordinates,
+    save_planned_route,
+    serialize_response,
+)
 from .serializer import (
     ErrorSerializer,
+    RouteBatchResponseSerializer,
+    RouteBatchSerializer,
     RouteOptimizerResponseSerializer,
     RouteOptimizerSerializer,
+    RouteRepriceBatchSerializer,
 )
-from .utils import calculate_optimal_stops, find_stations_on_route, get_route
+from .utils import (
+    find_stations_on_route,
+    get_route,
+    get_route_async,
+    station_data,
+)
+from .workers import get_station_pool
+
+# response shaping options that may also be given as query parameters
+QUERY_OPTIONS = ("include", "simplify", "geometry_format")
+
+
+def with_query_options(data, query_params):
+    """
+    Adds the response shaping options given as query parameters to a request body.
+
+    Options in the body take precedence, e.g. `route/?include=geometry&simplify=50`.
+    """
+    if hasattr(data, "setlist"):
+        # form and multipart bodies keep their repeated values, e.g. several waypoints
+        data = data.copy()
+        for key in QUERY_OPTIONS:
+            if key in query_params and key not in data:
+                data.setlist(key, query_params.getlist(key))
+        return data
+    if not isinstance(data, dict):
+        # left for the serializer to reject
+        return data
+
+    query = {}
+    for key in QUERY_OPTIONS:
+        values = query_params.getlist(key)
+        if values:
+            query[key] = values if len(values) > 1 else values[0]
+    return {**query, **data}
 
 
 class RouteOptimizerView(APIView):
@@ -43,67 +104,372 @@ class RouteOptimizerView(APIView):
                 value={"start": "32.92599,-98.72488", "end": "32.92599,-105.92488"},
                 request_only=True,
             ),
+            OpenApiExample(
+                "Valid Request-minimum cost stops",
+                value={
+                    "start": "32.92599,-98.72488",
+                    "end": "32.92599,-105.92488",
+                    "optimizer": "exact",
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Valid Request-heavy goods vehicle profile",
+                value={
+                    "start": "32.92599,-98.72488",
+                    "end": "32.92599,-105.92488",
+                    "vehicle": {
+                        "routing_profile": "driving-hgv",
+                        "mpg": 6.5,
+                        "tank_gallons": 150,
+                        "start_fuel": 0.25,
+                    },
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Valid Request-multi-drop route through waypoints",
+                value={
+                    "start": "32.92599,-98.72488",
+                    "waypoints": ["32.45,-100.40", "31.85,-102.37"],
+                    "end": "32.92599,-105.92488",
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Valid Request-stops and simplified GeoJSON geometry only",
+                value={
+                    "start": "32.92599,-98.72488",
+                    "end": "32.92599,-105.92488",
+                    "include": ["geometry"],
+                    "simplify": 100,
+                    "geometry_format": "geojson",
+                },
+                request_only=True,
+            ),
         ]
     )
+    def post(self, request):
+        # pipeline: validate -> route -> corridor -> optimize -> serialize
+        self.timer = StageTimer()
+
+        # Input Validation
+        with self.timer.stage("validate"):
+            serializer = RouteOptimizerSerializer(
+                data=with_query_options(request.data, request.query_params)
+            )
+            if not serializer.is_valid():
+                return Response(
+                    {"error": "Invalid input", "details": serializer.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            data = serializer.validated_data
+
+        # NDJSON responses are streamed record by record, see `response_records`
+        stream = request.accepted_renderer.format == "ndjson"
+
+        # identical requests in flight share one computation, a stream is sent to one client only
+        flight = None if stream else get_route_flight()
+        if flight is None:
+            status_code, response_data = self.plan(data, stream)
+        else:
+            key = SingleFlight.make_key(
+                [
+                    [round(value, 5) for value in point]
+                    for point in route_coordinates(data)
+                ],
+                data["optimizer"],
+                data["vehicle"].as_dict(),
+                response_options(data),
+                data["save"],
+            )
+            status_code, response_data = flight.do(key, self.plan, data)
+
+        if stream and status_code == status.HTTP_200_OK:
+            return StreamingHttpResponse(
+                request.accepted_renderer.stream(response_data),
+                content_type=request.accepted_renderer.media_type,
+            )
+        return Response(response_data, status=status_code)
+
+    def plan(self, data, stream=False):
+        """
+        Runs the stages after validation, errors are returned as response bodies so they can be shared
+        with coalesced requests.
+
+        With `stream`, a successful body is returned as the records of `response_records`, only the
+        first one is built here.
+        """
+        # lanes precomputed by `manage.py precompute_lanes` skip routing and optimizing
+        if not data["save"]:
+            with self.timer.stage("lane"):
+                lane = lookup_lane(data)
+            if lane is not None:
+                with self.timer.stage("serialize"):
+                    return serve_lane(lane, response_options(data), stream)
+
+        try:
+            # route finding with openstreatroute
+            with self.timer.stage("route"):
+                try:
+                    line, route = get_route(
+                        route_coordinates(data), data["vehicle"].routing_profile
+                    )
+                except Exception:
+                    raise RouteException()
+
+            corridor = None
+            pool = get_station_pool()
+            if pool is not None:
+                # corridor and optimize in a worker process, off this worker's GIL
+                with self.timer.stage("pool"):
+                    if data["save"]:
+                        stops, total_cost, corridor = pool.plan_stops(
+                            line,
+                            route,
+                            data["optimizer"],
+                            data["vehicle"],
+                            with_corridor=True,
+                        )
+                    else:
+                        stops, total_cost = pool.plan_stops(
+                            line, route, data["optimizer"], data["vehicle"]
+                        )
+            else:
+                # find candidate stations on route
+                with self.timer.stage("corridor"):
+                    try:
+                        stations = find_stations_on_route(line)
+                    except Exception:
+                        raise StationException()
+
+                # calculate optimal stops
+                with self.timer.stage("optimize"):
+                    stops, total_cost = optimize_stops(
+                        stations, route, data["optimizer"], data["vehicle"]
+                    )
+        except APIException as error:
+            return error.status_code, {"detail": str(error.detail)}
+
+        # Build Response, validated in debug and test runs
+        with self.timer.stage("serialize"):
+            if stream:
+                records = response_records(
+                    route, stops, total_cost, line=line, **response_options(data)
+                )
+                status_code, response_data = status.HTTP_200_OK, next(records)
+            else:
+                status_code, response_data = serialize_response(
+                    route, stops, total_cost, line=line, **response_options(data)
+                )
+
+        if data["save"] and status_code == status.HTTP_200_OK:
+            with self.timer.stage("save"):
+                response_data["route_id"] = str(
+                    save_planned_route(
+                        line,
+                        route,
+                        data["optimizer"],
+                        response_options(data),
+                        data["vehicle"],
+                        corridor=corridor,
+                    )
+                )
+
+        if stream:
+            return status_code, itertools.chain([response_data], records)
+        return status_code, response_data
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # error responses carry the timings of the stages that ran
+        timer = getattr(self, "timer", None)
+        if timer is not None and timer.timings:
+            response["Server-Timing"] = timer.server_timing()
+        return response
+
+
+class RouteBatchOptimizerView(APIView):
+    @extend_schema(
+        request=RouteBatchSerializer,
+        responses={
+            200: RouteBatchResponseSerializer,
+            400: OpenApiResponse(description="Bad Request", response=ErrorSerializer),
+        },
+        examples=[
+            OpenApiExample(
+                "Valid Request-batch of lanes",
+                value={
+                    "routes": [
+                        {"start": "32.92599,-99.22488", "end": "32.92599,-100.22488"},
+                        {
+                            "start": "32.92599,-98.72488",
+                            "end": "32.92599,-105.92488",
+                            "optimizer": "exact",
+                        },
+                    ]
+                },
+                request_only=True,
+            ),
+        ],
+    )
+    def post(self, request):
+        # Input Validation, each route is validated on its own in the batch
+        serializer = RouteBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        payloads = serializer.validated_data["routes"]
+        if request.accepted_renderer.format == "ndjson":
+            # one record per item, sent as soon as its lane is computed
+            return StreamingHttpResponse(
+                request.accepted_renderer.stream(batch_records(payloads)),
+                content_type=request.accepted_renderer.media_type,
+            )
+
+        results = optimize_batch(payloads)
+        return Response({"results": results})
+
+
+class RouteRepriceView(APIView):
+    @extend_schema(
+        request=None,
+        responses={
+            200: RouteOptimizerResponseSerializer,
+            404: OpenApiResponse(description="Not Found", response=ErrorSerializer),
+        },
+    )
+    def post(self, request, route_id):
+        # current prices joined onto the stored corridor, no routing or geometry work
+        result = reprice_routes([route_id])[0]
+        return Response(
+            result.get("data", result.get("error")), status=result["status"]
+        )
+
+
+class RouteBatchRepriceView(APIView):
+    @extend_schema(
+        request=RouteRepriceBatchSerializer,
+        responses={
+            200: RouteBatchResponseSerializer,
+            400: OpenApiResponse(description="Bad Request", response=ErrorSerializer),
+        },
+    )
     def post(self, request):
         # Input Validation
-        serializer = RouteOptimizerSerializer(data=request.data)
+        serializer = RouteRepriceBatchSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(
                 {"error": "Invalid input", "details": serializer.errors},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        data = serializer.validated_data
-        start_coord = data["start"]
-        end_address = data["end"]
 
+        results = reprice_routes(serializer.validated_data["route_ids"])
+        return Response({"results": results})
+
+
+class StationReloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(request=None, responses={202: None})
+    def post(self, request):
+        # rebuilt in the background, requests keep using the current stations until the swap
+        station_data.reload()
+        return Response(
+            {"version": station_data.version}, status=status.HTTP_202_ACCEPTED
+        )
+
+
+async def route_optimizer_async(request):
+    """
+    Async variant of `RouteOptimizerView` for ASGI deployments.
+
+    The routing service call is awaited on a pooled async HTTP client and the corridor and optimizer
+    stages run on the `ROUTE_EXECUTOR` pool, so one process can hold many in-flight routes. With the
+    "shared_memory" kind they run on the `api.workers.StationPool` and only the response is built here.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"detail": f'Method "{request.method}" not allowed.'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+
+    # Input Validation
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        body = None
+    serializer = RouteOptimizerSerializer(data=with_query_options(body, request.GET))
+    if not serializer.is_valid():
+        return JsonResponse(
+            {"error": "Invalid input", "details": serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    data = serializer.validated_data
+
+    try:
         # route finding with openstreatroute
         try:
-            line, route = get_route((start_coord, end_address))
+            line, route = await get_route_async(
+                route_coordinates(data), data["vehicle"].routing_profile
+            )
         except Exception:
             raise RouteException()
 
-        try:
-            # find candidate stations on route
-            stations = find_stations_on_route(line)
-
-            # calculate optimal stops
-            stops, total_cost = calculate_optimal_stops(
-                stations, route["routes"][0]["summary"]["distance"]
+        corridor = None
+        pool = get_station_pool()
+        if pool is not None:
+            if data["save"]:
+                stops, total_cost, corridor = await pool.plan_stops_async(
+                    line, route, data["optimizer"], data["vehicle"], with_corridor=True
+                )
+            else:
+                stops, total_cost = await pool.plan_stops_async(
+                    line, route, data["optimizer"], data["vehicle"]
+                )
+            status_code, response_data = serialize_response(
+                route, stops, total_cost, line=line, **response_options(data)
             )
-        except Exception:
-            raise StationException()
+        else:
+            loop = asyncio.get_running_loop()
+            status_code, response_data = await loop.run_in_executor(
+                get_executor(),
+                plan_route,
+                line,
+                route,
+                data["optimizer"],
+                response_options(data),
+                data["vehicle"],
+            )
+    except (RouteException, StationException) as error:
+        return JsonResponse({"detail": error.detail}, status=error.status_code)
 
-        # calculate optimal stops
-        stops, total_cost = calculate_optimal_stops(
-            stations, route["routes"][0]["summary"]["distance"]
+    if data["save"] and status_code == status.HTTP_200_OK:
+        route_id = await sync_to_async(save_planned_route)(
+            line,
+            route,
+            data["optimizer"],
+            response_options(data),
+            data["vehicle"],
+            corridor=corridor,
         )
+        response_data["route_id"] = str(route_id)
+
+    return JsonResponse(response_data, status=status_code)
 
-        if stops is None:
-            # no stations in range error
-            raise StationException()
-
-        # Build Response
-        response_data = {
-            "route": {
-                "summary": route["routes"][0]["summary"],
-                "segments": route["routes"][0]["segments"],
-                "geometry": route["routes"][0]["geometry"],
-            },
-            "stops": stops,
-            "total_cost": total_cost,
-            "total_distance_meters": route["routes"][0]["summary"]["distance"],
-        }
-
-        # Validate Response Format
-        response_serializer = RouteOptimizerResponseSerializer(data=response_data)
-        if not response_serializer.is_valid():
-            return Response(
-                {
-                    "error": "Invalid response format",
-                    "details": response_serializer.errors,
-                },
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
 
-        return Response(response_serializer.validated_data)
+# exempt from CSRF checks like DRF's `APIView`, `csrf_exempt` would wrap the coroutine
+# in a sync function in Django 3.2 and the view would no longer run as async
+route_optimizer_async.csrf_exempt = True
+
+
+def metrics(request):
+    """
+    Route pipeline metrics in the Prometheus text exposition format.
+    """
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
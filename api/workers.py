@@ -0,0 +1,318 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import shapely
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from shapely.geometry import LineString
+
+from .exceptions import StationException
+from .stations import StationTable
+from .utils import OPTIMIZERS, cached_corridor_stations, station_data
+from .vehicles import VehicleProfile
+
+# station columns the workers read from shared memory, names and addresses stay in the serving process
+SHARED_ARRAYS = ("lng", "lat", "price")
+
+
+class SharedStations:
+    """
+    The coordinates and prices of one station table, copied once into shared memory blocks.
+
+    Args:
+        stations (StationTable): The table to share.
+
+    Attributes:
+        descriptor (dict): What a worker needs to attach to the blocks, the block name, shape and dtype
+                           of each array and the table's `geometry_key`. It is the only station data
+                           sent with a task.
+    """
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.blocks = []
+        arrays = {}
+        for name in SHARED_ARRAYS:
+            array = np.ascontiguousarray(getattr(stations, name), dtype=np.float64)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            arrays[name] = (block.name, array.shape, array.dtype.str)
+        self.descriptor = {"geometry_key": stations.geometry_key, "arrays": arrays}
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+# the table a worker process is attached to, with its shared memory blocks
+_attached = None
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def _attach(descriptor):
+    """
+    Returns the station table of `descriptor` in a worker, attaching to its blocks on first use.
+
+    Notes:
+        - A table with the geometry of the previous one reuses its spatial index, so a price-only
+          reload does not rebuild it in every worker.
+    """
+    global _attached
+    if _attached is not None and _attached[0] == descriptor:
+        return _attached[1]
+
+    blocks = {
+        name: shared_memory.SharedMemory(name=block_name)
+        for name, (block_name, _, _) in descriptor["arrays"].items()
+    }
+    arrays = {
+        name: np.ndarray(shape, np.dtype(dtype), buffer=blocks[name].buf)
+        for name, (_, shape, dtype) in descriptor["arrays"].items()
+    }
+    stations = StationTable(
+        ids=None,
+        name_codes=None,
+        names=None,
+        address_codes=None,
+        addresses=None,
+        **arrays,
+    )
+    previous = _attached
+    if previous is not None and previous[1].geometry_key == descriptor["geometry_key"]:
+        stations.share_geometry(previous[1])
+    else:
+        stations.geometry_key = descriptor["geometry_key"]
+    _attached = (descriptor, stations, blocks)
+
+    if previous is not None:
+        # the previous table held the only views of its blocks
+        blocks = previous[2]
+        del previous
+        for block in blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # still viewed, released with its last view instead
+                pass
+    return stations
+
+
+def _plan_stops(
+    descriptor,
+    coordinates,
+    total_distance,
+    optimizer,
+    vehicle,
+    max_distance,
+    with_corridor=False,
+):
+    """
+    Runs the corridor and optimize stages in a worker process.
+
+    Returns:
+        tuple: The stops as station rows with their "row" in the table, the total cost, and the corridor
+               with `with_corridor` (otherwise None). The stops and cost are `(None, None)` when no
+               stations are in range.
+    """
+    stations = _attach(descriptor)
+    corridor = cached_corridor_stations(
+        [LineString(coordinates)], max_distance, stations
+    )[0]
+    rows = [
+        {"row": row, "distance": distance, "price": price, "lat": lat, "lng": lng}
+        for row, distance, price, lat, lng in zip(
+            corridor["index"].tolist(),
+            corridor["distance"].tolist(),
+            stations.price[corridor["index"]].tolist(),
+            corridor["lat"].tolist(),
+            corridor["lng"].tolist(),
+        )
+    ]
+    stops, total_cost = OPTIMIZERS[optimizer](
+        rows, total_distance, **VehicleProfile(**vehicle).optimizer_options()
+    )
+    return stops, total_cost, corridor if with_corridor else None
+
+
+class StationPool:
+    """
+    A process pool for the CPU-bound corridor and optimize stages, with the station table in shared memory.
+
+    Workers attach to the station coordinates and prices through `multiprocessing.shared_memory`, nothing
+    is copied per task: a task carries the route vertices and the optimizer inputs, a result carries the
+    chosen stops. Names and addresses are joined onto the stops in the serving process.
+
+    Args:
+        workers (int): The number of worker processes.
+        stations (callable, optional): Returns the current `StationTable`. Defaults to `station_data.snapshot`.
+
+    Example:
+        >>> pool = StationPool(workers=4)
+        >>> stops, total_cost = pool.plan_stops(line, route, "greedy", vehicle)
+
+    Notes:
+        - The table is shared again when `stations()` returns a new one, after a reload. The previous blocks
+          are kept until the next reload for the tasks still queued on them.
+        - Workers are spawned rather than forked, the serving process runs threads.
+        - Each worker keeps its own corridor cache, see `api.cache.CorridorCache`.
+    """
+
+    def __init__(self, workers, stations=None):
+        self.stations = stations or station_data.snapshot
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._shared = []
+        self._lock = threading.Lock()
+
+    def shared(self):
+        """
+        Returns the `SharedStations` of the current station table, sharing it on first use.
+        """
+        stations = self.stations()
+        with self._lock:
+            if not self._shared or self._shared[-1].stations is not stations:
+                self._shared.append(SharedStations(stations))
+                while len(self._shared) > 2:
+                    self._shared.pop(0).close()
+            return self._shared[-1]
+
+    def submit(
+        self,
+        line,
+        route,
+        optimizer,
+        vehicle=None,
+        max_distance=100000,
+        with_corridor=False,
+    ):
+        """
+        Submits the corridor and optimize stages of a route to the pool, `with_corridor` sends the
+        corridor back with the stops.
+
+        Returns:
+            tuple: The `concurrent.futures.Future` of the worker result and the `SharedStations` it ran on,
+                   for `stops`.
+        """
+        if vehicle is None:
+            vehicle = VehicleProfile.from_settings()
+        shared = self.shared()
+        future = self.pool.submit(
+            _plan_stops,
+            shared.descriptor,
+            shapely.get_coordinates(line),
+            route["routes"][0]["summary"]["distance"],
+            optimizer,
+            vehicle.as_dict(),
+            max_distance,
+            with_corridor,
+        )
+        return future, shared
+
+    @staticmethod
+    def stops(shared, result):
+        """
+        Turns a worker result into the stops and total cost of `api.pipeline.optimize_stops`, followed by
+        the corridor when the task was submitted `with_corridor`.
+
+        Raises:
+            StationException: If no stations are in range.
+        """
+        stops, total_cost, corridor = result
+        if stops is None:
+            raise StationException()
+
+        rows = [stop.pop("row") for stop in stops]
+        names = shared.stations.names_at(rows).tolist()
+        addresses = shared.stations.addresses_at(rows).tolist()
+        for stop, name, address in zip(stops, names, addresses):
+            stop["Truckstop_Name"] = name
+            stop["Address"] = address
+        if corridor is None:
+            return stops, total_cost
+        # its rows are positions in the table the worker ran on, not necessarily the current one
+        corridor["geometry_key"] = shared.stations.geometry_key
+        return stops, total_cost, corridor
+
+    def plan_stops(self, line, route, optimizer, vehicle=None, with_corridor=False):
+        """
+        Runs the corridor and optimize stages in the pool, blocking until the stops are chosen.
+
+        Returns:
+            tuple: The stops and the total cost, like `api.pipeline.optimize_stops`. With `with_corridor`,
+                   followed by the corridor of the route for `api.pipeline.save_planned_route`.
+
+        Raises:
+            StationException: If the stages fail or no stations are in range.
+        """
+        future, shared = self.submit(
+            line, route, optimizer, vehicle, with_corridor=with_corridor
+        )
+        try:
+            result = future.result()
+        except Exception:
+            raise StationException()
+        return self.stops(shared, result)
+
+    async def plan_stops_async(
+        self, line, route, optimizer, vehicle=None, with_corridor=False
+    ):
+        """
+        Async variant of `plan_stops`, the event loop is free while the worker runs.
+        """
+        future, shared = self.submit(
+            line, route, optimizer, vehicle, with_corridor=with_corridor
+        )
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception:
+            raise StationException()
+        return self.stops(shared, result)
+
+    def shutdown(self):
+        self.pool.shutdown()
+        with self._lock:
+            for shared in self._shared:
+                shared.close()
+            self._shared = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_station_pool():
+    """
+    Returns the process-wide `StationPool` when `ROUTE_EXECUTOR["KIND"]` is "shared_memory", otherwise None.
+    """
+    global _pool
+    config = getattr(settings, "ROUTE_EXECUTOR", {})
+    if config.get("KIND") != "shared_memory":
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = StationPool(workers=config.get("WORKERS", 4))
+    return _pool
+
+
+@receiver(setting_changed)
+def _reset_pool_on_setting_changed(setting, **kwargs):
+    global _pool
+    if setting == "ROUTE_EXECUTOR" and _pool is not None:
+        _pool.shutdown()
+        _pool = None
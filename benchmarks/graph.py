@@ -0,0 +1,75 @@
+"""
+Benchmarks the offline graph routing backend on synthetic grid road networks: loading the memory-mapped
+graph, and directions latency for short regional trips and cross-country trips.
+
+Run from the project root:
+    python -m benchmarks.graph --grids 100x150 300x450 1000x1500
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from api.graph import haversine
+from api.routing import GraphRoutingBackend
+
+from .synthetic import synthetic_road_graph
+
+
+def trips(graph, n_trips, min_km, max_km, seed=0):
+    """
+    Picks `n_trips` random node pairs whose great-circle distance is between `min_km` and `max_km`.
+    """
+    rng = random.Random(seed)
+    picked = []
+    while len(picked) < n_trips:
+        a, b = rng.randrange(len(graph)), rng.randrange(len(graph))
+        km = haversine(graph.lng[a], graph.lat[a], graph.lng[b], graph.lat[b]) / 1000
+        if min_km <= km <= max_km:
+            picked.append([(graph.lng[a], graph.lat[a]), (graph.lng[b], graph.lat[b])])
+    return picked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grids", nargs="+", default=["100x150", "300x450"])
+    parser.add_argument("--trips", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'grid':<12}{'nodes':>10}{'load ms':>10}  {'trips':<14}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for grid in args.grids:
+        rows, cols = map(int, grid.split("x"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph")
+            synthetic = synthetic_road_graph(rows, cols)
+            synthetic.save(path)
+
+            backend = GraphRoutingBackend(path=path)
+            start = time.perf_counter()
+            graph = backend.graph
+            load_ms = (time.perf_counter() - start) * 1000
+
+            for label, min_km, max_km in (
+                ("50-300 km", 50, 300),
+                ("1500-3000 km", 1500, 3000),
+            ):
+                latencies = []
+                for coords in trips(graph, args.trips, min_km, max_km):
+                    start = time.perf_counter()
+                    backend.directions(coords, radiuses=5000)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                latencies.sort()
+                p95 = latencies[int(0.95 * (len(latencies) - 1))]
+                print(
+                    f"{grid:<12}{len(graph):>10}{load_ms:>10.0f}  {label:<14}"
+                    f"{statistics.median(latencies):>10.2f}{p95:>10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmarks the greedy and exact refueling optimizers on a synthetic station corridor.
+
+Run from the project root:
+    python -m benchmarks.optimizer --stations 50000
+"""
+
+import argparse
+import random
+import time
+
+from api.utils import calculate_min_cost_stops, calculate_optimal_stops
+
+
+def synthetic_corridor(n_stations, total_distance, seed=0):
+    """
+    Builds `n_stations` stations spread along a route of `total_distance` meters with random prices.
+    """
+    rng = random.Random(seed)
+    return sorted(
+        (
+            {
+                "distance": rng.randint(0, int(total_distance)),
+                "price": round(rng.uniform(2.8, 4.2), 3),
+                "Truckstop_Name": f"Station {i}",
+                "Address": f"Exit {i}",
+            }
+            for i in range(n_stations)
+        ),
+        key=lambda x: x["distance"],
+    )
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=50000)
+    parser.add_argument("--distance", type=float, default=4500000.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stations = synthetic_corridor(args.stations, args.distance)
+    print(f"{args.stations} stations, {args.distance / 1000:.0f} km route")
+    print(f"{'optimizer':<10}{'best ms':>12}{'stops':>8}{'cost $':>12}")
+    for name, func in (
+        ("greedy", calculate_optimal_stops),
+        ("exact", calculate_min_cost_stops),
+    ):
+        seconds, (stops, cost) = timed(
+            func, stations, args.distance, repeat=args.repeat
+        )
+        print(f"{name:<10}{seconds * 1000:>12.2f}{len(stops):>8}{cost:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
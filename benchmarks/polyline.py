@@ -0,0 +1,60 @@
+"""
+Microbenchmark for polyline decoding on synthetic routes of 1k, 10k and 100k points.
+
+Run from the project root:
+    python -m benchmarks.polyline
+"""
+
+import argparse
+import random
+import time
+
+from shapely.geometry import LineString
+
+from api.utils import decode_polyline, decode_polyline_array, encode_polyline
+
+
+def synthetic_polyline(n_points, seed=0):
+    """
+    Encodes a random walk of `n_points` points starting in the continental US.
+    """
+    rng = random.Random(seed)
+    lng, lat = -98.0, 38.0
+    points = []
+    for _ in range(n_points):
+        lng += rng.uniform(-0.01, 0.01)
+        lat += rng.uniform(-0.01, 0.01)
+        points.append((lng, lat))
+    return encode_polyline(points)
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'points':>8}{'geojson ms':>14}{'array ms':>12}{'LineString ms':>16}")
+    for size in args.sizes:
+        polyline = synthetic_polyline(size)
+        geojson = timed(decode_polyline, polyline, repeat=args.repeat)
+        array = timed(decode_polyline_array, polyline, repeat=args.repeat)
+        line = timed(
+            lambda p: LineString(decode_polyline_array(p)), polyline, repeat=args.repeat
+        )
+        print(
+            f"{size:>8}{geojson * 1000:>14.2f}{array * 1000:>12.2f}{line * 1000:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks the throughput of the corridor and optimize stages under concurrent requests, run on threads
+in the serving process against `api.workers.StationPool` with the station table in shared memory.
+
+Every request plans a different synthetic route, so the corridor cache does not answer any of them.
+Throughput only scales with workers up to the number of cores.
+
+Run from the project root:
+    python -m benchmarks.pool --workers 1 2 4 --stations 10000 --requests 64
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+import shapely
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "truck_route.settings")
+django.setup()
+
+from api.pipeline import optimize_stops  # noqa: E402
+from api.utils import corridor_stations, route_distances, station_rows  # noqa: E402
+from api.workers import StationPool  # noqa: E402
+
+from .synthetic import synthetic_line, synthetic_stations  # noqa: E402
+
+
+def requests(n_requests, n_points, seed):
+    for i in range(n_requests):
+        line = synthetic_line(n_points, seed=seed + i)
+        distance = route_distances(shapely.get_coordinates(line))[-1]
+        yield line, {"routes": [{"summary": {"distance": distance}}]}
+
+
+def run(plan, workers, lanes):
+    """
+    Plans every lane on `workers` client threads, returns requests per second.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as clients:
+        for _ in clients.map(lambda lane: plan(*lane), lanes):
+            pass
+    return len(lanes) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--stations", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--points", type=int, default=2000)
+    args = parser.parse_args()
+
+    table = synthetic_stations(args.stations)
+
+    def in_process(line, route):
+        corridor = corridor_stations(line, 100000, table)
+        return optimize_stops(station_rows(corridor, table), route, "exact")
+
+    def in_pool(line, route):
+        return pool.plan_stops(line, route, "exact")
+
+    print(f"{os.cpu_count()} cores, {args.stations} stations")
+    print(f"{'workers':>8}{'threads rps':>14}{'pool rps':>12}")
+    for n, workers in enumerate(args.workers):
+        # fresh routes per run, a cached corridor would measure the cache
+        seed = 1000 * (n + 1)
+        threads_rps = run(
+            in_process, workers, list(requests(args.requests, args.points, seed))
+        )
+
+        pool = StationPool(workers, stations=lambda: table)
+        try:
+            # spawns the workers and attaches them to the table outside the timing
+            run(in_pool, workers, list(requests(workers, args.points, 0)))
+            pool_rps = run(
+                in_pool,
+                workers,
+                list(requests(args.requests, args.points, seed + 500)),
+            )
+        finally:
+            pool.shutdown()
+        print(f"{workers:>8}{threads_rps:>14.1f}{pool_rps:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
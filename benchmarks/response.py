@@ -0,0 +1,105 @@
+"""
+Benchmarks the response path on a synthetic 3,000-step route: serializer validation against the trusted
+response body, and the standard JSON renderer against the orjson renderer.
+
+Run from the project root:
+    python -m benchmarks.response --steps 3000
+"""
+
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "truck_route.settings")
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api.pipeline import build_response_data  # noqa: E402
+from api.renderers import ORJSONRenderer  # noqa: E402
+from api.serializer import RouteOptimizerResponseSerializer  # noqa: E402
+
+
+def synthetic_route(n_steps, steps_per_segment=500):
+    steps = [
+        {
+            "distance": 250.0 + i,
+            "duration": 12.5,
+            "type": i % 14,
+            "instruction": f"Continue onto I-{i % 99}",
+            "name": f"I-{i % 99}",
+            "way_points": [i * 4, i * 4 + 4],
+        }
+        for i in range(n_steps)
+    ]
+    segments = [
+        {
+            "distance": 125000.0,
+            "duration": 6250.0,
+            "steps": steps[i : i + steps_per_segment],
+        }
+        for i in range(0, n_steps, steps_per_segment)
+    ]
+    return {
+        "routes": [
+            {
+                "summary": {"distance": 807311.3, "duration": 30000.0},
+                "segments": segments,
+                "geometry": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+            }
+        ]
+    }
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def validated(route, stops):
+    serializer = RouteOptimizerResponseSerializer(
+        data=build_response_data(route, stops, 150.0)
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    route = synthetic_route(args.steps)
+    stops = [
+        {
+            "distance": 35969,
+            "price": 3.007,
+            "Truckstop_Name": "WOODSHED OF BIG CABIN",
+            "Address": "I-44, EXIT 283 & US-69",
+            "lat": 32.75175,
+            "lng": -98.90258,
+        }
+    ]
+
+    print(f"{args.steps} steps")
+    seconds, body = timed(lambda: validated(route, stops), args.repeat)
+    print(f"{'serializer validation':<28}{seconds * 1000:>10.2f} ms")
+    seconds, body = timed(lambda: build_response_data(route, stops, 150.0), args.repeat)
+    print(f"{'trusted body':<28}{seconds * 1000:>10.2f} ms")
+    for name, renderer in (
+        ("JSONRenderer", JSONRenderer()),
+        ("ORJSONRenderer", ORJSONRenderer()),
+    ):
+        seconds, rendered = timed(lambda: renderer.render(body), args.repeat)
+        print(f"{name:<28}{seconds * 1000:>10.2f} ms  {len(rendered)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks the response shaping modes on a synthetic 3,000-step route with a 20,000-point geometry:
+payload size and build plus render latency of each mode.
+
+Run from the project root:
+    python -m benchmarks.shaping --steps 3000 --points 20000
+"""
+
+import argparse
+import math
+import os
+import random
+
+import django
+import numpy as np
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "truck_route.settings")
+django.setup()
+
+from api.pipeline import build_response_data  # noqa: E402
+from api.renderers import ORJSONRenderer  # noqa: E402
+from api.utils import encode_polyline  # noqa: E402
+
+from .response import synthetic_route, timed  # noqa: E402
+
+MODES = {
+    "full": {},
+    "no steps": {"include": ("segments", "geometry")},
+    "stops only": {"include": ()},
+    "geometry only": {"include": ("geometry",)},
+    "simplified 10 m": {"include": ("geometry",), "simplify": 10},
+    "simplified 100 m": {"include": ("geometry",), "simplify": 100},
+    "geojson": {"include": ("geometry",), "geometry_format": "geojson"},
+    "geojson 100 m": {
+        "include": ("geometry",),
+        "simplify": 100,
+        "geometry_format": "geojson",
+    },
+}
+
+
+def synthetic_geometry(n_points, seed=0):
+    """
+    Encodes a winding road of `n_points` points about 800 km long, with meter-level jitter.
+    """
+    rng = random.Random(seed)
+    points = []
+    for i in range(n_points):
+        t = i / n_points
+        lng = -98.7 - 7.2 * t + rng.uniform(-1e-5, 1e-5)
+        lat = 32.9 + 0.3 * math.sin(t * 40) + rng.uniform(-1e-5, 1e-5)
+        points.append((lng, lat))
+    return encode_polyline(np.array(points))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=3000)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    route = synthetic_route(args.steps)
+    route["routes"][0]["geometry"] = synthetic_geometry(args.points)
+    stops = [
+        {
+            "distance": 35969,
+            "price": 3.007,
+            "Truckstop_Name": "WOODSHED OF BIG CABIN",
+            "Address": "I-44, EXIT 283 & US-69",
+            "lat": 32.75175,
+            "lng": -98.90258,
+        }
+    ]
+    renderer = ORJSONRenderer()
+
+    print(f"{args.steps} steps, {args.points} points")
+    for name, options in MODES.items():
+        seconds, rendered = timed(
+            lambda: renderer.render(
+                build_response_data(route, stops, 150.0, **options)
+            ),
+            args.repeat,
+        )
+        print(f"{name:<20}{seconds * 1000:>10.2f} ms{len(rendered):>12} bytes")
+
+
+if __name__ == "__main__":
+    main()
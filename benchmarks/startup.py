@@ -0,0 +1,72 @@
+"""
+Measures station data startup time, parsing the OPIS CSV against loading the memory-mapped station store.
+
+Run from the project root:
+    python -m benchmarks.startup --stations 100000
+"""
+
+import argparse
+import ast
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from api.stations import StationTable
+
+
+def synthetic_csv(path, n_stations, seed=0):
+    """
+    Writes an OPIS formatted CSV with `n_stations` stations across the continental US.
+    """
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write(
+            ";OPIS Truckstop ID;Truckstop Name;Address;City;State;Rack ID;Retail Price;Geocode\n"
+        )
+        for i in range(n_stations):
+            f.write(
+                f"{i};{i};STATION #{i % 5000};I-{i % 99}, EXIT {i % 400};City;TX;{i % 900};"
+                f"{rng.uniform(2.8, 4.2):.8f};[{rng.uniform(-124, -67):.6f}, {rng.uniform(25, 49):.6f}]\n"
+            )
+
+
+def legacy_load(path):
+    # the pre-store startup path: pandas + a literal_eval per row
+    frame = pd.read_csv(path, delimiter=";")
+    frame = frame.dropna(subset=["Geocode"])
+    frame["Geocode"] = frame["Geocode"].apply(ast.literal_eval)
+    return frame
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "stations.csv")
+        store_path = os.path.join(tmp, "stations")
+        synthetic_csv(csv_path, args.stations)
+        StationTable.from_csv(csv_path).save(store_path)
+
+        print(f"{args.stations} stations")
+        print(f"{'legacy CSV + literal_eval':<32}{timed(legacy_load, csv_path):>8.3f}s")
+        print(
+            f"{'CSV to StationTable':<32}{timed(StationTable.from_csv, csv_path):>8.3f}s"
+        )
+        print(
+            f"{'station store (mmap)':<32}{timed(StationTable.load, store_path):>8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmarks the batch endpoint answering with one buffered JSON body against streaming NDJSON records:
+time to the first result, total time and peak RSS of the serving process.
+
+Lanes are routed by `SyntheticRoutingBackend`, which answers after a random delay like a routing service,
+over a synthetic station table. Each mode runs in a fresh process, so peak RSS is its own.
+
+Run from the project root:
+    python -m benchmarks.streaming --lanes 100 --steps 2000 --latency 0.1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "truck_route.settings")
+django.setup()
+
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from shapely.geometry import LineString  # noqa: E402
+
+from api.routing import BaseRoutingBackend  # noqa: E402
+from api.utils import station_data  # noqa: E402
+
+from .synthetic import CONTINENTAL_US, synthetic_directions, synthetic_stations  # noqa: E402
+
+MODES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+class SyntheticRoutingBackend(BaseRoutingBackend):
+    """
+    Answers every lane with a winding road of `points` points and `steps` steps between its ends,
+    after a random delay of up to twice `latency` seconds.
+    """
+
+    def __init__(self, latency=0.1, steps=500, points=2000, **options):
+        self.latency = latency
+        self.steps = steps
+        self.points = points
+
+    def directions(self, coords, profile="driving-car", **params):
+        rng = random.Random(str(coords))
+        time.sleep(rng.uniform(0, 2 * self.latency))
+        start, end = np.array(coords[0]), np.array(coords[-1])
+        t = np.linspace(0.0, 1.0, self.points)
+        points = start + (end - start) * t[:, None]
+        points[:, 1] += 0.3 * np.sin(t * rng.uniform(20, 60))
+        return synthetic_directions(LineString(points.round(5)), self.steps)
+
+
+def synthetic_lanes(n_lanes, seed=0):
+    """
+    Builds `n_lanes` route requests between random points of the continental US, west to east.
+    """
+    rng = random.Random(seed)
+    min_lng, min_lat, max_lng, max_lat = CONTINENTAL_US
+    lanes = []
+    for _ in range(n_lanes):
+        start = (rng.uniform(min_lat + 3, max_lat - 3), rng.uniform(min_lng, -100))
+        end = (rng.uniform(min_lat + 3, max_lat - 3), rng.uniform(-95, max_lng - 5))
+        lanes.append({"start": "%f,%f" % start, "end": "%f,%f" % end})
+    return lanes
+
+
+def peak_rss_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode, args, store_path, results):
+    """
+    Posts the batch in `mode` and reports the timings and peak RSS, in a process of its own.
+    """
+    setup_test_environment()
+    station_data.configure(store_path, store_path)
+    station_data.snapshot()
+    client = Client()
+    url = reverse("find_optimal_route_batch")
+    routing = {
+        "BACKEND": "benchmarks.streaming.SyntheticRoutingBackend",
+        "MODE": "live",
+        "OPTIONS": {
+            "LATENCY": args.latency,
+            "STEPS": args.steps,
+            "POINTS": args.points,
+        },
+    }
+
+    with override_settings(ROUTING=routing, VALIDATE_RESPONSES=False):
+        # first request imports and warms up outside the measurement
+        client.post(
+            url,
+            {"routes": synthetic_lanes(1, seed=-1)},
+            content_type="application/json",
+        )
+        before = peak_rss_mb()
+
+        start = time.perf_counter()
+        response = client.post(
+            url,
+            {"routes": synthetic_lanes(args.lanes)},
+            content_type="application/json",
+            HTTP_ACCEPT=MODES[mode],
+        )
+        if response.streaming:
+            first = None
+            for chunk in response.streaming_content:
+                if first is None:
+                    first = time.perf_counter() - start
+        else:
+            json.loads(response.content)
+            first = time.perf_counter() - start
+        total = time.perf_counter() - start
+
+    results.put((mode, first, total, peak_rss_mb(), peak_rss_mb() - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lanes", type=int, default=100)
+    parser.add_argument("--stations", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as store_path:
+        synthetic_stations(args.stations).save(store_path)
+
+        print(
+            f"{args.lanes} lanes, {args.steps} steps and {args.points} points per route, "
+            f"{args.stations} stations"
+        )
+        print(
+            f"{'mode':<10}{'first result s':>16}{'total s':>10}"
+            f"{'peak RSS MB':>14}{'growth MB':>12}"
+        )
+        for mode in MODES:
+            results = context.Queue()
+            process = context.Process(
+                target=measure, args=(mode, args, store_path, results)
+            )
+            process.start()
+            mode, first, total, peak, growth = results.get()
+            process.join()
+            print(f"{mode:<10}{first:>16.2f}{total:>10.2f}{peak:>14.0f}{growth:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
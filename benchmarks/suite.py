@@ -0,0 +1,205 @@
+"""
+Benchmarks every CPU stage of the route pipeline on synthetic station tables and routes, and compares
+the timings and peak memory against a stored baseline.
+
+Run from the project root:
+    python -m benchmarks.suite --stations 1000 10000 200000
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --routes recorded.jsonl
+
+The exit status is 1 when a stage regressed against the baseline by more than `--tolerance`.
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "truck_route.settings")
+django.setup()
+
+from shapely.geometry import LineString  # noqa: E402
+from shapely.strtree import STRtree  # noqa: E402
+
+from api.pipeline import build_response_data  # noqa: E402
+from api.utils import (  # noqa: E402
+    calculate_min_cost_stops,
+    calculate_optimal_stops,
+    corridor_stations,
+    decode_polyline_array,
+    station_rows,
+)
+
+from .synthetic import (  # noqa: E402
+    load_directions,
+    synthetic_directions,
+    synthetic_line,
+    synthetic_stations,
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def measure(func, repeat):
+    """
+    Returns the best wall time of `repeat` calls (in ms), the peak traced memory of one more call (in KiB)
+    and its result.
+
+    Notes:
+        - Memory is traced with `tracemalloc`, which sees Python and NumPy allocations but not the ones
+          made inside GEOS.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best * 1000, peak / 1024, result
+
+
+def run_pipeline(stations, routes, repeat):
+    """
+    Runs the pipeline stages over every route, returns the summed timings and the largest peak per stage.
+    """
+    report = {}
+
+    def record(stage, func):
+        ms, peak_kb, result = measure(func, repeat)
+        entry = report.setdefault(stage, {"ms": 0.0, "peak_kb": 0.0})
+        entry["ms"] += ms
+        entry["peak_kb"] = max(entry["peak_kb"], peak_kb)
+        return result
+
+    record("index", lambda: STRtree(stations.points))
+    stations.index  # built once for the stages below
+
+    for route in routes:
+        summary = route["routes"][0]["summary"]
+        coordinates = record(
+            "decode", lambda: decode_polyline_array(route["routes"][0]["geometry"])
+        )
+        line = LineString(coordinates)
+        corridor = record("corridor", lambda: corridor_stations(line, 100000, stations))
+        rows = record("rows", lambda: station_rows(corridor, stations))
+        record("greedy", lambda: calculate_optimal_stops(rows, summary["distance"]))
+        stops, total_cost = record(
+            "exact", lambda: calculate_min_cost_stops(rows, summary["distance"])
+        )
+        record(
+            "serialize",
+            lambda: build_response_data(route, stops or [], total_cost or 0.0),
+        )
+
+    return {
+        stage: {name: round(value, 3) for name, value in entry.items()}
+        for stage, entry in report.items()
+    }
+
+
+def compare(report, baseline, tolerance, min_ms, min_kb):
+    """
+    Lists the stages slower or larger than the baseline by more than `tolerance` (a fraction),
+    differences under `min_ms` and `min_kb` are treated as noise.
+    """
+    regressions = []
+    for tables, stages in report.items():
+        for stage, entry in stages.items():
+            base = baseline.get(tables, {}).get(stage)
+            if base is None:
+                continue
+            for name, floor in (("ms", min_ms), ("peak_kb", min_kb)):
+                if (
+                    entry[name] > base[name] * (1 + tolerance)
+                    and entry[name] - base[name] > floor
+                ):
+                    regressions.append(
+                        f"{tables} {stage} {name}: {base[name]:.2f} -> {entry[name]:.2f}"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--stations", type=int, nargs="+", default=[1000, 10000, 200000]
+    )
+    parser.add_argument("--routes", help="recorded directions responses, JSON lines")
+    parser.add_argument("--synthetic-routes", type=int, default=3)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    parser.add_argument("--min-kb", type=float, default=256.0)
+    args = parser.parse_args()
+
+    if args.routes:
+        routes = load_directions(args.routes)
+    else:
+        routes = [
+            synthetic_directions(synthetic_line(args.points, seed=seed))
+            for seed in range(args.synthetic_routes)
+        ]
+
+    report = {}
+    print(f"{len(routes)} routes")
+    print(f"{'stations':>10}  {'stage':<10}{'ms':>12}{'peak KiB':>12}")
+    for n_stations in args.stations:
+        stations = synthetic_stations(n_stations)
+        report[f"stations={n_stations}"] = stages = run_pipeline(
+            stations, routes, args.repeat
+        )
+        for stage, entry in stages.items():
+            print(
+                f"{n_stations:>10}  {stage:<10}{entry['ms']:>12.2f}{entry['peak_kb']:>12.1f}"
+            )
+
+    # timings are only comparable for the same routes
+    config = {
+        "routes": args.routes or f"{args.synthetic_routes} synthetic",
+        "points": None if args.routes else args.points,
+        "repeat": args.repeat,
+    }
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {"config": config, "results": report}, f, indent=2, sort_keys=True
+            )
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline, run with --save-baseline to store one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"baseline was recorded with {baseline['config']}, not compared")
+        return
+    regressions = compare(
+        report, baseline["results"], args.tolerance, args.min_ms, args.min_kb
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        raise SystemExit(1)
+    print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
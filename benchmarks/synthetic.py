@@ -0,0 +1,139 @@
+"""
+Synthetic station tables and routes for the benchmarks, all generated from a seed so runs are comparable.
+"""
+
+import json
+
+import numpy as np
+from shapely.geometry import LineString
+
+from api.graph import RoadGraph, haversine
+from api.stations import StationTable
+from api.utils import DEG_TO_M, encode_polyline
+
+# continental US, (min lng, min lat, max lng, max lat)
+CONTINENTAL_US = (-124.0, 25.0, -67.0, 49.0)
+
+
+def synthetic_stations(n_stations, seed=0):
+    """
+    Builds a `StationTable` of `n_stations` stations spread uniformly over the continental US.
+    """
+    rng = np.random.default_rng(seed)
+    min_lng, min_lat, max_lng, max_lat = CONTINENTAL_US
+    names = np.array([f"STATION #{i}" for i in range(min(n_stations, 5000))])
+    addresses = np.array([f"I-{i % 99}, EXIT {i}" for i in range(400)])
+    return StationTable(
+        ids=np.arange(n_stations, dtype=np.int64),
+        lng=rng.uniform(min_lng, max_lng, n_stations),
+        lat=rng.uniform(min_lat, max_lat, n_stations),
+        price=rng.uniform(2.8, 4.2, n_stations).round(3),
+        name_codes=(np.arange(n_stations) % len(names)).astype(np.int32),
+        names=names,
+        address_codes=rng.integers(0, len(addresses), n_stations, dtype=np.int32),
+        addresses=addresses,
+    )
+
+
+def synthetic_line(n_points, seed=0):
+    """
+    Builds a winding route of `n_points` points between two random points of the continental US,
+    at least 20 degrees of longitude apart.
+    """
+    rng = np.random.default_rng(seed)
+    min_lng, min_lat, max_lng, max_lat = CONTINENTAL_US
+    start = (rng.uniform(min_lng, min_lng + 15), rng.uniform(min_lat + 3, max_lat - 3))
+    end = (
+        rng.uniform(max_lng - 25, max_lng - 5),
+        rng.uniform(min_lat + 3, max_lat - 3),
+    )
+
+    t = np.linspace(0.0, 1.0, n_points)
+    lng = start[0] + (end[0] - start[0]) * t
+    lat = start[1] + (end[1] - start[1]) * t + 0.5 * np.sin(t * rng.uniform(20, 60))
+    # rounded like a decoded polyline
+    return LineString(np.column_stack([lng, lat]).round(5))
+
+
+def synthetic_directions(line, n_steps=500):
+    """
+    Wraps a route geometry in an OpenRouteService directions response with `n_steps` steps.
+    """
+    distance = line.length * DEG_TO_M
+    duration = distance / 25.0
+    n_points = len(line.coords)
+    steps = [
+        {
+            "distance": distance / n_steps,
+            "duration": duration / n_steps,
+            "type": i % 14,
+            "instruction": f"Continue onto I-{i % 99}",
+            "name": f"I-{i % 99}",
+            "way_points": [i * n_points // n_steps, (i + 1) * n_points // n_steps],
+        }
+        for i in range(n_steps)
+    ]
+    return {
+        "routes": [
+            {
+                "summary": {"distance": distance, "duration": duration},
+                "segments": [
+                    {"distance": distance, "duration": duration, "steps": steps}
+                ],
+                "geometry": encode_polyline(line.coords),
+            }
+        ]
+    }
+
+
+def synthetic_road_graph(rows, cols, seed=0, highway_every=10):
+    """
+    Builds a jittered `rows` x `cols` grid road network over the continental US, both directions per road.
+
+    Every `highway_every`-th row and column is a highway at 30 m/s, the other roads are local at 15 m/s.
+    """
+    rng = np.random.default_rng(seed)
+    min_lng, min_lat, max_lng, max_lat = CONTINENTAL_US
+    lng, lat = np.meshgrid(
+        np.linspace(min_lng, max_lng, cols), np.linspace(min_lat, max_lat, rows)
+    )
+    step = min((max_lng - min_lng) / cols, (max_lat - min_lat) / rows)
+    lng = (lng + rng.uniform(-0.3, 0.3, lng.shape) * step).ravel()
+    lat = (lat + rng.uniform(-0.3, 0.3, lat.shape) * step).ravel()
+
+    node = np.arange(rows * cols).reshape(rows, cols)
+    row = np.repeat(np.arange(rows), cols).reshape(rows, cols)
+    col = np.tile(np.arange(cols), rows).reshape(rows, cols)
+    # east-west roads along the rows, north-south roads along the columns
+    source = np.concatenate([node[:, :-1].ravel(), node[:-1, :].ravel()])
+    target = np.concatenate([node[:, 1:].ravel(), node[1:, :].ravel()])
+    road = np.concatenate([row[:, :-1].ravel(), col[:-1, :].ravel()])
+    kind = np.concatenate([np.zeros(rows * (cols - 1)), np.ones((rows - 1) * cols)])
+
+    highway = road % highway_every == 0
+    names = np.where(
+        highway,
+        np.where(kind == 0, "I-", "US-"),
+        "Local Rd ",
+    ).astype(object) + road.astype(str)
+    length = haversine(lng[source], lat[source], lng[target], lat[target])
+    length *= rng.uniform(1.0, 1.2, len(length))
+    duration = length / np.where(highway, 30.0, 15.0)
+
+    return RoadGraph.from_edges(
+        lng,
+        lat,
+        np.concatenate([source, target]),
+        np.concatenate([target, source]),
+        np.concatenate([length, length]),
+        np.concatenate([duration, duration]),
+        np.concatenate([names, names]).astype(str),
+    )
+
+
+def load_directions(path):
+    """
+    Reads recorded directions responses, one JSON document per line.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
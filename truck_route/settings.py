@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -130,11 +131,145 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "api.renderers.NDJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# Route responses are checked against RouteOptimizerResponseSerializer only in debug
+# and test runs, in production the trusted response body is returned as built.
+VALIDATE_RESPONSES = DEBUG
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Fuel Route Optimizer API",
     "DESCRIPTION": "API for finding optimal fuel stops along a route",
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
 }
+
+# Route cache
+# Routing service responses are cached by start/end coordinates rounded to PRECISION
+# decimal places. BACKEND is one of api.cache.LocMemRouteCache (in-process LRU),
+# api.cache.DatabaseRouteCache (the default database) or api.cache.DjangoRouteCache
+# (one of CACHES, selected with OPTIONS {"ALIAS": ...}, which it can share: clearing the
+# route cache leaves the other entries of the alias).
+
+ROUTE_CACHE = {
+    "BACKEND": "api.cache.LocMemRouteCache",
+    "PRECISION": 5,
+    "TIMEOUT": 60 * 60 * 24,
+    "MAX_ENTRIES": 1000,
+    "OPTIONS": {},
+}
+
+# Corridor cache
+# Stations found along a route are kept in an in-process LRU of MAX_ENTRIES corridors,
+# keyed by the route geometry, corridor width and station locations. Price-only reloads
+# keep the cached corridors.
+
+CORRIDOR_CACHE = {
+    "MAX_ENTRIES": 1000,
+}
+
+# OpenRouteService client
+# One pooled HTTP session is shared by every routing request. BASE_URL can point to a
+# self-hosted ORS instance, 429 and 5xx responses are retried RETRIES times with
+# exponential backoff.
+
+ORS_CLIENT = {
+    "BASE_URL": "https://api.openrouteservice.org",
+    "TIMEOUT": 30,
+    "POOL_SIZE": 10,
+    "RETRIES": 3,
+    "BACKOFF_FACTOR": 0.5,
+}
+
+# Routing backend
+# Where get_route gets directions from. MODE is "live", "record" (live, and every response
+# is written to FIXTURE_DIR) or "replay" (served from FIXTURE_DIR without network), set it
+# with the ROUTING_MODE environment variable for load tests. BACKEND
+# api.routing.GraphRoutingBackend routes in-process over the road graph built by
+# `manage.py build_road_graph`, with OPTIONS {"PATH": ...}.
+
+ROUTING = {
+    "BACKEND": "api.routing.ORSRoutingBackend",
+    "MODE": os.getenv("ROUTING_MODE", "live"),
+    "FIXTURE_DIR": "./api/fixtures/routes",
+    "OPTIONS": {},
+}
+
+# Route request coalescing
+# Identical route requests in flight at the same time run the pipeline once and share the
+# response. Within a process this needs nothing else, CACHE names a shared entry of CACHES
+# (Redis, Memcached) to also coalesce across worker processes.
+
+ROUTE_COALESCING = {
+    "ENABLED": True,
+    "CACHE": None,
+    "TIMEOUT": 30,
+    "RESULT_TIMEOUT": 10,
+    "POLL_INTERVAL": 0.05,
+}
+
+# Vehicle profiles
+# Named vehicles a request can select with "vehicle": "<name>", in the format of the request's
+# vehicle object. "default" is used when a request names none, and fills the fields missing
+# from a vehicle object.
+
+VEHICLE_PROFILES = {
+    "default": {
+        "routing_profile": "driving-car",
+        "mpg": 10,
+        "tank_gallons": 50,
+        "start_fuel": 1.0,
+    },
+    "hgv-sleeper": {
+        "routing_profile": "driving-hgv",
+        "mpg": 6.5,
+        "tank_gallons": 200,
+        "range_miles": 1200,
+        "start_fuel": 1.0,
+    },
+}
+
+# Batch route endpoint
+# Largest accepted batch, and the number of routes fetched concurrently per batch.
+
+ROUTE_BATCH = {
+    "MAX_SIZE": 5000,
+    "WORKERS": 8,
+}
+
+# Async route endpoint
+# Pool the CPU-bound corridor and optimizer stages run on, KIND is "thread" or "process".
+# KIND "shared_memory" runs them on a pool of WORKERS processes attached to the station
+# arrays in shared memory, for the sync route endpoint as well.
+
+ROUTE_EXECUTOR = {
+    "KIND": "thread",
+    "WORKERS": 4,
+}
+
+# Precomputed lanes
+# Lanes optimized in bulk by `manage.py precompute_lanes` are answered from the database by the
+# route endpoint. ROUTE_TIMEOUT (seconds) is how long the job reuses a lane's route before routing
+# it again, WORKERS the number of routes it fetches concurrently.
+
+PRECOMPUTED_LANES = {
+    "ENABLED": True,
+    "ROUTE_TIMEOUT": 60 * 60 * 24 * 7,
+    "WORKERS": 8,
+}
+
+# Station data
+# Loaded from the station store built by `manage.py build_station_store` when it exists,
+# otherwise from the OPIS CSV. With WATCH_INTERVAL set (seconds), the data file is polled
+# and reloaded in the background when it changes.
+
+STATION_DATA = {
+    "STORE_PATH": "./api/data/stations",
+    "CSV_PATH": "./api/data/test.csv",
+    "WATCH_INTERVAL": None,
+}